@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+
+"""Benchmark of the garbage collection policies, converting synthetic records with each policy.
+
+    python benchmarks/bench_gc_policy.py [RECORDS] [PROFILES]
+
+Each policy is run in a separate process, so that the peak memory of each can be compared.
+'previous' is the behaviour before garbage collection policies were added:
+automatic collection disabled, and gc.collect() called twice for every record,
+once at the end of convert_record() and once after the output was written.
+"""
+
+# Import required modules
+import gc
+import os
+import subprocess
+import sys
+import time
+
+import bench_setup
+from marc2rf.main import *
+from marc_samples import make_converter, sample_records
+
+__author__ = 'Victoria Morris'
+__license__ = 'MIT License'
+__version__ = '1.0.0'
+__status__ = '4 - Beta Development'
+
+POLICIES = ['previous', 'records:1', 'records:100', 'records:1000', 'memory:50', 'memory:200', 'auto']
+
+
+def run(policy, count, profile):
+    """Function to convert count records with a policy, returning the seconds taken and peak memory use."""
+    records = sample_records(count)
+    converter = make_converter(profile)
+    previous = policy == 'previous'
+    garbage_collector = GarbageCollector('records:1' if previous else policy)
+    garbage_collector.start()
+    start = time.time()
+    for marc in records:
+        output = converter.convert_record(Record(marc))
+        if previous: gc.collect()
+        converter.recycle_output(output)
+        garbage_collector.record_done()
+    seconds = time.time() - start
+    garbage_collector.stop()
+    peak = get_memory_usage()
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+    except ImportError: pass
+    return seconds, peak
+
+
+def main(count=3000, profiles='B,N'):
+    profiles = profiles.upper().split(',')
+    print('{} synthetic records; seconds and peak memory'.format(str(count)))
+    print('{:<16}'.format('Policy') + ''.join('{:>20}'.format(profile) for profile in profiles))
+    for policy in POLICIES:
+        line = '{:<16}'.format(policy)
+        for profile in profiles:
+            result = subprocess.run([sys.executable, os.path.abspath(__file__), '--run', policy, str(count), profile],
+                                    stdout=subprocess.PIPE, universal_newlines=True, check=True)
+            seconds, peak = result.stdout.split()
+            line += '{:>20}'.format('{:.1f}s {}'.format(float(seconds), format_bytes(int(peak))))
+        print(line)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--run']:
+        print('{} {}'.format(*run(sys.argv[2], int(sys.argv[3]), sys.argv[4])))
+    else: main(*([int(arg) for arg in sys.argv[1:2]] + sys.argv[2:3]))
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+
+"""Benchmark of sharing one instance of each MultiRegex class per process with shared(),
+compared with building a new instance for every string, as the cleaning functions did before.
+
+    python benchmarks/bench_multiregex_shared.py [STRINGS] [REPEAT]
+
+The strings are the subfields of synthetic records. The regex module keeps its own cache of compiled regexes,
+so after the first instance of a class, building another does not compile the regex again,
+but still builds the table of replacements and any prefilter or partitions.
+The time to build the first instance, with an empty cache, is shown separately.
+"""
+
+# Import required modules
+import sys
+import time
+import timeit
+
+import bench_setup
+import marc2rf.multiregex as mrx
+import marc2rf.publisher as publisher
+import regex as re
+from marc2rf.marc_data import *
+from marc_samples import sample_records
+
+__author__ = 'Victoria Morris'
+__license__ = 'MIT License'
+__version__ = '1.0.0'
+__status__ = '4 - Beta Development'
+
+CLASSES = [mrx.Abbreviations, mrx.Genres, mrx.PlaceNamesUK, mrx.PlaceNamesUS, mrx.PlaceNamesAustralia,
+           mrx.PlaceNamesBrazil, mrx.PlaceNamesCanada, mrx.PlaceNamesNewZealand, mrx.PlaceNamesOther,
+           mrx.PlaceNamesAccents, mrx.Relators, publisher.Publishers]
+
+
+def sample_strings(count):
+    """Function to get count strings from the subfields of the synthetic records."""
+    strings = []
+    for marc in sample_records(count):
+        for field in Record(marc).fields:
+            if not field.is_control_field(): strings.extend(value for code, value in field)
+        if len(strings) >= count: break
+    return strings[:count]
+
+
+def per_call(cls, strings):
+    def run():
+        for s in strings: cls().sub(s)
+    return run
+
+
+def shared(cls, strings):
+    def run():
+        for s in strings: cls.shared().sub(s)
+    return run
+
+
+def best_of(function, count, repeat):
+    """Function to get the best time in microseconds for each of count strings."""
+    return min(timeit.repeat(function, number=1, repeat=repeat)) / count * 1000000
+
+
+def main(count=200, repeat=3):
+    strings = sample_strings(count)
+    print('{} strings; microseconds per string, and milliseconds to build the first instance'.format(len(strings)))
+    print('{:<24}{:>14}{:>14}{:>14}{:>10}'.format('Class', 'first build', 'per call', 'shared()', 'speedup'))
+    for cls in CLASSES:
+        re.purge()
+        start = time.time()
+        cls()
+        first = (time.time() - start) * 1000
+        before = best_of(per_call(cls, strings), len(strings), repeat)
+        after = best_of(shared(cls, strings), len(strings), repeat)
+        print('{:<24}{:>12.1f}ms{:>12.1f}us{:>12.1f}us{:>9.0f}x'.format(cls.__name__, first, before, after,
+                                                                        before / after))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
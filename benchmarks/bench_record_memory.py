@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+
+"""Benchmark of the memory used by each Record, compared with the representation used before Field and Record
+were slotted and decoded lazily.
+
+    python benchmarks/bench_record_memory.py [RECORDS]
+
+The bytes of the records are allocated before measuring starts, so only the memory used by the Record objects
+themselves is counted.
+"""
+
+# Import required modules
+import sys
+import tracemalloc
+
+import bench_setup
+from marc2rf.marc_data import *
+from marc_samples import sample_records
+
+__author__ = 'Victoria Morris'
+__license__ = 'MIT License'
+__version__ = '1.0.0'
+__status__ = '4 - Beta Development'
+
+
+class BaselineRecord(object):
+    """Record as it was represented before: every field decoded up front into a list of Fields with a __dict__."""
+
+    def __init__(self, marc):
+        self.leader = marc[0:LEADER_LEN].decode('ascii')
+        self.fields = list()
+        self.pos = 0
+        base_address = int(marc[12:17])
+        directory = marc[LEADER_LEN:base_address - 1].decode('ascii')
+        for entry_start in range(0, len(directory), DIRECTORY_ENTRY_LEN):
+            entry = directory[entry_start:entry_start + DIRECTORY_ENTRY_LEN]
+            entry_tag, entry_length, entry_offset = entry[0:3], int(entry[3:7]), int(entry[7:12])
+            entry_data = marc[base_address + entry_offset:base_address + entry_offset + entry_length - 1]
+            if entry_tag < '010' and entry_tag.isdigit():
+                self.fields.append(BaselineField(entry_tag, data=entry_data.decode('utf-8')))
+                continue
+            subs = entry_data.split(SUBFIELD_INDICATOR.encode('ascii'))
+            subs[0] = subs[0].decode('ascii') + '  '
+            subfields = list()
+            for subfield in subs[1:]:
+                if len(subfield) == 0: continue
+                subfields.append(subfield[0:1].decode('ascii'))
+                subfields.append(subfield[1:].decode('utf-8'))
+            self.fields.append(BaselineField(entry_tag, [subs[0][0], subs[0][1]], subfields))
+
+
+class BaselineField(object):
+    """Field as it was represented before: a __dict__ with lists of indicators and subfields."""
+
+    def __init__(self, tag, indicators=None, subfields=None, data=''):
+        self.tag = '%03s' % tag
+        if self.tag < '010' and self.tag.isdigit(): self.data = str(data)
+        else:
+            self.indicator1, self.indicator2 = self.indicators = [str(x) for x in indicators]
+            self.subfields = subfields
+
+
+def measure(records, build):
+    """Function to get the number of bytes allocated per record by build(), and still held afterwards."""
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    held = [build(marc) for marc in records]
+    used = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    del held
+    return used / len(records)
+
+
+def decode_all(marc):
+    record = Record(marc)
+    record.fields
+    return record
+
+
+def baseline_fields(marc):
+    return BaselineRecord(marc).fields
+
+
+def slotted_fields(marc):
+    return [Field(f.tag, data=f.data) if hasattr(f, 'data') else Field(f.tag, f.indicators, f.subfields)
+            for f in BaselineRecord(marc).fields]
+
+
+def main(count=1000):
+    records = sample_records(count)
+    print('{} synthetic records, {:.0f} bytes each on average'.format(
+        count, sum(len(marc) for marc in records) / count))
+    baseline = measure(records, BaselineRecord)
+    print('{:<32}{:>10}{:>12}'.format('Representation', 'Bytes', 'Saving'))
+    print('{:<32}{:>10.0f}{:>12}'.format('baseline (decoded up front)', baseline, ''))
+    for name, build in [('Record, fields not decoded', Record), ('Record, all fields decoded', decode_all)]:
+        used = measure(records, build)
+        print('{:<32}{:>10.0f}{:>11.0%}'.format(name, used, 1 - used / baseline))
+    # The Fields alone, without the index of fields by tag which Record keeps to speed up get_fields()
+    baseline = measure(records, baseline_fields)
+    print('{:<32}{:>10.0f}{:>12}'.format('baseline Fields only', baseline, ''))
+    used = measure(records, slotted_fields)
+    print('{:<32}{:>10.0f}{:>11.0%}'.format('slotted Fields only', used, 1 - used / baseline))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+
+"""Benchmark of the cost of the container for the output from each record:
+building an Output for every record, as convert_record() did before, compared with
+taking a RecordOutput from Converter.new_output() and returning it with recycle_output().
+
+    python benchmarks/bench_record_output.py [REPEAT]
+
+For comparison, the time to convert one synthetic record with each profile is also shown.
+"""
+
+# Import required modules
+import copy
+import sys
+import timeit
+
+import bench_setup
+from marc2rf.main import *
+from marc_samples import make_converter, sample_records
+
+__author__ = 'Victoria Morris'
+__license__ = 'MIT License'
+__version__ = '1.0.0'
+__status__ = '4 - Beta Development'
+
+# Number of MARC fields found in the records for profile M
+M_FIELDS = 120
+
+
+def baseline_output(profile, fields_present):
+    """Function to build the output container for a record as convert_record() did before."""
+    def build():
+        output = Output(profile)
+        if profile == 'M':
+            output.values = copy.deepcopy(fields_present)
+            for v in output.values:
+                output.values[v] = set()
+        return output
+    return build
+
+
+def recycled_output(converter):
+    def build():
+        converter.recycle_output(converter.new_output())
+    return build
+
+
+def best_of(function, number, repeat):
+    """Function to get the best time in microseconds for a single call of function."""
+    return min(timeit.repeat(function, number=number, repeat=repeat)) / number * 1000000
+
+
+def main(repeat=5):
+    fields_present = {tag: [] for tag in sorted(marc_fields)[:M_FIELDS]}
+    record = Record(sample_records(1)[0])
+    print('{:<10}{:>14}{:>14}{:>16}'.format('Profile', 'Output()', 'recycled', 'convert_record'))
+    for profile in ['D', 'B', 'E', 'F', 'M', 'N']:
+        converter = make_converter(profile)
+        before = best_of(baseline_output(profile, fields_present), 2000, repeat)
+        after = best_of(recycled_output(converter), 2000, repeat)
+        converted = best_of(lambda: converter.recycle_output(converter.convert_record(record)), 200, repeat)
+        print('{:<10}{:>12.1f}us{:>12.1f}us{:>14.1f}us'.format(profile, before, after, converted))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,19 @@
+# -*- coding: utf8 -*-
+
+"""Setup for the benchmarks, imported by each of them before marc2rf:
+puts the repository and the tests folder on the path, so that marc2rf and the synthetic records and Converters
+of tests/marc_samples.py can be imported when a benchmark is run from a checkout."""
+
+# Import required modules
+import os
+import sys
+
+__author__ = 'Victoria Morris'
+__license__ = 'MIT License'
+__version__ = '1.0.0'
+__status__ = '4 - Beta Development'
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+for path in [ROOT, os.path.join(ROOT, 'tests')]:
+    if path not in sys.path: sys.path.insert(0, path)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+
+"""Script to build an index of the records in a file of MARC records"""
+
+# Import required modules
+import getopt
+from marc2rf import *
+
+__author__ = 'Victoria Morris'
+__license__ = 'MIT License'
+__version__ = '1.0.0'
+__status__ = '4 - Beta Development'
+
+
+def usage():
+    """Function to print information about the script"""
+    print('========================================')
+    print('index_marc')
+    print('Index a file of MARC records')
+    print('========================================')
+    print('This utility writes an index of the byte offsets of the records in a file of MARC records')
+    print('to MARC_PATH.idx, so that records can be located by position or by 001')
+    print('Correct syntax is:')
+    print('index_marc -i MARC_PATH [OPTIONS]\n')
+    print('\nIndex MARC_PATH.')
+    print('    -i    Path to file of MARC records')
+    print('\nUse quotation marks (") around arguments which contain spaces')
+    print('\nOptions:')
+    print('    --debug  Debug mode.')
+    print('    --help   Show this message and exit.')
+    exit_prompt()
+
+
+def main(argv=None):
+    if argv is None:
+        name = str(sys.argv[1])
+
+    marc_path = ''
+    debug = False
+
+    try:
+        opts, args = getopt.getopt(argv, 'i:', ['marc_path=', 'debug', 'help'])
+    except getopt.GetoptError as err:
+        exit_prompt('Error: {}'.format(err))
+    if opts is None or not opts:
+        usage()
+    for opt, arg in opts:
+        if opt == '--help': usage()
+        elif opt == '--debug': debug = True
+        elif opt in ['-i', '--marc_path']: marc_path = arg
+        else: exit_prompt('Error: Option {} not recognised'.format(opt))
+
+    marc2rf_index_marc(marc_path, debug)
+
+    print('\n\nAll processing complete')
+    print('----------------------------------------')
+    print(str(datetime.datetime.now()))
+    sys.exit()
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
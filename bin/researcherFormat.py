@@ -4,6 +4,7 @@
 """Script to convert MARC records to Researcher Format"""
 
 import getopt
+import multiprocessing
 from marc2rf import *
 
 __author__ = 'Victoria Morris'
@@ -23,6 +24,9 @@ def usage():
     print('researcherFormat -i MARC_PATH -r REQUEST_PATH -o OUTPUT_FOLDER [OPTIONS]\n')
     print('\nConvert MARC_PATH to Researcher Format with parameters set in REQUEST_PATH.')
     print('    -i    Path to file of MARC records')
+    print('          (.lex, or .lex.gz, .lex.bz2 or .lex.xz to read compressed records)')
+    print('          or to a folder of files of MARC records, a glob pattern such as "records/*.lex",')
+    print('          or a manifest (.txt) listing files of MARC records one per line')
     print('    -r    Path to Outlook message containing details of the request')
     print('    -o    Folder to save Researcher Format output files')
     print('\nUse quotation marks (") around arguments which contain spaces')
@@ -38,6 +42,17 @@ def usage():
     print('    -n       Default transformation for Newspaper records.')
     print('\nAny of ...')
     print('    -o       OUTPUT_FOLDER to save output files.')
+    print('    --recover  Skip records which cannot be read or converted, instead of stopping.')
+    print('               Skipped records are saved to MARC_FILE_rejects.lex in OUTPUT_FOLDER,')
+    print('               with their byte offsets in MARC_FILE_rejects.txt.')
+    print('    --workers N  Convert records in N worker processes in parallel.')
+    print('    --threads N  Convert records in N threads in parallel (instead of --workers).')
+    print('    --gc POLICY  Garbage collection policy: auto (default), records:N to collect after every N records,')
+    print('                 or memory:N to collect whenever memory use has grown by N MB.')
+    print('    --nid-memory MB  Memory for the index of NIDs for Newspaper records (default {} MB),'.format(str(NID_INDEX_MEMORY)))
+    print('                     above which the index is moved to disk.')
+    print('    --clean-cache N  Number of strings for which the results of each cached cleaning function are kept')
+    print('                     (default {}), or 0 to disable the caches.'.format(str(CLEAN_CACHE_SIZE)))
     print('    --debug  Debug mode.')
     print('    --help   Show this message and exit.')
     exit_prompt()
@@ -48,10 +63,11 @@ def main(argv=None):
         name = str(sys.argv[1])
 
     marc_path, request_path, output_folder, options = '', '', '', ''
-    debug = False
+    debug, recover, workers, threads, gc_policy, nid_memory = False, False, 1, 1, 'auto', NID_INDEX_MEMORY
+    clean_cache = CLEAN_CACHE_SIZE
 
     try:
-        opts, args = getopt.getopt(argv, 'i:r:o:dbcefmn', ['request_path=', 'output_folder=', 'debug', 'help'])
+        opts, args = getopt.getopt(argv, 'i:r:o:dbcefmn', ['request_path=', 'output_folder=', 'recover', 'workers=', 'threads=', 'gc=', 'nid-memory=', 'clean-cache=', 'debug', 'help'])
     except getopt.GetoptError as err:
         exit_prompt('Error: {}'.format(err))
     if opts is None or not opts:
@@ -59,6 +75,27 @@ def main(argv=None):
     for opt, arg in opts:
         if opt == '--help': usage()
         elif opt == '--debug': debug = True
+        elif opt == '--recover': recover = True
+        elif opt == '--workers':
+            try: workers = int(arg)
+            except ValueError: workers = 0
+            if workers < 1: exit_prompt('Error: The number of workers should be a positive whole number')
+        elif opt == '--threads':
+            try: threads = int(arg)
+            except ValueError: threads = 0
+            if threads < 1: exit_prompt('Error: The number of threads should be a positive whole number')
+        elif opt == '--gc':
+            try: GarbageCollector(arg)
+            except ValueError as err: exit_prompt('Error: {}'.format(err))
+            gc_policy = arg
+        elif opt == '--nid-memory':
+            try: nid_memory = float(arg)
+            except ValueError: nid_memory = -1
+            if nid_memory < 0: exit_prompt('Error: The memory for the NID index should be a number of MB')
+        elif opt == '--clean-cache':
+            try: clean_cache = int(arg)
+            except ValueError: clean_cache = -1
+            if clean_cache < 0: exit_prompt('Error: The size of the cleaning caches should be a whole number')
         elif opt in ['-i', '--marc_path']: marc_path = arg
         elif opt in ['-r', '--request_path']: request_path = arg
         elif opt in ['-o', '--output_folder']: output_folder = arg
@@ -67,8 +104,11 @@ def main(argv=None):
 
     if len(re.sub(r'[^a-z]','',options)) > 1:
         exit_prompt('Error: too many optional parameters specified')
+    if workers > 1 and threads > 1:
+        exit_prompt('Error: --workers and --threads cannot be used together')
 
-    marc2rf_researcherFormat(marc_path, request_path, output_folder, options, debug)
+    marc2rf_researcherFormat(marc_path, request_path, output_folder, options, debug, recover, workers, threads,
+                             gc_policy, nid_memory, clean_cache)
 
     print('\n\nAll processing complete')
     print('----------------------------------------')
@@ -76,4 +116,5 @@ def main(argv=None):
     sys.exit()
 
 if __name__ == '__main__':
+    multiprocessing.freeze_support()
     main(sys.argv[1:])
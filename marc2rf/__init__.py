@@ -30,23 +30,55 @@ def marc2rf_write_rf_config(request_path, output_folder, debug=False):
     config.marc2rf_write_rf_config(request_path, output_folder)
 
 
-def marc2rf_researcherFormat(marc_path, request_path, output_folder, options, debug=False):
+def marc2rf_researcherFormat(marc_path, request_path, output_folder, options, debug=False, recover=False, workers=1,
+                             threads=1, gc_policy='auto', nid_memory=NID_INDEX_MEMORY, clean_cache=CLEAN_CACHE_SIZE):
     """Convert MARC records to Researcher Format.
 
     :rtype: object
-    :param marc_path: Path to file of MARC records.
+    :param marc_path: Path to file of MARC records, or to a folder, glob pattern or manifest of files of MARC records.
     :param request_path: Path to Outlook message containing details of the request.
     :param output_folder: Folder to save Researcher Format output files.
     :param options: Options to set default transformation parameters.
     :param debug: Display additional output to assist with debugging.
+    :param recover: Skip records which cannot be read or converted, and save them to a reject file.
+    :param workers: Number of worker processes to convert records in parallel.
+    :param threads: Number of threads to convert records in parallel, as an alternative to worker processes.
+    :param gc_policy: Garbage collection policy: 'auto', 'records:N' or 'memory:N'.
+    :param nid_memory: Memory in MB for the index of NIDs for Newspaper records, above which it is moved to disk.
+    :param clean_cache: Number of strings for which the results of each cached cleaning function are kept.
     """
 
-    converter = Converter(marc_path, request_path, output_folder, options, debug)
+    converter = Converter(marc_path, request_path, output_folder, options, debug, recover, workers, threads, gc_policy,
+                          nid_memory, clean_cache)
     if debug:
         print('Converting MARC records with the following parameters:')
         print('marc_path: {}'.format(str(marc_path)))
         print('request_path: {}'.format(str(request_path)))
         print('output_folder: {}'.format(str(output_folder)))
         print('options: {}'.format(str(options)))
+        print('recover: {}'.format(str(recover)))
+        print('workers: {}'.format(str(workers)))
+        print('threads: {}'.format(str(threads)))
+        print('gc_policy: {}'.format(str(gc_policy)))
+        print('nid_memory: {}'.format(str(nid_memory)))
+        print('clean_cache: {}'.format(str(clean_cache)))
     converter.marc2rf_researcherFormat()
 
+
+def marc2rf_index_marc(marc_path, debug=False):
+    """Build a sidecar index of the byte offsets of records in a file of MARC records,
+    so that records can be located by ordinal or by 001 without reading the whole file.
+
+    :rtype: object
+    :param marc_path: Path to file of MARC records.
+    :param debug: Display additional output to assist with debugging.
+    """
+
+    check_file_location(marc_path, 'MARC records', '.lex', True)
+    if debug:
+        print('Indexing MARC records with the following parameters:')
+        print('marc_path: {}'.format(str(marc_path)))
+    index = RecordIndex(marc_path)
+    index.build()
+    index.save()
+    print('{0} MARC records indexed in {1}'.format(str(len(index)), index.index_path))
@@ -3,6 +3,8 @@
 """Data cleaning functions used in the Researcher Format transformation."""
 
 # Import required modules
+from collections import OrderedDict
+import functools
 import html
 import os
 import sys
@@ -24,6 +26,9 @@ __status__ = '4 - Beta Development'
 
 BRACKETS = [('[', ']'), ('(', ')'), ('{', '}')]
 
+# Number of strings for which the results of each cached cleaning function are kept
+CLEAN_CACHE_SIZE = 8192
+
 # ====================
 #  Regular expressions
 # ====================
@@ -40,6 +45,72 @@ RE_ISSUE = re.compile('(?<![a-z])(issue|br)[.:]*\s*([1-9lxiv][0-9lxiv]*)[^0-9lxi
 RE_NUMBER = re.compile('(?<![a-z])(no|nr|numb?e?r?|pa?r?t)[.:]*\s*([1-9lxi][0-9lxiv]*)[^0-9lxiv]', flags=re.IGNORECASE)
 RE_SERIES_NUMBER = re.compile('\s+(ba?n?d|fasc|he?fte?|jahrga?n?g?|knji?g?a?|n[or](?![a-z])|number|pa?r?t|sva?z?e?k?|volu?m?e?)s?[.\s]*[0-9a-zA-Z,\-.\s/]+$', flags=re.IGNORECASE)
 RE_NUMERAL = re.compile('[1-9]+[0-9]*|[cdilmvx]+')
+# Used by clean() and quick_clean()
+RE_QUOTES = re.compile(u'[\u0022\u055A\u05F4\u2018\u2019\u201A\u201B\u201C\u201D\u201E\u201F\u275B\u275C\u275D\u275E\uFF07]')
+RE_CONTROL_CHARS = re.compile(
+    u'[\u0000-\u0009\u000A-\u000f\u0010-\u0019\u001A-\u001F\u0080-\u0089\u008A-\u008F\u0090-\u0099\u009A-\u009F\u2028\u2029]+')
+RE_WHITESPACE = re.compile(r'\s+')
+RE_SPACES = re.compile(u'[\u00A0\u1680\u2000-\u200A\u202F\u205F\u3000]+')
+RE_ADAPTATIONS = re.compile(r'\(adap(ta)?tions\)', flags=re.IGNORECASE)
+RE_PSEUDONYM = re.compile(r'(?<![a-z])pseud\.*(?![a-z])', flags=re.IGNORECASE)
+RE_HTML_TAGS = re.compile(r'</*(b|br|emph|i|li|ol|p|sup|sub|ul)\s*/*>', flags=re.IGNORECASE)
+
+# ====================
+#       Caching
+# ====================
+
+# Caches of cleaning functions, in the order in which the functions are defined
+_caches = []
+
+
+class CleaningCache(object):
+    """A class for caching the results of a cleaning function, keyed on the string and flags it is called with,
+    keeping the results for the most recently used strings.
+    Used as a decorator, so that the function is replaced by the cache wherever it is imported.
+
+    :param function: Cleaning function, which must always return the same result for the same arguments.
+    """
+
+    def __init__(self, function):
+        functools.update_wrapper(self, function)
+        self.function = function
+        self.resize(CLEAN_CACHE_SIZE)
+        _caches.append(self)
+
+    def __call__(self, *args, **kwargs):
+        return self._cached(*args, **kwargs)
+
+    def __reduce__(self):
+        # Pickle by name, like the function
+        return self.__qualname__
+
+    def resize(self, size):
+        """Function to replace the cache with an empty cache for size strings, or no cache if size is 0"""
+        self.size = size
+        self._cached = functools.lru_cache(maxsize=size)(self.function) if size > 0 else self.function
+
+    def summary(self):
+        """Function to get the numbers of hits, misses and evictions since the cache was last resized"""
+        if self.size <= 0: return None
+        info = self._cached.cache_info()
+        return OrderedDict([('size', self.size), ('hits', info.hits), ('misses', info.misses),
+                            ('evictions', info.misses - info.currsize)])
+
+
+def set_clean_cache_size(size):
+    """Function to resize the caches of all the cached cleaning functions, emptying them"""
+    for cache in _caches:
+        cache.resize(size)
+
+
+def clean_cache_summary():
+    """Function to get the hits, misses and evictions of the caches of cleaning functions which have been called"""
+    summary = OrderedDict()
+    for cache in _caches:
+        info = cache.summary()
+        if info and info['hits'] + info['misses'] > 0: summary[cache.__name__] = info
+    return summary
+
 
 # ====================
 #      Functions
@@ -48,26 +119,26 @@ RE_NUMERAL = re.compile('[1-9]+[0-9]*|[cdilmvx]+')
 # Functions for cleaning strings
 
 
+@CleaningCache
 def clean(string, hyphens=True, space=True):
     """Function to clean punctuation, unescape HTML, and normalize Unicode."""
     string = html.unescape(string)
-    string = re.sub(u'[\u0022\u055A\u05F4\u2018\u2019\u201A\u201B\u201C\u201D\u201E\u201F\u275B\u275C\u275D\u275E\uFF07]', '\'', string)
-    string = re.sub(
-        u'[\u0000-\u0009\u000A-\u000f\u0010-\u0019\u001A-\u001F\u0080-\u0089\u008A-\u008F\u0090-\u0099\u009A-\u009F\u2028\u2029]+',
-        '', string)
+    string = RE_QUOTES.sub('\'', string)
+    string = RE_CONTROL_CHARS.sub('', string)
     if space:
-        string = re.sub(r'\s+', ' ', string)
-        string = re.sub(u'[\u00A0\u1680\u2000-\u200A\u202F\u205F\u3000]+', ' ', string)
-        string = re.sub(r'\(adap(ta)?tions\)', '', string, flags=re.IGNORECASE)
-        string = re.sub(r'(?<![a-z])pseud\.*(?![a-z])', 'pseudonym', string, flags=re.IGNORECASE)
+        string = RE_WHITESPACE.sub(' ', string)
+        string = RE_SPACES.sub(' ', string)
+        string = RE_ADAPTATIONS.sub('', string)
+        string = RE_PSEUDONYM.sub('pseudonym', string)
         string = quick_clean(string, hyphens)
-        string = re.sub(r'</*(b|br|emph|i|li|ol|p|sup|sub|ul)\s*/*>', ' ', string, flags=re.IGNORECASE)
-        string = re.sub(r'\s+', ' ', string)
+        string = RE_HTML_TAGS.sub(' ', string)
+        string = RE_WHITESPACE.sub(' ', string)
         string = check_brackets(string)
     string = unicodedata.normalize('NFC', string).strip()
     return string
 
 
+@CleaningCache
 def quick_clean(string, hyphens=True):
     """Quick clean.
 
@@ -76,7 +147,7 @@ def quick_clean(string, hyphens=True):
     If hyphens=True, trailing/leading hyphens are preserved."""
     l = '?$.,:;/\])} ' if hyphens else '?$.,:;/\-])} '
     r = '.,:;/\[({ ' if hyphens else '.,:;/\-[({ '
-    string = re.sub(r'\s+', ' ', string.strip().lstrip(l).rstrip(r)).strip()
+    string = RE_WHITESPACE.sub(' ', string.strip().lstrip(l).rstrip(r)).strip()
     string = string.replace('( ', '(').replace(' )', ')')
     string = string.replace(' ,', ',').replace(',,', ',').replace(',.', '.').replace('.,', ',')
     string = string.replace('. [', ' [').replace(' : (', ' (').replace('= =', '=').replace('= :', '=').replace('+,', '+')
@@ -330,21 +401,26 @@ def get_boolean(prompt):
             print('Sorry, your choice was not recognised. Please enter Y or N:')
 
 
-def check_file_location(file_path, function, file_ext='', exists=False):
-    """Function to check whether a file exists and has the correct file extension."""
-    folder, file, ext = '', '', ''
+def check_file_location(file_path, function, file_ext='', exists=False, compression_exts=()):
+    """Function to check whether a file exists and has the correct file extension.
+    The file extension may be followed by one of compression_exts (e.g. .lex.gz),
+    in which case the extension returned includes both."""
+    folder, file, ext, compression_ext = '', '', '', ''
     if file_path == '':
         exit_prompt('Error: Could not parse path to {} file'.format(function))
     try:
         file, ext = os.path.splitext(os.path.basename(file_path))
+        if ext.lower() in compression_exts:
+            compression_ext = ext
+            file, ext = os.path.splitext(file)
         folder = os.path.dirname(file_path)
     except:
         exit_prompt('Error: Could not parse path to {} file'.format(function))
     if file_ext != '' and ext != file_ext:
         exit_prompt('Error: The specified file should have the extension {}'.format(file_ext))
-    if exists and not os.path.isfile(os.path.join(folder, file + ext)):
+    if exists and not os.path.isfile(os.path.join(folder, file + ext + compression_ext)):
         exit_prompt('Error: The specified {} file cannot be found'.format(function))
-    return folder, file, ext
+    return folder, file, ext + compression_ext
 
 
 def exit_prompt(message=''):
@@ -360,7 +436,7 @@ def exit_prompt(message=''):
 
 def repair_accents_in_place_names(string):
     """Function to repair missing accents in place names"""
-    string = mrx.PlaceNamesAccents().sub(string)
+    string = mrx.PlaceNamesAccents.shared().sub(string)
     string = quick_clean(string)
     return string
 
@@ -646,14 +722,14 @@ def get_holdings_years(string, startyear='', endyear=''):
 def get_name_parts(field):
     """Function to get name parts from a name field"""
     name, dates, ntype, role, isni, viaf = '', '', '', set(), set(), set()
-    if field.tag == '880' and '6' in field:
-        field.tag = (field['6'][:3])
+    # Use the tag linked in $6 for 880 fields, without changing the field itself
+    tag = field['6'][:3] if field.tag == '880' and '6' in field else field.tag
 
     # Name
     for subfield in field:
         code, content = subfield[0], clean(subfield[1], hyphens=False)
-        if (field.tag[1] == '0' and code in ['a', 'b', 'c']) \
-                or (field.tag[1] == '1' and code in ['a', 'b', 'c', 'f', 'g', 'n', 'p']):
+        if (tag[1] == '0' and code in ['a', 'b', 'c']) \
+                or (tag[1] == '1' and code in ['a', 'b', 'c', 'f', 'g', 'n', 'p']):
             content = change_case(content)
             # Remove brackets
             if code in ['a', 'c']: content = remove_brackets(content)
@@ -669,7 +745,7 @@ def get_name_parts(field):
                 name = add_string(content, name, ', ').replace(', (', ' (')
         # Fuller form of name
         elif code == 'q':
-            name = add_string(content, name, ' ' if field.tag[1] == '0' else ', ')
+            name = add_string(content, name, ' ' if tag[1] == '0' else ', ')
     # Check brackets
     name = remove_brackets(check_brackets(name))
     # Replace missing full stops after initials
@@ -686,7 +762,7 @@ def get_name_parts(field):
         '00': 'person',
         '10': 'organisation',
         '11': 'meeting/conference',
-    }[field.tag[1:]]
+    }[tag[1:]]
 
     # Role
     for subfield in field.get_subfields('e'):
@@ -744,7 +820,7 @@ def get_relators(string):
                 l = relators.get(substring)
                 if l: rels.add(l)
                 continue
-            substring = mrx.Relators().sub(substring)
+            substring = mrx.Relators.shared().sub(substring)
             if substring != '':
                 rels.add(substring)
     if len(rels) == 0: return False
@@ -754,8 +830,8 @@ def get_relators(string):
 def get_topic_parts(field):
     """Function to get topic parts from a subject field"""
     term, ttype, genre = '', '', set()
-    if field.tag == '880' and '6' in field:
-        field.tag = (field['6'][:3])
+    # Use the tag linked in $6 for 880 fields, without changing the field itself
+    tag = field['6'][:3] if field.tag == '880' and '6' in field else field.tag
 
     # Term
     for subfield in field:
@@ -763,7 +839,7 @@ def get_topic_parts(field):
         if code in ['a', 'b', 'p', 'v', 'x', 'y', 'z']:
             content = remove_brackets(content)
             # Replace missing full stops after initials
-            if field.tag == '600' and code == 'a':
+            if tag == '600' and code == 'a':
                 content = re.sub(r'([\s.\-][A-Z])([,\s]|$)', r'\1.\2', content)
             term = add_string(content, term, '--')
         elif code in ['c', 'd', 'e', 'n', 'q']:
@@ -784,7 +860,7 @@ def get_topic_parts(field):
                 '11': 'meeting/conference',
                 '30': 'title',
                 '51': 'geographical term',
-            }[field.tag[1:]]
+            }[tag[1:]]
         except:
             ttype = 'general term'
 
@@ -818,7 +894,7 @@ def expand_abbreviations(string, plurals=True, case=True):
     # Expand single-word abbreviations
     words = re.split('([\w\-]+\.*)', string)
     for i, word in enumerate(words):
-        words[i] = mrx.Abbreviations().sub(words[i])
+        words[i] = mrx.Abbreviations.shared().sub(words[i])
         if word != '' and case:
             if word.isupper():
                 words[i] = words[i].upper()
@@ -836,18 +912,18 @@ def expand_place_abbreviations(string, ctrys=None):
     if string.lower() in 's.n. s. n. sn s n s.l. s. l. sl s l s.i. si s i nv n.v. n. v. n v blnpn': return ''
     if string.lower() == 'united states': return 'United States of America'
     string = string.replace('$42blnpn', '').replace('42blnpn', '')
-    string = mrx.PlaceNamesUK().sub(string)
-    string = mrx.PlaceNamesUS().sub(string)
+    string = mrx.PlaceNamesUK.shared().sub(string)
+    string = mrx.PlaceNamesUS.shared().sub(string)
     if countries:
         if 'Australia' in ctrys:
-            string = mrx.PlaceNamesAustralia().sub(string)
+            string = mrx.PlaceNamesAustralia.shared().sub(string)
         if 'Brazil' in ctrys:
-            string = mrx.PlaceNamesBrazil().sub(string)
+            string = mrx.PlaceNamesBrazil.shared().sub(string)
         if 'Canada' in ctrys:
-            string = mrx.PlaceNamesCanada().sub(string)
+            string = mrx.PlaceNamesCanada.shared().sub(string)
         if 'New Zealand' in ctrys:
-            string = mrx.PlaceNamesNewZealand().sub(string)
-    string = mrx.PlaceNamesOther().sub(string)
+            string = mrx.PlaceNamesNewZealand.shared().sub(string)
+    string = mrx.PlaceNamesOther.shared().sub(string)
     string = re.sub(r'[nN]ew[\-\s]*[yY]ork\s*(\(?,?\s*(NY|New York|City)\)?)?', 'New York', string)
     string = re.sub(r'(\bin the )?\bcounty of\b', '', string)
     string = re.sub(
@@ -860,6 +936,7 @@ def expand_place_abbreviations(string, ctrys=None):
 # FUNCTIONS FOR CLEANING SPECIFIC FIELDS
 
 
+@CleaningCache
 def clean_250(string):
     if string == '': return ''
     string = clean(string.rstrip('!-'))  # full clean IS required here
@@ -915,6 +992,7 @@ def clean_250(string):
     return string
 
 
+@CleaningCache
 def clean_26X(string):
     if string == '': return ''
     # Remove rubbish values
@@ -979,7 +1057,7 @@ def clean_300(field):
                 elif item == 'ill':
                     item = 'illustrations'
                 elif not re.fullmatch(RE_NUMERAL, item):
-                    item = quick_clean(mrx.Abbreviations().sub(item))
+                    item = quick_clean(mrx.Abbreviations.shared().sub(item))
                 sub_desc += ' ' + oB + item + cB + cP
             # If pages appears before numeration, move it afterwards
             sub_desc = re.sub(r'^\s*pages ([0-9\-]+),*', r'\1 pages,', sub_desc)
@@ -1028,6 +1106,7 @@ def clean_362(field, start_year='', end_year=''):
     return date_range
 
 
+@CleaningCache
 def clean_490(string):
     if string == '': return ''
     string = quick_clean(string.lstrip('$.,:;/\-[])} ').rstrip('.,:;/\-[]({ '))
@@ -1074,6 +1153,7 @@ def clean_510(string):
     return string
 
 
+@CleaningCache
 def clean_852(string):
     if any(s in string.lower() for s in
            ['available', 'availalbe', 'british museum', 'catalog', 'classmark', 'customer service', 'discard',
@@ -1089,7 +1169,7 @@ def clean_852(string):
 
 def clean_genre(string):
     string = re.sub(r'[^a-z0-9\s]', '', string.lower())
-    string = mrx.Genres().sub(string)
+    string = mrx.Genres.shared().sub(string)
     return string
 
 
@@ -1336,7 +1416,7 @@ def clean_publisher_names(string):
     for substring in string.split(';'):
         if substring and substring != '' and not is_number(substring):
             substring = clean_26X(quick_clean(substring, hyphens=False))
-            substring = publisher.Publishers().sub(substring).strip()
+            substring = publisher.Publishers.shared().sub(substring).strip()
             if substring not in ['Books of Africa', 'Independent Publishers Group']:
                 substring = re.sub(r'\s*\bu(ni)?(versity)?[.\s]*pr*(ess)?\b[.\s]*', ' University Press ', substring, flags=re.IGNORECASE)
                 substring = quick_clean(substring, hyphens=False)
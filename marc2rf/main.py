@@ -5,21 +5,29 @@
 
 # Import required modules
 # These should all be contained in the standard library
-from collections import OrderedDict
+from collections import deque, OrderedDict
+from multiprocessing.pool import ThreadPool
 import copy
 import datetime
 import gc
 import glob
+import io
+import json
 import locale
+import multiprocessing
 import os
 import regex as re
+import shelve
 import sys
+import tempfile
+import time
 import unicodedata
 
 # Modules specific to Researcher Format
 from marc2rf.lookup import *
 from marc2rf.marc_data import *
 from marc2rf.cleaning_functions import *
+import marc2rf.multiregex as mrx
 
 __author__ = 'Victoria Morris'
 __license__ = 'MIT License'
@@ -29,9 +37,82 @@ __status__ = '4 - Beta Development'
 # Set locale to assist with sorting
 locale.setlocale(locale.LC_ALL, '')
 
-# Disable garbage collection (except when called)
-# Automatic garbage collection disrupts MultiRegex replacements
-gc.disable()
+# Number of records sent to a worker process at a time
+WORKER_CHUNK_SIZE = 100
+
+# Garbage collection policies: automatic collection, collection every N records,
+# or collection whenever memory use has grown by N MB
+GC_POLICIES = ['auto', 'records', 'memory']
+
+# Minimum number of seconds between progress reports
+PROGRESS_INTERVAL = 1.0
+
+# Memory in MB for the index of NIDs and links to digitised resources, above which it is moved to disk
+NID_INDEX_MEMORY = 256
+
+# Converter methods which convert the fields of a record for profiles other than F and M, in the order in which
+# they are run, with the columns to which they add values and the columns whose values they use.
+# The start and end years from 008, used by 362 and 866, are counted as columns P1 and P2.
+FIELD_HANDLERS = [
+    ('convert_ldr', ('CT', 'EL', 'RT'), ()),
+    ('convert_001', ('ID',), ()),
+    ('convert_007', ('MT',), ()),
+    ('convert_008', ('FC', 'LA', 'LF', 'MF', 'P1', 'P2', 'PC', 'PD', 'TA'), ('CT', 'RT')),
+    ('convert_010', ('LC',), ()),
+    ('convert_015', ('BN',), ()),
+    ('convert_019', ('IO',), ()),
+    ('convert_020', ('IB', 'MT', 'PR'), ()),
+    ('convert_022', ('IL', 'IS'), ()),
+    ('convert_024', ('IA', 'IM', 'IR', 'OI'), ()),
+    ('convert_028', ('PN',), ()),
+    ('convert_034', ('CA', 'CD', 'SC'), ()),
+    ('convert_035', ('ES', 'OC'), ()),
+    ('convert_041', ('LA', 'LI', 'LO'), ()),
+    ('convert_047', ('MF',), ()),
+    ('convert_050', ('LN',), ()),
+    ('convert_082', ('DW',), ()),
+    ('convert_100', ('AA', 'AD', 'AN', 'AR', 'AT', 'II', 'VF'), ()),
+    ('convert_130', ('ED', 'TU', 'TV'), ()),
+    ('convert_245', ('TK', 'TT', 'TV'), ()),
+    ('convert_250', ('ED',), ()),
+    ('convert_254', ('ED',), ()),
+    ('convert_255', ('CA', 'JK'), ()),
+    ('convert_260', ('PB', 'PC', 'PD', 'PP', 'PU'), ('PC',)),
+    ('convert_263', ('PJ',), ()),
+    ('convert_300', ('DS',), ()),
+    ('convert_310', ('FC', 'FF'), ()),
+    ('convert_336', ('CT',), ()),
+    ('convert_338', ('MT',), ()),
+    ('convert_362', ('FA', 'PG'), ('P1', 'P2')),
+    ('convert_348', ('MG',), ()),
+    ('convert_382', ('MG',), ()),
+    ('convert_383', ('MA',), ()),
+    ('convert_384', ('MG',), ()),
+    ('convert_490', ('SE', 'SN'), ()),
+    ('convert_500', ('FA', 'NN'), ()),
+    ('convert_505', ('CO', 'TV'), ()),
+    ('convert_510', ('RF',), ()),
+    ('convert_520', ('AB',), ()),
+    ('convert_546', ('NG',), ()),
+    ('convert_561', ('PV',), ()),
+    ('convert_600', ('GE', 'SU'), ()),
+    ('convert_651', ('G1', 'G2', 'PC', 'PP'), ('PC',)),
+    ('convert_648', ('SU',), ()),
+    ('convert_655', ('GE', 'PC', 'PP'), ('PC',)),
+    ('convert_700', ('AN',), ()),
+    ('convert_700_titles', ('TV',), ()),
+    ('convert_752', ('CC', 'CF', 'CG', 'CL', 'CY', 'PC', 'PP'), ('PC',)),
+    ('convert_760', ('NN',), ()),
+    ('convert_780', ('NN', 'S1'), ()),
+    ('convert_785', ('NN', 'S2'), ()),
+    ('convert_852', ('BU', 'IO', 'SD', 'SM', 'SO'), ()),
+    ('convert_856', ('NL',), ()),
+    ('convert_866', ('HA', 'HF', 'HL'), ('P1', 'P2')),
+    ('convert_903', ('8F',), ('SM',)),
+    ('convert_907', ('CL',), ('CL',)),
+    ('convert_932', ('SX',), ()),
+    ('convert_944', ('ND', 'NL'), ()),
+]
 
 # ====================
 #       Classes
@@ -287,6 +368,349 @@ class Output:
                 self.values[v] = set()
 
 
+class GarbageCollector(object):
+    """A class for applying a garbage collection policy during the transformation.
+
+    With the 'auto' policy, Python collects garbage automatically, but the objects created before the transformation
+    starts, such as lookup tables and compiled MultiRegex and Publishers patterns, are frozen first,
+    so that they are not examined again by every collection.
+    With the 'records' and 'memory' policies, automatic collection is disabled,
+    and garbage is only collected after every N records, or whenever memory use has grown by N MB.
+
+    :param policy: Garbage collection policy: 'auto', 'records:N' or 'memory:N'.
+    """
+
+    def __init__(self, policy='auto'):
+        self.policy, limit = (policy.split(':', 1) + [''])[:2]
+        if self.policy not in GC_POLICIES or (self.policy == 'auto') != (limit == ''):
+            raise ValueError('Garbage collection policy should be auto, records:N or memory:N')
+        if self.policy != 'auto':
+            try: self.limit = int(limit)
+            except ValueError: self.limit = 0
+            if self.limit < 1: raise ValueError('N in the garbage collection policy should be a positive whole number')
+        if self.policy == 'memory' and get_memory_usage() is None:
+            raise ValueError('Memory use cannot be measured on this platform')
+        self.enabled, self.count, self.memory, self.collections = True, 0, 0, 0
+
+    def __str__(self):
+        return self.policy if self.policy == 'auto' else '{}:{}'.format(self.policy, str(self.limit))
+
+    def start(self):
+        """Function to apply the policy at the start of the transformation, or in a worker process"""
+        self.enabled = gc.isenabled()
+        self.count, self.collections = 0, 0
+        if self.policy == 'auto':
+            gc.collect()
+            if hasattr(gc, 'freeze'): gc.freeze()
+            gc.enable()
+        else:
+            gc.disable()
+            if self.policy == 'memory': self.memory = get_memory_usage()
+
+    def stop(self):
+        """Function to restore automatic garbage collection as it was before start()"""
+        if self.policy == 'auto' and hasattr(gc, 'unfreeze'): gc.unfreeze()
+        if self.enabled: gc.enable()
+        else: gc.disable()
+
+    def record_done(self):
+        """Function to collect garbage if required by the policy once a record has been converted"""
+        if self.policy == 'records':
+            self.count += 1
+            if self.count >= self.limit:
+                self.count = 0
+                self.collect()
+        elif self.policy == 'memory':
+            if get_memory_usage() - self.memory >= self.limit * 1024 * 1024:
+                self.collect()
+                self.memory = get_memory_usage()
+
+    def collect(self):
+        gc.collect()
+        self.collections += 1
+
+
+class Progress(object):
+    """A class for reporting progress through files of MARC records, at most once every interval seconds,
+    with the rates at which records and bytes are read, and the estimated time remaining.
+    Progress is only reported if stdout is a terminal, but finish() always prints the number of records processed.
+
+    :param reader: MultiMARCReader from which the records are read.
+    :param interval: Minimum number of seconds between progress reports.
+    """
+
+    def __init__(self, reader, interval=PROGRESS_INTERVAL):
+        self.reader, self.interval = reader, interval
+        self.count, self.width = 0, 0
+        self.start = time.time()
+        self.next_report = self.start + interval
+        try: self.quiet = not sys.stdout.isatty()
+        except (AttributeError, ValueError): self.quiet = True
+
+    def update(self, count=1):
+        self.count += count
+        if self.quiet: return
+        now = time.time()
+        if now >= self.next_report:
+            self.next_report = now + self.interval
+            self.show(self.describe(now - self.start))
+
+    def describe(self, seconds):
+        done, total = self.reader.bytes_read, self.reader.total_bytes
+        seconds = max(seconds, 0.001)
+        text = '{0} MARC records processed ({1:.0f} records/s, {2}/s'.format(str(self.count), self.count / seconds,
+                                                                             format_bytes(done / seconds))
+        if 0 < done < total: text += ', about {} remaining'.format(format_duration((total - done) * seconds / done))
+        return text + ')'
+
+    def show(self, text):
+        print('\r' + text.ljust(self.width), end='', flush=True)
+        self.width = len(text)
+
+    def finish(self):
+        """Print the number of records processed, and return a summary of the progress for the stats file."""
+        seconds = time.time() - self.start
+        text = '{0} MARC records processed in {1}'.format(str(self.count), format_duration(seconds))
+        if self.quiet: print(text)
+        else:
+            self.show(text)
+            print()
+        seconds = max(seconds, 0.001)
+        return OrderedDict([
+            ('records', self.count),
+            ('bytes', self.reader.bytes_read),
+            ('seconds', round(seconds, 3)),
+            ('records_per_second', round(self.count / seconds, 1)),
+            ('bytes_per_second', round(self.reader.bytes_read / seconds)),
+        ])
+
+
+class RecordOutput(object):
+    """A class for the values converted from a single record, in columns which are fixed for the whole transformation.
+
+    The set of values for each column is allocated once, in column order, and cleared by reset(),
+    so that containers can be recycled between records instead of building an Output for each record.
+
+    :param layout: Names of the columns, in order.
+    """
+
+    __slots__ = ('values', 'columns', 'start_year', 'end_year', 'mtq')
+
+    def __init__(self, layout):
+        self.columns = [set() for column in layout]
+        self.values = dict(zip(layout, self.columns))
+        # Values shared between field handlers: start and end years from 008, and material type qualifiers from 020
+        self.start_year, self.end_year, self.mtq = '', '', set()
+
+    def reset(self):
+        for values in self.columns: values.clear()
+        self.start_year, self.end_year = '', ''
+        self.mtq.clear()
+
+
+class Spool(object):
+    """A class for spooling rows of output to a temporary file until the transformation is finished.
+
+    :param folder: Folder in which to create the temporary file.
+    """
+
+    def __init__(self, folder=None):
+        self.file = tempfile.TemporaryFile(mode='w+', encoding='utf-8', errors='surrogatepass', newline='',
+                                           dir=folder or None)
+        self.rows = 0
+
+    def size(self):
+        """Function to get the number of bytes in the spool."""
+        self.file.flush()
+        return os.fstat(self.file.fileno()).st_size
+
+    def close(self):
+        self.file.close()
+
+
+class RowSpool(Spool):
+    """A class for spooling rows of text keyed by column,
+    collecting the columns present, so that the rows can be written once all the columns are known.
+
+    Each row is a line giving whether the row is to be kept if rows are filtered, the columns with text,
+    and the text in each of those columns as a JSON list.
+
+    :param folder: Folder in which to create the temporary file.
+    """
+
+    def __init__(self, folder=None):
+        Spool.__init__(self, folder)
+        self.columns = set()
+
+    @staticmethod
+    def format_row(texts, keep=True):
+        """Function to format a row for the spool from a dictionary of the text in each column."""
+        return '{0}\t{1}\t{2}\n'.format('1' if keep else '0', ' '.join(texts),
+                                        json.dumps(list(texts.values()), ensure_ascii=False))
+
+    def write(self, text):
+        """Write rows formatted by format_row() to the spool."""
+        if not text: return
+        self.file.write(text)
+        for row in text.split('\n')[:-1]:
+            self.columns.update(row.split('\t', 2)[1].split())
+            self.rows += 1
+
+    def read(self, columns):
+        """Read back the rows in the spool, with the text in each of columns.
+        Yields, for each row, whether the row is to be kept and the list of texts."""
+        self.file.seek(0)
+        for row in self.file:
+            keep, tags, texts = row[:-1].split('\t', 2)
+            texts = dict(zip(tags.split(), json.loads(texts)))
+            yield keep == '1', [texts.get(column, '') for column in columns]
+
+
+class DeferredRows(Spool):
+    """A class for spooling rows of text in which one column may be filled once all the records have been read.
+
+    Each row is a line with a JSON list: either the text of the row,
+    or the text before and after the column to be filled, the values already in the column,
+    and the keys with which the rest of its values are found.
+
+    :param folder: Folder in which to create the temporary file.
+    """
+
+    def __init__(self, folder=None):
+        Spool.__init__(self, folder)
+        self.deferred = 0
+
+    @staticmethod
+    def format_row(text, after=None, values=(), keys=()):
+        """Function to format a row for the spool from its text,
+        or from the text before and after the column to be filled."""
+        if after is None: return json.dumps([text], ensure_ascii=False) + '\n'
+        return json.dumps([text, after, list(values), list(keys)], ensure_ascii=False) + '\n'
+
+    def write(self, text):
+        """Write rows formatted by format_row() to the spool."""
+        if not text: return
+        self.file.write(text)
+        self.rows += text.count('\n')
+
+    def read(self, fill):
+        """Read back the rows in the spool.
+        Yields the text of each row, calling fill(before, after, values, keys) to get the text of rows to be filled."""
+        self.file.seek(0)
+        self.deferred = 0
+        for row in self.file:
+            row = json.loads(row)
+            if len(row) == 1: yield row[0]
+            else:
+                self.deferred += 1
+                yield fill(*row)
+
+
+class NIDIndex(object):
+    """A class for an index of NIDs (Newspaper IDs, in 944 or NID $a)
+    and the URLs in 856 $u of digitised resources in the British Newspaper Archive, from records with each NID.
+
+    The index is held in memory until its estimated size exceeds memory_limit,
+    when it is moved to a shelf in a temporary folder; NIDs are then looked up in both.
+
+    :param folder: Folder in which to create the temporary folder.
+    :param memory_limit: Memory in MB for the index.
+    """
+
+    # Tags which a record must have to be indexed, including 880 fields linked to 944, NID or 856
+    nid_tags, url_tags = frozenset(['944', 'NID', '880']), frozenset(['856', '880'])
+
+    def __init__(self, folder=None, memory_limit=NID_INDEX_MEMORY):
+        self.folder = folder or None
+        self.urls = {}
+        # Estimated size of self.urls in bytes
+        self.memory, self.memory_limit = 0, memory_limit * 1024 * 1024
+        self.temp, self.shelf, self.spills = None, None, 0
+        self.records = 0
+
+    def add_record(self, record):
+        """Function to add the NIDs in a record, with the URLs of digitised resources in the record.
+        Only the NID and 856 fields are decoded, and only if the record has both."""
+        nid_fields = record.get_fields('944', 'NID')
+        if not nid_fields: return
+        url_fields = record.get_fields('856')
+        if not url_fields: return
+        for f1 in nid_fields:
+            for sa in f1.get_subfields('a'):
+                sa = re.sub(r'[^0-9]', '', sa)
+                for f2 in url_fields:
+                    for su in f2.get_subfields('u'):
+                        if 'http://www.britishnewspaperarchive.co.uk' in su: self.add(sa, su)
+        self.records += 1
+
+    def add(self, nid, url):
+        urls = self.urls.get(nid)
+        if urls is None:
+            urls = self.urls[nid] = set()
+            # Key, set and dictionary entry
+            self.memory += sys.getsizeof(nid) + sys.getsizeof(urls) + 100
+        if url not in urls:
+            urls.add(url)
+            # URL and set entry
+            self.memory += sys.getsizeof(url) + 50
+            if self.memory > self.memory_limit: self.spill()
+
+    def spill(self):
+        """Function to move the index in memory to the shelf, merging it with NIDs already on the shelf."""
+        if self.shelf is None:
+            self.temp = tempfile.TemporaryDirectory(dir=self.folder)
+            self.shelf = shelve.open(os.path.join(self.temp.name, 'nid_index'), flag='n')
+        for nid, urls in self.urls.items():
+            self.shelf[nid] = urls | self.shelf[nid] if nid in self.shelf else urls
+        self.urls, self.memory = {}, 0
+        self.spills += 1
+
+    def get(self, nid):
+        """Function to get the set of URLs for a NID."""
+        urls = self.urls.get(nid, set())
+        if self.shelf is not None and nid in self.shelf: urls = urls | self.shelf[nid]
+        return urls
+
+    def filter(self, prefilter=None, recover=False):
+        """Function to get a prefilter for a MARC reader which indexes the records with the tags needed
+        which are rejected by prefilter, since the reader does not decode them.
+        Records accepted by prefilter are indexed from the decoded record by index_records().
+        Records which cannot be decoded are not indexed if recover is True."""
+        def index_record(marc):
+            if prefilter is None or prefilter(marc): return True
+            try: tags = get_directory_tags(marc)
+            except (ValueError, UnicodeDecodeError): tags = ()
+            if not self.nid_tags.isdisjoint(tags) and not self.url_tags.isdisjoint(tags):
+                try: self.add_record(Record(marc))
+                except Exception:
+                    if not recover: raise
+            return False
+        return index_record
+
+    def index_records(self, reader, recover=False):
+        """Function to add the records read by reader to the index as they are read, yielding each record.
+        Records which cannot be indexed are rejected if recover is True."""
+        for record in reader:
+            try: self.add_record(record)
+            except Exception as err:
+                if not recover: raise
+                reader.reject(reader.record_data, reader.record_offset, err)
+                continue
+            yield record
+
+    def summary(self):
+        """Function to summarise the index for the stats file."""
+        nids = set(self.urls)
+        if self.shelf is not None: nids.update(self.shelf.keys())
+        return OrderedDict([('records', self.records), ('nids', len(nids)), ('spills', self.spills)])
+
+    def close(self):
+        if self.shelf is not None:
+            self.shelf.close()
+            self.temp.cleanup()
+            self.shelf, self.temp = None, None
+
+
 class Converter(object):
     """A class for converting records.
 
@@ -295,14 +719,28 @@ class Converter(object):
     :param output_folder: Folder to save Researcher Format output files.
     :param options: Options to set default transformation parameters.
     :param debug: Display additional output to assist with debugging.
+    :param recover: Skip records which cannot be read or converted, instead of stopping,
+        and save them to a reject file in the output folder.
+    :param workers: Number of worker processes to convert records in parallel.
+    :param threads: Number of threads to convert records in parallel, as an alternative to worker processes.
+    :param gc_policy: Garbage collection policy: 'auto', 'records:N' or 'memory:N'.
+    :param nid_memory: Memory in MB for the index of NIDs for profile N, above which it is moved to disk.
+    :param clean_cache: Number of strings for which the results of each cached cleaning function are kept.
     """
 
-    def __init__(self, marc_path, request_path, output_folder, options, debug=False):
+    def __init__(self, marc_path, request_path, output_folder, options, debug=False, recover=False, workers=1,
+                 threads=1, gc_policy='auto', nid_memory=NID_INDEX_MEMORY, clean_cache=CLEAN_CACHE_SIZE):
         self.marc_path = marc_path
         self.request_path = request_path
         self.output_folder = output_folder
         self.options = re.sub(r'[^a-z]', '', options)
         self.debug = debug
+        self.recover = recover
+        self.workers = workers
+        self.threads = threads
+        self.garbage_collector = GarbageCollector(gc_policy)
+        self.nid_memory = nid_memory
+        self.clean_cache = clean_cache
         self.header = '========================================\n' \
                       'researcherFormat\n' \
                       'MARC record conversion for Researcher Format\n' \
@@ -315,12 +753,61 @@ class Converter(object):
         # Parameters for output files to be included
         self.file_records, self.file_titles, self.file_names, self.file_topics, self.file_classification = \
             False, False, False, False, False
-        self.fields_present, self.nid_urls = {}, {}
+        self.fields_present = {}
+        # Links to digitised resources from other records with the same NIDs are added after the transformation
+        self.nid_links = False
+        # Include 880 fields linked to the requested tags when getting fields from records
+        self.q880 = True
+        # Names of the field handlers needed for the output columns, set by compile_plan()
+        self.plan = None
+        # Columns of the output from each record, set by compile_layout(), and containers for recycling
+        self.layout, self.outputs = None, []
 
     def show_header(self):
         if self.header:
             print(self.header)
 
+    def write_rejects(self, reader, reject_path):
+        """Write the file, offset, length and reason for each record rejected by reader,
+        and print a summary of the rejected records.
+        """
+        with open(reject_path + '.txt', mode='w', encoding='utf-8', errors='replace') as report:
+            report.write('File\tOffset\tLength\tReason\n')
+            for marc_path, offset, length, reason in reader.rejects:
+                report.write('{}\t{}\t{}\t{}\n'.format(marc_path, str(offset), str(length), reason))
+        print('\n{} records rejected ({} bytes)'.format(str(len(reader.rejects)),
+                                                       str(sum(reject[2] for reject in reader.rejects))))
+        reasons = OrderedDict()
+        for marc_path, offset, length, reason in reader.rejects:
+            reasons[reason] = reasons.get(reason, 0) + 1
+        for reason in reasons:
+            print('{} records rejected: {}'.format(str(reasons[reason]), reason))
+        if reader.rejects:
+            print('Rejected records saved to {}'.format(reject_path + '.lex'))
+
+    def write_stats(self, stats_path, stats, reader, prefilter):
+        """Write a summary of the transformation, and of the progress of each pass through the MARC records,
+        to a JSON file."""
+        summary = OrderedDict([
+            ('marc_path', self.marc_path),
+            ('profile', self.profile),
+            ('files', OrderedDict(reader.counts)),
+            ('workers', self.workers),
+            ('threads', self.threads),
+            ('gc_policy', str(self.garbage_collector)),
+            ('gc_collections', self.garbage_collector.collections),
+        ])
+        if prefilter is not None:
+            summary['prefilter'] = OrderedDict([('accepted', prefilter.accepted), ('rejected', prefilter.rejected)])
+        if self.recover: summary['rejected'] = len(reader.rejects)
+        # Only the prefilters and caches of this process are counted, not those of worker processes
+        if mrx.prefilter_summary(): summary['multiregex_prefilter'] = mrx.prefilter_summary()
+        if clean_cache_summary(): summary['clean_cache'] = clean_cache_summary()
+        summary.update(stats)
+        with open(stats_path, mode='w', encoding='utf-8', errors='replace') as stats_file:
+            json.dump(summary, stats_file, indent=4)
+            stats_file.write('\n')
+
     def write_readme(self):
         if self.profile in ['B', 'F', 'M', 'N', 'R']: return None
 
@@ -475,15 +962,55 @@ class Converter(object):
                      'For further information or to comment, please contact metadata@bl.uk.')
         readme.close()
 
-    def convert_record(self, record):
-        """Function to convert a single MARC record to Researcher Format."""
-        output = Output(self.profile)
-        if self.profile == 'M':
-            output.values = copy.deepcopy(self.fields_present)
-            for v in output.values:
-                output.values[v] = set()
+    def compile_plan(self):
+        """Function to compile the list of field handlers needed to fill the columns included in the output,
+        and the columns used to select the records written to the output files."""
+        needed = set(v for v in self.output_fields.values if self.output_fields.values[v])
+        needed.update(['ID', 'SX'])
+        if self.profile == 'N': needed.add('8F')
+        else: needed.update(['TT', 'AA', 'PD'])
+        if self.file_names: needed.add('AN')
+        if self.file_titles: needed.update(['TV', 'TT'])
+        if self.file_topics: needed.add('SU')
+        if self.file_classification: needed.add('DW')
+        # Handlers are needed if they add values to a needed column,
+        # and the columns whose values they use are then needed too
+        plan = set()
+        while True:
+            handlers = set(handler for handler, columns, uses in FIELD_HANDLERS if needed.intersection(columns))
+            if handlers == plan: break
+            plan = handlers
+            for handler, columns, uses in FIELD_HANDLERS:
+                if handler in plan: needed.update(uses)
+        self.plan = [handler for handler, columns, uses in FIELD_HANDLERS if handler in plan]
+        return self.plan
+
+    def compile_layout(self):
+        """Function to fix the columns of the output from each record for the transformation.
+        Profile M has a column for each MARC field which can be included in the output."""
+        if self.profile == 'M': self.layout = list(marc_fields)
+        else: self.layout = list(Output(self.profile).values)
+        self.outputs = []
+        return self.layout
+
+    def new_output(self):
+        """Function to get an empty container for the output from a record, recycling one if possible."""
+        try: return self.outputs.pop()
+        except IndexError: return RecordOutput(self.layout or self.compile_layout())
+
+    def recycle_output(self, output):
+        """Function to return a container to be reused once the output from a record has been written."""
+        output.reset()
+        self.outputs.append(output)
 
-        start_year, end_year = '', ''
+    def convert_record(self, record):
+        """Function to convert a single MARC record to Researcher Format.
+        Once written, the output can be passed to recycle_output() to be reused."""
+        # Records may be shared with other converters, so are copied rather than changed
+        if record.q880 != self.q880:
+            record = copy.copy(record)
+            record.q880 = self.q880
+        output = self.new_output()
 
         if self.profile == 'M':
             # Keep all MARC fields without cleaning
@@ -521,983 +1048,1282 @@ class Converter(object):
 
         else:
             # Keep only selected fields with cleaning
-            mtq = set()
-
-            # LDR
-            # CT    # Content type (from LDR/06)
-            if content_types_ldr.get(record.leader[6]):
-                output.values['CT'].add(content_types_ldr.get(record.leader[6]))
-            # RT    # Type of resource (from LDR/07)
-            if resource_types.get(record.leader[7]):
-                output.values['RT'].add(resource_types.get(record.leader[7]))
-            # EL    # Encoding level (from LDR/17)
-            if encoding_levels.get(record.leader[17]):
-                output.values['EL'].add(encoding_levels.get(record.leader[17]))
-
-            # 001
-            # ID    # BL record ID
-            for field in record.get_fields('001'):
-                if field.data != '':
-                    output.values['ID'].add(clean(field.data))
-
-            # 007
-            # MT    # Material type
-            for field in record.get_fields('007'):
-                if field.data != '' and field.data[0].lower() == 'h':
-                    output.values['MT'].add('Microfilm')
-
-            # 008
-            # PD    # Publication date
-            #       # Serial start and end year
-            # P1    # Publication date one
-            # P2    # Publication date two
-            # PC    # Publication country
-            # LA    # Languages
-            # FC    # Current publication frequency
-            # MF    # Musical form
-            # TA    # Target audience
-            # LF    # Literary form
-
-            for field in record.get_fields('008'):
-
-                try: date = re.sub(r'[^0-9]', '', field.data[7:11])
-                except: pass
-                else:
-                    if len(date) == 4 and date != '9999':
-                        start_year = date
-                        output.values['P1'].add(date)
+            # Only the field handlers needed for the columns in the output are run
+            if self.plan is None: self.compile_plan()
+            for handler in self.plan:
+                getattr(self, handler)(record, output)
 
-                try: date = re.sub(r'[^0-9]', '', field.data[11:15])
-                except: pass
-                else:
-                    if len(date) == 4 and date != '9999':
-                        end_year = date
-                        output.values['P2'].add(date)
-
-                date_type = field.data[6] if len(field.data) >= 6 else 's'
-
-                # Records with a single publication date
-                if date_type in ['e', 'p', 'r', 's', 't']:
-                    if start_year != '':
-                        output.values['PD'].add(start_year)
-
-                # Records with a range of publication dates
-                elif date_type in ['c', 'd', 'i', 'k', 'm', 'q', 'u']:
-                    if start_year != '' and end_year != '':
-                        output.values['PD'].add('{}-{}'.format(start_year, end_year))
-                    elif start_year != '':
-                        output.values['PD'].add('{}-'.format(start_year))
-                    elif end_year != '':
-                        output.values['PD'].add('-{}'.format(end_year))
-
-                try: country = countries.get(re.sub(r'[^a-z]', '', field.data[15:18]), '')
-                except: pass
-                else: output.values['PC'].add(country)
+            # Remove null values from output
+            for item in output.values:
+                if '' in output.values[item]:
+                    output.values[item].remove('')
 
-                if self.profile == 'N':
-                    try: frequency = frequencies.get(re.sub(r'[^a-z]', '', field.data[18]), '')
-                    except: pass
-                    else: output.values['FC'].add(frequency)
+            # Material type qualifier
+            if self.profile not in ['F', 'M', 'N']:
+                if len(output.values['MT']) > 0 and len(output.mtq) > 0 and 'Online resource' in output.values['MT']:
+                    output.values['MT'].remove('Online resource')
+                    output.values['MT'].add('Online resource (' + ' ; '.join(output.mtq) + ')')
 
-                # Target audience and literary form are restricted to monographs only
-                if 'Language material' in output.values['CT'] and 'Monograph' in output.values['RT']:
-                    try: audience = audiences.get(re.sub(r'[^a-z]', '', field.data[22]), '')
-                    except: pass
-                    else: output.values['TA'].add(audience)
+            # Dewey classification should not be empty for BNB/CIP records
+            if self.profile == 'B' and len(output.values['DW']) == 0:
+                output.values['DW'].add('Not yet available')
 
-                    try: literary_form = literary_forms.get(re.sub(r'[^01a-z]', '', field.data[33]), '')
-                    except: pass
-                    else: output.values['LF'].add(literary_form)                
+        return output
+
+    def convert_ldr(self, record, output):
+        # LDR
+        # CT    # Content type (from LDR/06)
+        if content_types_ldr.get(record.leader[6]):
+            output.values['CT'].add(content_types_ldr.get(record.leader[6]))
+        # RT    # Type of resource (from LDR/07)
+        if resource_types.get(record.leader[7]):
+            output.values['RT'].add(resource_types.get(record.leader[7]))
+        # EL    # Encoding level (from LDR/17)
+        if encoding_levels.get(record.leader[17]):
+            output.values['EL'].add(encoding_levels.get(record.leader[17]))
+
+    def convert_001(self, record, output):
+        # 001
+        # ID    # BL record ID
+        for field in record.get_fields('001'):
+            if field.data != '':
+                output.values['ID'].add(clean(field.data))
+
+    def convert_007(self, record, output):
+        # 007
+        # MT    # Material type
+        for field in record.get_fields('007'):
+            if field.data != '' and field.data[0].lower() == 'h':
+                output.values['MT'].add('Microfilm')
+
+    def convert_008(self, record, output):
+        # 008
+        # PD    # Publication date
+        #       # Serial start and end year
+        # P1    # Publication date one
+        # P2    # Publication date two
+        # PC    # Publication country
+        # LA    # Languages
+        # FC    # Current publication frequency
+        # MF    # Musical form
+        # TA    # Target audience
+        # LF    # Literary form
+
+        start_year, end_year = '', ''
+        for field in record.get_fields('008'):
 
-                try: language = languages.get(re.sub(r'[^a-z]', '', field.data[35:38]), '')
+            try: date = re.sub(r'[^0-9]', '', field.data[7:11])
+            except: pass
+            else:
+                if len(date) == 4 and date != '9999':
+                    start_year = date
+                    output.values['P1'].add(date)
+
+            try: date = re.sub(r'[^0-9]', '', field.data[11:15])
+            except: pass
+            else:
+                if len(date) == 4 and date != '9999':
+                    end_year = date
+                    output.values['P2'].add(date)
+
+            date_type = field.data[6] if len(field.data) >= 6 else 's'
+
+            # Records with a single publication date
+            if date_type in ['e', 'p', 'r', 's', 't']:
+                if start_year != '':
+                    output.values['PD'].add(start_year)
+
+            # Records with a range of publication dates
+            elif date_type in ['c', 'd', 'i', 'k', 'm', 'q', 'u']:
+                if start_year != '' and end_year != '':
+                    output.values['PD'].add('{}-{}'.format(start_year, end_year))
+                elif start_year != '':
+                    output.values['PD'].add('{}-'.format(start_year))
+                elif end_year != '':
+                    output.values['PD'].add('-{}'.format(end_year))
+
+            try: country = countries.get(re.sub(r'[^a-z]', '', field.data[15:18]), '')
+            except: pass
+            else: output.values['PC'].add(country)
+
+            if self.profile == 'N':
+                try: frequency = frequencies.get(re.sub(r'[^a-z]', '', field.data[18]), '')
                 except: pass
-                else: output.values['LA'].add(language)
+                else: output.values['FC'].add(frequency)
 
-                if any (s in output.values['CT'] for s in ['c', 'd', 'j']):
-                    try: form = musical_forms.get(re.sub(r'[^a-z]', '', field.data[18:20]), '')
-                    except: pass
-                    else: output.values['MF'].add(form)
+            # Target audience and literary form are restricted to monographs only
+            if 'Language material' in output.values['CT'] and 'Monograph' in output.values['RT']:
+                try: audience = audiences.get(re.sub(r'[^a-z]', '', field.data[22]), '')
+                except: pass
+                else: output.values['TA'].add(audience)
+
+                try: literary_form = literary_forms.get(re.sub(r'[^01a-z]', '', field.data[33]), '')
+                except: pass
+                else: output.values['LF'].add(literary_form)                
 
+            try: language = languages.get(re.sub(r'[^a-z]', '', field.data[35:38]), '')
+            except: pass
+            else: output.values['LA'].add(language)
 
-            # 010
-            # LC    # LC number
-            for field in record.get_fields('010'):
+            if any (s in output.values['CT'] for s in ['c', 'd', 'j']):
+                try: form = musical_forms.get(re.sub(r'[^a-z]', '', field.data[18:20]), '')
+                except: pass
+                else: output.values['MF'].add(form)
+
+        output.start_year, output.end_year = start_year, end_year
+
+    def convert_010(self, record, output):
+        # 010
+        # LC    # LC number
+        for field in record.get_fields('010'):
+            for subfield in field.get_subfields('a'):
+                if subfield != '':
+                    output.values['LC'].add(subfield)
+
+    def convert_015(self, record, output):
+        # 015
+        # BN    # BNB number
+        for field in record.get_fields('015'):
+            if 'bnb' in ' '.join(field.get_subfields('2')).lower():
                 for subfield in field.get_subfields('a'):
                     if subfield != '':
-                        output.values['LC'].add(subfield)
+                        output.values['BN'].add(subfield)
 
-            # 015
-            # BN    # BNB number
-            for field in record.get_fields('015'):
-                if 'bnb' in ' '.join(field.get_subfields('2')).lower():
-                    for subfield in field.get_subfields('a'):
-                        if subfield != '':
-                            output.values['BN'].add(subfield)
-
-            # 019
-            # IO    # India Office?
-            for field in record.get_fields('019'):
-                if field.indicator1 == '2':
-                    for subfield in field.get_subfields('a'):
-                        if subfield[:3].lower() == 'iol':
-                            output.values['IO'].add('Y')
-
-            # 020
-            # IB    # ISBN
-            # PR    # Price
-            # Material type qualifier
-            for field in record.get_fields('020'):
+    def convert_019(self, record, output):
+        # 019
+        # IO    # India Office?
+        for field in record.get_fields('019'):
+            if field.indicator1 == '2':
                 for subfield in field.get_subfields('a'):
-                    subfield = re.sub(r'[^0-9X]', '', subfield.upper())
-                    if is_isbn_10(subfield):
-                        output.values['IB'].add(isbn_convert(subfield))
-                    if is_isbn_13(subfield):
-                        output.values['IB'].add(subfield)
+                    if subfield[:3].lower() == 'iol':
+                        output.values['IO'].add('Y')
 
+    def convert_020(self, record, output):
+        # 020
+        # IB    # ISBN
+        # PR    # Price
+        # Material type qualifier
+        for field in record.get_fields('020'):
+            for subfield in field.get_subfields('a'):
+                subfield = re.sub(r'[^0-9X]', '', subfield.upper())
+                if is_isbn_10(subfield):
+                    output.values['IB'].add(isbn_convert(subfield))
+                if is_isbn_13(subfield):
+                    output.values['IB'].add(subfield)
+
+            for subfield in field.get_subfields('a'):
+                try:
+                    subfield = clean(subfield.split('(')[1].split(')')[0].replace('corrected', ''))
+                except:
+                    pass
+                else:
+                    if subfield.lower() not in 'hbk pbk hardback paperback pack':
+                        output.mtq.add(subfield)
+
+            for subfield in field.get_subfields('c', cleaning=False):
+                # set cleaning=False to avoid stripping $ from prices in dollars
+                subfield = re.sub(r'[^0-9£$\u20AC.]', '', subfield.upper().replace('EUR', u'\u20AC'))
+                if re.sub(r'[^0-9]', '', subfield) != '' and len(subfield) <= 9:
+                    output.values['PR'].add(subfield)
+
+    def convert_022(self, record, output):
+        # 022
+        # IS    # ISSN
+        # IL    # ISSN-L
+        for field in record.get_fields('022'):
+            for subfield in field.get_subfields('a'):
+                subfield = re.sub(r'[^0-9X]', '', subfield.upper())
+                if len(subfield) == 8:
+                    output.values['IS'].add(subfield[:4] + '-' + subfield[4:])
+
+            for subfield in field.get_subfields('l'):
+                subfield = re.sub(r'[^0-9X]', '', subfield.upper())
+                if len(subfield) == 8:
+                    output.values['IL'].add(subfield[:4] + '-' + subfield[4:])
+
+    def convert_024(self, record, output):
+        # 024
+        # IM    # International Standard Music Number (ISMN)
+        # IR    # International Standard Recording Code (ISRC)
+        # IA    # International Article Number (EAN)
+        # OI    # Other Identifier
+        for field in record.get_fields('024'):
+            if field.indicator1 in ['0', '1', '2', '3', '7']:
                 for subfield in field.get_subfields('a'):
-                    try:
-                        subfield = clean(subfield.split('(')[1].split(')')[0].replace('corrected', ''))
-                    except:
-                        pass
-                    else:
-                        if subfield.lower() not in 'hbk pbk hardback paperback pack':
-                            mtq.add(subfield)
-
-                for subfield in field.get_subfields('c', cleaning=False):
-                    # set cleaning=False to avoid stripping $ from prices in dollars
-                    subfield = re.sub(r'[^0-9£$\u20AC.]', '', subfield.upper().replace('EUR', u'\u20AC'))
-                    if re.sub(r'[^0-9]', '', subfield) != '' and len(subfield) <= 9:
-                        output.values['PR'].add(subfield)
-
-            # 022
-            # IS    # ISSN
-            # IL    # ISSN-L
-            for field in record.get_fields('022'):
-                for subfield in field.get_subfields('a'):
-                    subfield = re.sub(r'[^0-9X]', '', subfield.upper())
-                    if len(subfield) == 8:
-                        output.values['IS'].add(subfield[:4] + '-' + subfield[4:])
-
-                for subfield in field.get_subfields('l'):
-                    subfield = re.sub(r'[^0-9X]', '', subfield.upper())
-                    if len(subfield) == 8:
-                        output.values['IL'].add(subfield[:4] + '-' + subfield[4:])
-
-            # 024
-            # IM    # International Standard Music Number (ISMN)
-            # IR    # International Standard Recording Code (ISRC)
-            # IA    # International Article Number (EAN)
-            # OI    # Other Identifier
-            for field in record.get_fields('024'):
-                if field.indicator1 in ['0', '1', '2', '3', '7']:
-                    for subfield in field.get_subfields('a'):
-                        subfield = subfield.strip()
-                        if subfield != '':
-                            if field.indicator1 == '0':
-                                output.values['IR'].add(subfield)
-                            elif field.indicator1 == '2':
-                                output.values['IM'].add(subfield)
-                            elif field.indicator1 == '3':
-                                output.values['IA'].add(subfield)
-                            elif field.indicator1 in ['1', '4', '7']:
-                                output.values['OI'].add(subfield)
-
-            # 028
-            # PN    # Publisher number
-            for field in record.get_fields('028'):
-                for subfield in field.get_subfields('a'):
+                    subfield = subfield.strip()
                     if subfield != '':
-                        output.values['PN'].add(subfield)
-
-            # 034
-            # SC    # Scale
-            # CD    # Coordinates
-            # CA    # Additional notes for cartographic materials
-            for field in record.get_fields('034'):
-                scale = '-'.join(sorted('1:{}'.format(re.sub(r'[^0-9]', '', subfield))
-                                        for subfield in field.get_subfields('b')
-                                        if re.sub(r'[^0-9]', '', subfield) != ''))
-                if scale != '':
-                    output.values['SC'].add(scale)
-                coordinates = ', '.join(field.get_subfields('d', 'e', 'f', 'g', cleaning=False))
-                if coordinates != '':
-                    output.values['CD'].add(coordinates)
-                notes = ''
-                for subfield in field:
-                    if subfield[0] in ['c', 'h', 'j', 'k', 'm', 'n', 'p', 'r', 's', 't', 'x', 'y', 'z'] \
-                            and subfield[1].strip() != '':
-                        notes = add_string({'c': ' Constant ratio linear vertical scale: ',
-                                            'h': ' Angular scale: ',
-                                            'j': ' Declination - northern limit: ',
-                                            'k': ' Declination - southern limit: ',
-                                            'm': 'Right ascension - eastern limit: ',
-                                            'n': 'Right ascension - western limit: ',
-                                            'p': 'Equinox: ',
-                                            'r': 'Distance from earth: ',
-                                            's': 'G-ring latitude: ',
-                                            't': 'G-ring longitude: ',
-                                            'x': 'Beginning date: ',
-                                            'y': 'Ending date: ',
-                                            'z': 'Name of extraterrestrial body: '}[subfield[0]] + subfield[1].strip(),
-                                           notes, '. ')
-                if notes != '':
-                    output.values['CA'].add(notes)
-
-            # 035
-            # ES    # ESTC number
-            # OC    # OCLC number
-            for field in record.get_fields('035'):
-                for subfield in field.get_subfields('a'):
-                    if '(CU-RivES)' in subfield:
-                        output.values['ES'].add(subfield.replace('(CU-RivES)', '').strip())
-                    elif '(OCoLC)' in subfield:
-                        output.values['OC'].add(subfield.replace('(OCoLC)', '').strip())
-
-            # 041
-            # LA    # Languages
-            for field in record.get_fields('041'):
-                for subfield in field.get_subfields('a', 'b', 'd', 'e', 'f', 'g', 'j', 'm'):
-                    if len(subfield) % 3 == 0:
-                        for s in [subfield[i:i+3] for i in range(0, len(subfield), 3)]:
-                            try: s = languages.get(s, '')
-                            except: pass
-                            else:
-                                if s != '':
-                                    output.values['LA'].add(s)
-                for subfield in field.get_subfields('h'):
-                    if len(subfield) % 3 == 0:
-                        for s in [subfield[i:i+3] for i in range(0, len(subfield), 3)]:
-                            try: s = languages.get(s, '')
-                            except: pass
-                            else:
-                                if s != '':
-                                    output.values['LO'].add(s)
-                for subfield in field.get_subfields('k'):
-                    if len(subfield) % 3 == 0:
-                        for s in [subfield[i:i+3] for i in range(0, len(subfield), 3)]:
-                            try: s = languages.get(s, '')
-                            except: pass
-                            else:
-                                if s != '':
-                                    output.values['LI'].add(s)
-
-            # 047
-            # MF    # Musical form
-            for field in record.get_fields('047'):
-                if field.indicator2 == ' ' or 'marcmuscomp' in '|'.join(field.get_subfields('2')):
-                    for subfield in field.get_subfields('a'):
-                        try: subfield = musical_forms.get(subfield, '')
+                        if field.indicator1 == '0':
+                            output.values['IR'].add(subfield)
+                        elif field.indicator1 == '2':
+                            output.values['IM'].add(subfield)
+                        elif field.indicator1 == '3':
+                            output.values['IA'].add(subfield)
+                        elif field.indicator1 in ['1', '4', '7']:
+                            output.values['OI'].add(subfield)
+
+    def convert_028(self, record, output):
+        # 028
+        # PN    # Publisher number
+        for field in record.get_fields('028'):
+            for subfield in field.get_subfields('a'):
+                if subfield != '':
+                    output.values['PN'].add(subfield)
+
+    def convert_034(self, record, output):
+        # 034
+        # SC    # Scale
+        # CD    # Coordinates
+        # CA    # Additional notes for cartographic materials
+        for field in record.get_fields('034'):
+            scale = '-'.join(sorted('1:{}'.format(re.sub(r'[^0-9]', '', subfield))
+                                    for subfield in field.get_subfields('b')
+                                    if re.sub(r'[^0-9]', '', subfield) != ''))
+            if scale != '':
+                output.values['SC'].add(scale)
+            coordinates = ', '.join(field.get_subfields('d', 'e', 'f', 'g', cleaning=False))
+            if coordinates != '':
+                output.values['CD'].add(coordinates)
+            notes = ''
+            for subfield in field:
+                if subfield[0] in ['c', 'h', 'j', 'k', 'm', 'n', 'p', 'r', 's', 't', 'x', 'y', 'z'] \
+                        and subfield[1].strip() != '':
+                    notes = add_string({'c': ' Constant ratio linear vertical scale: ',
+                                        'h': ' Angular scale: ',
+                                        'j': ' Declination - northern limit: ',
+                                        'k': ' Declination - southern limit: ',
+                                        'm': 'Right ascension - eastern limit: ',
+                                        'n': 'Right ascension - western limit: ',
+                                        'p': 'Equinox: ',
+                                        'r': 'Distance from earth: ',
+                                        's': 'G-ring latitude: ',
+                                        't': 'G-ring longitude: ',
+                                        'x': 'Beginning date: ',
+                                        'y': 'Ending date: ',
+                                        'z': 'Name of extraterrestrial body: '}[subfield[0]] + subfield[1].strip(),
+                                       notes, '. ')
+            if notes != '':
+                output.values['CA'].add(notes)
+
+    def convert_035(self, record, output):
+        # 035
+        # ES    # ESTC number
+        # OC    # OCLC number
+        for field in record.get_fields('035'):
+            for subfield in field.get_subfields('a'):
+                if '(CU-RivES)' in subfield:
+                    output.values['ES'].add(subfield.replace('(CU-RivES)', '').strip())
+                elif '(OCoLC)' in subfield:
+                    output.values['OC'].add(subfield.replace('(OCoLC)', '').strip())
+
+    def convert_041(self, record, output):
+        # 041
+        # LA    # Languages
+        for field in record.get_fields('041'):
+            for subfield in field.get_subfields('a', 'b', 'd', 'e', 'f', 'g', 'j', 'm'):
+                if len(subfield) % 3 == 0:
+                    for s in [subfield[i:i+3] for i in range(0, len(subfield), 3)]:
+                        try: s = languages.get(s, '')
                         except: pass
                         else:
-                            if subfield != '':
-                                output.values['MF'].add(subfield)
-
-            # 050
-            # LN    # Library of Congress classification
-            for field in record.get_fields('050'):
-                for subfield in field.get_subfields('a'):
-                    subfield = re.sub(r'[^0-9A-Z.]', '', subfield.upper())
-                    if subfield != '':
-                        output.values['LN'].add(subfield)
-
-            # 082
-            # DW    # Dewey classification
-            for field in record.get_fields('082'):
+                            if s != '':
+                                output.values['LA'].add(s)
+            for subfield in field.get_subfields('h'):
+                if len(subfield) % 3 == 0:
+                    for s in [subfield[i:i+3] for i in range(0, len(subfield), 3)]:
+                        try: s = languages.get(s, '')
+                        except: pass
+                        else:
+                            if s != '':
+                                output.values['LO'].add(s)
+            for subfield in field.get_subfields('k'):
+                if len(subfield) % 3 == 0:
+                    for s in [subfield[i:i+3] for i in range(0, len(subfield), 3)]:
+                        try: s = languages.get(s, '')
+                        except: pass
+                        else:
+                            if s != '':
+                                output.values['LI'].add(s)
+
+    def convert_047(self, record, output):
+        # 047
+        # MF    # Musical form
+        for field in record.get_fields('047'):
+            if field.indicator2 == ' ' or 'marcmuscomp' in '|'.join(field.get_subfields('2')):
                 for subfield in field.get_subfields('a'):
-                    subfield = re.sub(r'[^0-9.]', '', subfield)
-                    if '.' in subfield:
-                        subfield = ('0000' + subfield.split('.', 1)[0])[-3:] + '.' \
-                                   + subfield.split('.')[1].replace('.', '')
-                    output.values['DW'].add(subfield)
-
-            # 100 110 111
-            # AN    # All names
-            # AA    # Name
-            # AD    # Dates
-            # AR    # Role
-            # AT    # Type of name
-            # II    # ISNI
-            # VF    # VIAF
-            for field in record.get_fields('100', '110', '111'):
-                name = get_name_parts(field)
-                output.values['AN'].add(name)
-                if len(output.values['AA']) == 0:
-                    output.values['AA'].add(name[0])
-                    output.values['AD'].add(name[1])
-                    output.values['AT'].add(name[2])
-                    output.values['AR'].add(name[3])
-                    output.values['II'].add(name[4])
-                    output.values['VF'].add(name[5])
-
-            # 130 240
-            # TU    # Uniform title
-            # TV    # Variant titles
-            # ED    # Edition (for newspapers)
-            for field in record.get_fields('130', '240'):
-                title = ''
-                for subfield in field:
-                    code, content = subfield[0], clean(subfield[1])
-                    if code == 'a':
-                        title = add_string(content, title, ' ')
-                    elif code in ['d', 'f', 'r']:
-                        title = add_string(content, title, ', ')
-                    elif code in ['h', 'k', 'l', 'm', 'n', 'o', 'p', 's', 't']:
-                        title = add_string(content, title, '. ')
-                title = quick_clean(title)
-                if title != '':
-                    output.values['TU'].add(title)
-                    output.values['TV'].add(title)
-
-                if self.profile == 'N':
-                    for subfield in field:
-                        code, content = subfield[0], clean_250(subfield[1])
-                        if code in ['f', 'l', 's']:
-                            output.values['ED'].add(content)
-
-            # 222 245 246 247 730 740
-            # TK    # Key title for serials
-            # TT    # Title
-            # TV    # Variant titles
-            # See also 700 $t
-            for field in record.get_fields('222', '245', '246', '247', '730', '740'):
-                title = ''
-                for subfield in field:
-                    code, content = subfield[0], clean(subfield[1])
-                    if code == 'a': title = add_string(content, title, ' ')
-                    elif code == 'b': title = add_string(content, title, ' : ')
-                    elif code in ['n', 'p']: title = add_string(content, title, '. ')
-                title = quick_clean(title)
-                if title != '' and not title.startswith('$u'):
-                    if field.tag == '245':
-                        output.values['TT'].add(title)
-                    elif field.tag == '222':
-                        output.values['TK'].add(title)
-                    output.values['TV'].add(title)
-
-            # 250
-            # ED    # Edition
-            for field in record.get_fields('250'):
-                edition = ''
+                    try: subfield = musical_forms.get(subfield, '')
+                    except: pass
+                    else:
+                        if subfield != '':
+                            output.values['MF'].add(subfield)
+
+    def convert_050(self, record, output):
+        # 050
+        # LN    # Library of Congress classification
+        for field in record.get_fields('050'):
+            for subfield in field.get_subfields('a'):
+                subfield = re.sub(r'[^0-9A-Z.]', '', subfield.upper())
+                if subfield != '':
+                    output.values['LN'].add(subfield)
+
+    def convert_082(self, record, output):
+        # 082
+        # DW    # Dewey classification
+        for field in record.get_fields('082'):
+            for subfield in field.get_subfields('a'):
+                subfield = re.sub(r'[^0-9.]', '', subfield)
+                if '.' in subfield:
+                    subfield = ('0000' + subfield.split('.', 1)[0])[-3:] + '.' \
+                               + subfield.split('.')[1].replace('.', '')
+                output.values['DW'].add(subfield)
+
+    def convert_100(self, record, output):
+        # 100 110 111
+        # AN    # All names
+        # AA    # Name
+        # AD    # Dates
+        # AR    # Role
+        # AT    # Type of name
+        # II    # ISNI
+        # VF    # VIAF
+        for field in record.get_fields('100', '110', '111'):
+            name = get_name_parts(field)
+            output.values['AN'].add(name)
+            if len(output.values['AA']) == 0:
+                output.values['AA'].add(name[0])
+                output.values['AD'].add(name[1])
+                output.values['AT'].add(name[2])
+                output.values['AR'].add(name[3])
+                output.values['II'].add(name[4])
+                output.values['VF'].add(name[5])
+
+    def convert_130(self, record, output):
+        # 130 240
+        # TU    # Uniform title
+        # TV    # Variant titles
+        # ED    # Edition (for newspapers)
+        for field in record.get_fields('130', '240'):
+            title = ''
+            for subfield in field:
+                code, content = subfield[0], clean(subfield[1])
+                if code == 'a':
+                    title = add_string(content, title, ' ')
+                elif code in ['d', 'f', 'r']:
+                    title = add_string(content, title, ', ')
+                elif code in ['h', 'k', 'l', 'm', 'n', 'o', 'p', 's', 't']:
+                    title = add_string(content, title, '. ')
+            title = quick_clean(title)
+            if title != '':
+                output.values['TU'].add(title)
+                output.values['TV'].add(title)
+
+            if self.profile == 'N':
                 for subfield in field:
                     code, content = subfield[0], clean_250(subfield[1])
-                    if code == 'a':
-                        if len(content) >= 2: content = content[0].upper() + content[1:]
-                        edition = add_string(content, edition, ' ')
-                    elif code == 'b':
-                        edition = add_string(content, edition, ', ')
-                edition = quick_clean(edition)
-                if edition != '':
-                    output.values['ED'].add(edition)
-
-            # 254
-            # ED    # Edition
-            for field in record.get_fields('254'):
-                for subfield in field.get_subfields('a'):
-                    if subfield != '':
-                        output.values['ED'].add(subfield)
-
-            # 255
-            # JK    # Projection
-            # CA    # Additional notes for cartographic materials
-            for field in record.get_fields('255'):
-                for subfield in field.get_subfields('a'):
-                    if subfield != '' and 'not given' not in subfield:
-                        output.values['CA'].add(subfield)
-                for subfield in field.get_subfields('b'):
-                    subfield = re.sub(r'(?<![a-z])proj\.?(?![a-z])', 'projection', subfield, flags=re.IGNORECASE)
-                    if subfield != '':
-                        output.values['JK'].add(subfield)
-                for subfield in field.get_subfields('c', cleaning=False):
-                    if subfield != '':
-                        output.values['CA'].add('Coordinates: {}'.format(subfield))
-                for subfield in field:
-                    if subfield[0] in ['d', 'e', 'f', 'g'] and subfield[1] != '':
-                        output.values['CA'].add({'d': 'Zone: ',
-                                                 'e': 'Equinox: ',
-                                                 'f': 'Outer G-ring: ',
-                                                 'g': 'Exclusion G-ring: '}[subfield[0]] + subfield[1])
-
-            # 260 264
-            # PP    # Place of publication
-            # PB    # Publisher
-            # PD    # Publication date
-            # PU    # Publication date (uncleaned)
-            for field in record.get_fields('260', '264'):
-                for subfield in field.get_subfields('a'):
-                    subfield = clean_26X(subfield)
-                    # Test for a date at the end of the subfield
-                    rx = re.compile('(,\s+|^)(©|\u00A9|c)?[0-9\-]{4}[0-9\-]*($|\s*\()')
-                    if rx.search(subfield):
-                        if not quick_clean(rx.search(subfield).group(0)) == '':
-                            output.values['PU'].add(quick_clean(rx.search(subfield).group(0)))
-                            subfield = quick_clean(subfield.replace(rx.search(subfield).group(0), ''))
-
-                    if ':' in subfield:
-                        publishers, states, places = clean_publication_places(subfield.split(':', 1)[0], output.values['PC'])
-                        for item in publishers: output.values['PB'].add(item.strip())
-                        for item in states: output.values['PC'].add(item.strip())
-                        for item in places: output.values['PP'].add(item.strip())
-                        subfield = subfield.split(':', 1)[1]
-                        publishers, states, places = clean_publisher_names(subfield)
-                        for item in publishers: output.values['PB'].add(item.strip())
-                        for item in states: output.values['PC'].add(item.strip())
-                        for item in places: output.values['PP'].add(item.strip())
-                    else:
-                        publishers, states, places = clean_publication_places(subfield, output.values['PC'])
-                        for item in publishers: output.values['PB'].add(item.strip())
-                        for item in states: output.values['PC'].add(item.strip())
-                        for item in places: output.values['PP'].add(item.strip())
-
-                for subfield in field.get_subfields('b'):
-                    subfield = clean_26X(subfield)
+                    if code in ['f', 'l', 's']:
+                        output.values['ED'].add(content)
+
+    def convert_245(self, record, output):
+        # 222 245 246 247 730 740
+        # TK    # Key title for serials
+        # TT    # Title
+        # TV    # Variant titles
+        # See also 700 $t
+        for field in record.get_fields('222', '245', '246', '247', '730', '740'):
+            title = ''
+            for subfield in field:
+                code, content = subfield[0], clean(subfield[1])
+                if code == 'a': title = add_string(content, title, ' ')
+                elif code == 'b': title = add_string(content, title, ' : ')
+                elif code in ['n', 'p']: title = add_string(content, title, '. ')
+            title = quick_clean(title)
+            if title != '' and not title.startswith('$u'):
+                if field.tag == '245':
+                    output.values['TT'].add(title)
+                elif field.tag == '222':
+                    output.values['TK'].add(title)
+                output.values['TV'].add(title)
+
+    def convert_250(self, record, output):
+        # 250
+        # ED    # Edition
+        for field in record.get_fields('250'):
+            edition = ''
+            for subfield in field:
+                code, content = subfield[0], clean_250(subfield[1])
+                if code == 'a':
+                    if len(content) >= 2: content = content[0].upper() + content[1:]
+                    edition = add_string(content, edition, ' ')
+                elif code == 'b':
+                    edition = add_string(content, edition, ', ')
+            edition = quick_clean(edition)
+            if edition != '':
+                output.values['ED'].add(edition)
+
+    def convert_254(self, record, output):
+        # 254
+        # ED    # Edition
+        for field in record.get_fields('254'):
+            for subfield in field.get_subfields('a'):
+                if subfield != '':
+                    output.values['ED'].add(subfield)
+
+    def convert_255(self, record, output):
+        # 255
+        # JK    # Projection
+        # CA    # Additional notes for cartographic materials
+        for field in record.get_fields('255'):
+            for subfield in field.get_subfields('a'):
+                if subfield != '' and 'not given' not in subfield:
+                    output.values['CA'].add(subfield)
+            for subfield in field.get_subfields('b'):
+                subfield = re.sub(r'(?<![a-z])proj\.?(?![a-z])', 'projection', subfield, flags=re.IGNORECASE)
+                if subfield != '':
+                    output.values['JK'].add(subfield)
+            for subfield in field.get_subfields('c', cleaning=False):
+                if subfield != '':
+                    output.values['CA'].add('Coordinates: {}'.format(subfield))
+            for subfield in field:
+                if subfield[0] in ['d', 'e', 'f', 'g'] and subfield[1] != '':
+                    output.values['CA'].add({'d': 'Zone: ',
+                                             'e': 'Equinox: ',
+                                             'f': 'Outer G-ring: ',
+                                             'g': 'Exclusion G-ring: '}[subfield[0]] + subfield[1])
+
+    def convert_260(self, record, output):
+        # 260 264
+        # PP    # Place of publication
+        # PB    # Publisher
+        # PD    # Publication date
+        # PU    # Publication date (uncleaned)
+        for field in record.get_fields('260', '264'):
+            for subfield in field.get_subfields('a'):
+                subfield = clean_26X(subfield)
+                # Test for a date at the end of the subfield
+                rx = re.compile('(,\s+|^)(©|\u00A9|c)?[0-9\-]{4}[0-9\-]*($|\s*\()')
+                if rx.search(subfield):
+                    if not quick_clean(rx.search(subfield).group(0)) == '':
+                        output.values['PU'].add(quick_clean(rx.search(subfield).group(0)))
+                        subfield = quick_clean(subfield.replace(rx.search(subfield).group(0), ''))
+
+                if ':' in subfield:
+                    publishers, states, places = clean_publication_places(subfield.split(':', 1)[0], output.values['PC'])
+                    for item in publishers: output.values['PB'].add(item.strip())
+                    for item in states: output.values['PC'].add(item.strip())
+                    for item in places: output.values['PP'].add(item.strip())
+                    subfield = subfield.split(':', 1)[1]
                     publishers, states, places = clean_publisher_names(subfield)
                     for item in publishers: output.values['PB'].add(item.strip())
                     for item in states: output.values['PC'].add(item.strip())
                     for item in places: output.values['PP'].add(item.strip())
+                else:
+                    publishers, states, places = clean_publication_places(subfield, output.values['PC'])
+                    for item in publishers: output.values['PB'].add(item.strip())
+                    for item in states: output.values['PC'].add(item.strip())
+                    for item in places: output.values['PP'].add(item.strip())
 
-                for subfield in field.get_subfields('c'):
-                    subfield = clean_26X(subfield)
-                    subfield = quick_clean(re.sub(r'[.\[\]?:;]', '', re.sub(r'\[sic\.?\]', '', subfield, flags=re.IGNORECASE)))
-                    if subfield != '':
-                        output.values['PU'].add(subfield)
-                        if RE_YEAR_POST_1500.search(subfield) is not None:
-                            yearlist = RE_YEAR_POST_1500.findall(subfield)
-                            year = RE_YEAR_POST_1500.search(yearlist[-1]).group(1)
-                            if year != '' and len(output.values['PD']) == 0:
-                                output.values['PD'].add(year)
-                        '''
-                        subfield = re.sub(r'[^0-9]', '', subfield)
-                        # Publication date in 260/264 is only used if no date found in 008
-                        if subfield != '' and len(subfield) >= 4 and len(output.values['PD']) == 0:
-                            output.values['PD'].add(subfield[0:4])
-                        '''
-
-            # 263
-            # PJ    # Projected publication date
-            for field in record.get_fields('263'):
-                for subfield in field.get_subfields('a'):
+            for subfield in field.get_subfields('b'):
+                subfield = clean_26X(subfield)
+                publishers, states, places = clean_publisher_names(subfield)
+                for item in publishers: output.values['PB'].add(item.strip())
+                for item in states: output.values['PC'].add(item.strip())
+                for item in places: output.values['PP'].add(item.strip())
+
+            for subfield in field.get_subfields('c'):
+                subfield = clean_26X(subfield)
+                subfield = quick_clean(re.sub(r'[.\[\]?:;]', '', re.sub(r'\[sic\.?\]', '', subfield, flags=re.IGNORECASE)))
+                if subfield != '':
+                    output.values['PU'].add(subfield)
+                    if RE_YEAR_POST_1500.search(subfield) is not None:
+                        yearlist = RE_YEAR_POST_1500.findall(subfield)
+                        year = RE_YEAR_POST_1500.search(yearlist[-1]).group(1)
+                        if year != '' and len(output.values['PD']) == 0:
+                            output.values['PD'].add(year)
+                    '''
                     subfield = re.sub(r'[^0-9]', '', subfield)
-                if len(subfield) == 6:
-                    output.values['PJ'].add(subfield[0:4] + '-' + subfield[4:])
-                elif len(subfield) == 4:
-                    output.values['PJ'].add(subfield)
-
-            # 300
-            # DS    # Physical description
-            for field in record.get_fields('300'):
-                description = clean_300(field)
-                output.values['DS'].add(description)
-
-            # 310 321
-            # FC    # Current publication frequency
-            # FF    # Former publication frequency
-            for field in record.get_fields('310', '321'):
-                frequency = ''
-                dates = set()
-                for subfield in field.get_subfields('a'):
-                    subfield = clean_310(subfield)
-                    frequency = add_string(subfield, frequency, ' ')
-                for subfield in field.get_subfields('b'):
-                    dates.add(get_date_range(subfield))
-                dates = ' ; '.join(dates).replace('- ; -', '-')
-                if len(re.sub(r'[^;]', '', dates)) == 1:
-                    dates = re.sub(r'\s+', ' ', re.sub(r'([^;]*);([^;]*)', r'\2 ; \1', dates)).replace(
-                        '- ; -', '-').strip()
-                dates = quick_clean(dates)
-                if dates != '' and frequency != '':
-                    frequency = add_string('(' + dates + ')', frequency, ' ')
-                if frequency != '':
-                    if field.tag == '310' or self.profile == 'N':
-                        output.values['FC'].add(frequency)
-                    elif field.tag == '321':
-                        output.values['FF'].add(frequency)
-
-            # 336
-            # CT    # Content type
-            # See also end of record processing for values from leader
-            for field in record.get_fields('336'):
-                if 'rdacontent' in ' '.join(field.get_subfields('2')).lower():
-                    for subfield in field.get_subfields('a', 'b'):
-                        if len(subfield) == 3:
-                            subfield = content_types.get(subfield.lower(), '')
-                        else: subfield = subfield.capitalize()
-                        if subfield != '' and subfield in content_types.values():
-                            output.values['CT'].add(subfield)
-
-            # 338
-            # MT    # Material type
-            for field in record.get_fields('338'):
-                if 'rdacarrier' in ' '.join(field.get_subfields('2')).lower():
-                    for subfield in field.get_subfields('a', 'b'):
-                        if len(subfield) == 2:
-                            subfield = material_types.get(subfield.lower(), '')
-                        else:
-                            subfield = subfield.capitalize()
-                            if subfield == 'Online': subfield = 'Online resource'
-                        if subfield != '' and subfield in material_types.values():
-                            output.values['MT'].add(subfield)
-
-            # 362
-            # PG    # Publication date range (for serials)
-            pg = set()
-            for field in record.get_fields('362'):
-                date_range = clean_362(field, start_year, end_year)
-                pg.add(date_range)
-            pg = ' ; '.join(pg).replace('- ; -', '-')
-            if len(re.sub(r'[^;]', '', pg)) == 1:
-                pg = re.sub(r'\s+', ' ', re.sub(r'([^;]*);([^;]*)', r'\2 ; \1', pg)).replace('- ; -', '-').strip()
-            for sub_range in pg.split(';'):
-                output.values['PG'].add(sub_range.strip())
-                output.values['FA'].add(sub_range.strip())
-
-            # 348
-            # MG    # Musical format
-            for field in record.get_fields('348'):
+                    # Publication date in 260/264 is only used if no date found in 008
+                    if subfield != '' and len(subfield) >= 4 and len(output.values['PD']) == 0:
+                        output.values['PD'].add(subfield[0:4])
+                    '''
+
+    def convert_263(self, record, output):
+        # 263
+        # PJ    # Projected publication date
+        for field in record.get_fields('263'):
+            for subfield in field.get_subfields('a'):
+                subfield = re.sub(r'[^0-9]', '', subfield)
+            if len(subfield) == 6:
+                output.values['PJ'].add(subfield[0:4] + '-' + subfield[4:])
+            elif len(subfield) == 4:
+                output.values['PJ'].add(subfield)
+
+    def convert_300(self, record, output):
+        # 300
+        # DS    # Physical description
+        for field in record.get_fields('300'):
+            description = clean_300(field)
+            output.values['DS'].add(description)
+
+    def convert_310(self, record, output):
+        # 310 321
+        # FC    # Current publication frequency
+        # FF    # Former publication frequency
+        for field in record.get_fields('310', '321'):
+            frequency = ''
+            dates = set()
+            for subfield in field.get_subfields('a'):
+                subfield = clean_310(subfield)
+                frequency = add_string(subfield, frequency, ' ')
+            for subfield in field.get_subfields('b'):
+                dates.add(get_date_range(subfield))
+            dates = ' ; '.join(dates).replace('- ; -', '-')
+            if len(re.sub(r'[^;]', '', dates)) == 1:
+                dates = re.sub(r'\s+', ' ', re.sub(r'([^;]*);([^;]*)', r'\2 ; \1', dates)).replace(
+                    '- ; -', '-').strip()
+            dates = quick_clean(dates)
+            if dates != '' and frequency != '':
+                frequency = add_string('(' + dates + ')', frequency, ' ')
+            if frequency != '':
+                if field.tag == '310' or self.profile == 'N':
+                    output.values['FC'].add(frequency)
+                elif field.tag == '321':
+                    output.values['FF'].add(frequency)
+
+    def convert_336(self, record, output):
+        # 336
+        # CT    # Content type
+        # See also end of record processing for values from leader
+        for field in record.get_fields('336'):
+            if 'rdacontent' in ' '.join(field.get_subfields('2')).lower():
+                for subfield in field.get_subfields('a', 'b'):
+                    if len(subfield) == 3:
+                        subfield = content_types.get(subfield.lower(), '')
+                    else: subfield = subfield.capitalize()
+                    if subfield != '' and subfield in content_types.values():
+                        output.values['CT'].add(subfield)
+
+    def convert_338(self, record, output):
+        # 338
+        # MT    # Material type
+        for field in record.get_fields('338'):
+            if 'rdacarrier' in ' '.join(field.get_subfields('2')).lower():
+                for subfield in field.get_subfields('a', 'b'):
+                    if len(subfield) == 2:
+                        subfield = material_types.get(subfield.lower(), '')
+                    else:
+                        subfield = subfield.capitalize()
+                        if subfield == 'Online': subfield = 'Online resource'
+                    if subfield != '' and subfield in material_types.values():
+                        output.values['MT'].add(subfield)
+
+    def convert_362(self, record, output):
+        # 362
+        # PG    # Publication date range (for serials)
+        pg = set()
+        for field in record.get_fields('362'):
+            date_range = clean_362(field, output.start_year, output.end_year)
+            pg.add(date_range)
+        pg = ' ; '.join(pg).replace('- ; -', '-')
+        if len(re.sub(r'[^;]', '', pg)) == 1:
+            pg = re.sub(r'\s+', ' ', re.sub(r'([^;]*);([^;]*)', r'\2 ; \1', pg)).replace('- ; -', '-').strip()
+        for sub_range in pg.split(';'):
+            output.values['PG'].add(sub_range.strip())
+            output.values['FA'].add(sub_range.strip())
+
+    def convert_348(self, record, output):
+        # 348
+        # MG    # Musical format
+        for field in record.get_fields('348'):
+            for subfield in field.get_subfields('a'):
+                if subfield != '':
+                    output.values['MG'].add(subfield)
+
+    def convert_382(self, record, output):
+        # 382
+        # MA    # Additional notes for music
+        for field in record.get_fields('382'):
+            for subfield in field.get_subfields('a'):
+                if subfield != '':
+                    output.values['MG'].add('Medium of performance: {}'.format(subfield))
+            for subfield in field.get_subfields('b'):
+                if subfield != '':
+                    output.values['MG'].add('Soloist: {}'.format(subfield))
+
+    def convert_383(self, record, output):
+        # 383
+        # MA    # Additional notes for music
+        for field in record.get_fields('383'):
+            if quick_clean(str(field)) != '':
+                output.values['MA'].add(quick_clean(str(field)))
+
+    def convert_384(self, record, output):
+        # 384
+        # MA    # Additional notes for music
+        for field in record.get_fields('384'):
+            for subfield in field.get_subfields('a'):
+                if subfield != '':
+                    output.values['MG'].add('Key: {}'.format(subfield))
+
+    def convert_490(self, record, output):
+        # 490
+        # SE    # Series title
+        # SN    # Number within series
+        for field in record.get_fields('490'):
+            title, number = get_series_parts(field)
+            if title != '':
+                output.values['SE'].add(title)
+                if number != '':
+                    number = number + ' [' + title + ']'
+                    output.values['SN'].add(number)
+
+    def convert_500(self, record, output):
+        # 500 515
+        # NN    # Notes
+        for field in record.get_fields('500', '515'):
+            notes = ''
+            for subfield in field.get_subfields('a'):
+                subfield = clean_500(subfield)
+                notes = add_string(subfield, notes, ' ')
+            output.values['NN'].add(notes)
+            if field.tag == '515' and 'micro' not in notes.lower():
+                output.values['FA'].add(notes)
+
+    def convert_505(self, record, output):
+        # 505
+        # CO    # Contents
+        # TV    # Variant titles
+        for field in record.get_fields('505'):
+            contents = ''
+            for subfield in field.get_subfields('a', 'g', 'r', 't'):
+                contents = add_string(subfield, contents, ' ')
+            output.values['CO'].add(contents)
+            for subfield in field.get_subfields('t'):
+                output.values['TV'].add(subfield)
+
+    def convert_510(self, record, output):
+        # 510
+        # RF    # References
+        for field in record.get_fields('510'):
+            references = ''
+            for subfield in field.get_subfields('a', 'b', 'c', 'u', 'x'):
+                subfield = clean_510(subfield)
+                references = add_string(subfield, references, ' ')
+            output.values['RF'].add(references)
+
+    def convert_520(self, record, output):
+        # 520
+        # AB    # Abstract
+        for field in record.get_fields('520'):
+            abstract = ''
+            for subfield in field.get_subfields('a', 'b', 'c'):
+                abstract = add_string(subfield, abstract, ' ')
+            output.values['AB'].add(abstract)
+
+    def convert_546(self, record, output):
+        # 546
+        # NG    # Language notes
+        for field in record.get_fields('546'):
+            notes = ''
+            for subfield in field.get_subfields('3', 'a', 'b'):
+                notes = add_string(subfield, notes, ' ')
+            output.values['NG'].add(notes)
+
+    def convert_561(self, record, output):
+        # 561
+        # PV    # Provenance
+        for field in record.get_fields('561'):
+            if field.indicator1 != '0':  # 1st indicator 0 denotes private notes
                 for subfield in field.get_subfields('a'):
-                    if subfield != '':
-                        output.values['MG'].add(subfield)
+                    output.values['PV'].add(subfield)
+
+    def convert_600(self, record, output):
+        # 600 610 611 630 650 651 653
+        # SU    # Topics
+        # GE    # Genre
+        # G1    # First geographical subject heading
+        # G2    # Subsequent geographical subject headings
+        for field in record.get_fields('600', '610', '611', '630', '650', '651', '653'):
+            topic = get_topic_parts(field)
+            for genre in topic[2]:
+                output.values['GE'].add(genre)
+            topic = topic[0], topic[1]
+            output.values['SU'].add(topic)
+
+    def convert_651(self, record, output):
+        for field in record.get_fields('651'):
+            for subfield in field.get_subfields('a', 'z'):
+                if len(output.values['G1']) == 0:
+                    output.values['G1'].add(subfield)
+                elif subfield not in output.values['G1']:
+                    output.values['G2'].add(subfield)
+                # For newspapers, geographical subject headings
+                # are also used to detect country and place of publication
+                if self.profile == 'N' and len(output.values['PC']) == 0:
+                    for country in countries.values():
+                        if country in subfield: output.values['PC'].add(country)
+                    subfield = subfield.title()
+                    if subfield in PLACES_ENGLAND:
+                        output.values['PC'].add('England')
+                    elif subfield in PLACES_IRELAND:
+                        output.values['PC'].add('Ireland')
+                    elif subfield in PLACES_N_IRELAND:
+                        output.values['PC'].add('Northern Ireland')
+                    elif subfield in PLACES_SCOTLAND:
+                        output.values['PC'].add('Scotland')
+                    elif subfield in PLACES_WALES:
+                        output.values['PC'].add('Wales')
+                    elif subfield in PLACES_US:
+                        output.values['PC'].add('United States of America')
+                    elif 'Great Britain' in subfield:
+                        output.values['PC'].add('United Kingdom')
+                    for city in PLACES:
+                        if city in subfield: output.values['PP'].add(city)
+
+    def convert_648(self, record, output):
+        # 648
+        # SU    # Topics
+        for field in record.get_fields('648'):
+            for subfield in field.get_subfields('a'):
+                topic = subfield, 'chronological term'
+                output.values['SU'].add(topic)
 
-            # 382
-            # MA    # Additional notes for music
-            for field in record.get_fields('382'):
+    def convert_655(self, record, output):
+        # 655
+        # GE    # Genre
+        for field in record.get_fields('655'):
+            for subfield in field.get_subfields('a'):
+                # Check for information about place of publication at the end of the field
+                if '.- ' in subfield:
+                    publishers, states, places = clean_publication_places(subfield.split('.- ', 1)[1], output.values['PC'])
+                    for item in states: output.values['PC'].add(item.strip())
+                    for item in places: output.values['PP'].add(item.strip())
+                subfield = clean_genre(subfield)
+                output.values['GE'].add(subfield)
+
+    def convert_700(self, record, output):
+        # 700 710 711
+        # AN    # All names
+        for field in record.get_fields('700', '710', '711'):
+            name = get_name_parts(field)
+            output.values['AN'].add(name)
+
+    def convert_700_titles(self, record, output):
+        # 700
+        # TV    # Variant titles
+        for field in record.get_fields('700'):
+            for subfield in field.get_subfields('t'):
+                output.values['TV'].add(subfield)
+
+    def convert_752(self, record, output):
+        # 752
+        # CC    # Coverage: Country
+        # CF    # Coverage: Region
+        # CY    # Coverage: City
+        # CG    # Covegage: General
+        # PP    # Place of publication
+        # CL    # Formerly held at Colindale?
+        for field in record.get_fields('752'):
+            if 'blnpn' in ' '.join(field.get_subfields()).lower():
+                place = ''
+                if '2' in field:
+                    output.values['CL'].discard('Maybe')
+                    output.values['CL'].add('Y')
+                # $a - Country or larger entity (R)
                 for subfield in field.get_subfields('a'):
-                    if subfield != '':
-                        output.values['MG'].add('Medium of performance: {}'.format(subfield))
+                    subfield = expand_place_abbreviations(subfield, output.values['PC'])
+                    place = add_string(subfield, place, '--')
+                    output.values['CC'].add(subfield)
+                    if subfield in countries.values(): output.values['PC'].add(subfield)
+                # $b - First-order political jurisdiction (NR)
                 for subfield in field.get_subfields('b'):
-                    if subfield != '':
-                        output.values['MG'].add('Soloist: {}'.format(subfield))
-
-            # 383
-            # MA    # Additional notes for music
-            for field in record.get_fields('383'):
-                if quick_clean(str(field)) != '':
-                    output.values['MA'].add(quick_clean(str(field)))
-
-            # 384
-            # MA    # Additional notes for music
-            for field in record.get_fields('384'):
-                for subfield in field.get_subfields('a'):
-                    if subfield != '':
-                        output.values['MG'].add('Key: {}'.format(subfield))
-
-            # 490
-            # SE    # Series title
-            # SN    # Number within series
-            for field in record.get_fields('490'):
-                title, number = get_series_parts(field)
-                if title != '':
-                    output.values['SE'].add(title)
-                    if number != '':
-                        number = number + ' [' + title + ']'
-                        output.values['SN'].add(number)
-
-            # 500 515
-            # NN    # Notes
-            for field in record.get_fields('500', '515'):
-                notes = ''
+                    subfield = expand_place_abbreviations(subfield, output.values['PC'])
+                    place = add_string(subfield, place, '--')
+                    if place in ['England', 'Ireland', 'Northern Ireland', 'Scotland', 'Wales']:
+                        output.values['CC'].add(subfield)
+                    else:
+                        output.values['CF'].add(subfield)
+                # $c - Intermediate political jurisdiction (R)
+                for subfield in field.get_subfields('c'):
+                    subfield = expand_place_abbreviations(subfield, output.values['PC'])
+                    place = add_string(subfield, place, '--')
+                # $d - City (NR)
+                for subfield in field.get_subfields('d'):
+                    subfield = expand_place_abbreviations(subfield, output.values['PC'])
+                    output.values['CY'].add(subfield)
+                    if subfield in PLACES_ENGLAND:
+                        output.values['PC'].add('England')
+                    elif subfield in PLACES_IRELAND:
+                        output.values['PC'].add('Ireland')
+                    elif subfield in PLACES_N_IRELAND:
+                        output.values['PC'].add('Northern Ireland')
+                    elif subfield in PLACES_SCOTLAND:
+                        output.values['PC'].add('Scotland')
+                    elif subfield in PLACES_WALES:
+                        output.values['PC'].add('Wales')
+                    elif subfield in PLACES_US:
+                        output.values['PC'].add('United States of America')
+                output.values['CG'].add(place)
+            else:
                 for subfield in field.get_subfields('a'):
-                    subfield = clean_500(subfield)
-                    notes = add_string(subfield, notes, ' ')
+                    subfield = expand_place_abbreviations(subfield, output.values['PC'])
+                    if subfield in countries.values(): output.values['PC'].add(subfield)
+                for subfield in field.get_subfields('b', 'c', 'd'):
+                    subfield = expand_place_abbreviations(subfield, output.values['PC'])
+                    output.values['PP'].add(subfield)
+
+    def convert_760(self, record, output):
+        # 760 762 770 772 773 774 775 776
+        # NN    # Additional information for serials
+        for field in record.get_fields('760', '762', '770', '772', '773', '774', '775', '776'):
+            notes = ''
+            preamble = {
+                '760': 'Main series: ',
+                '762': 'Subseries: ',
+                '770': 'Special issue: ',
+                '772': 'Supplement parent: ',
+                '773': 'Host item: ',
+                '774': 'Constituent unit: ',
+                '775': 'Other edition: ',
+                '776': 'Additional physical form: ',
+                '880': '',
+            }[field.tag]
+            for subfield in field.get_subfields('a'):
+                notes = add_string(subfield, notes, ' ')
+            for subfield in field.get_subfields('b', 'c', 'd', 'g', 'h', 'i', 'k', 'm', 'n', 'o', 'r', 's', 't', 'z'):
+                notes = add_string(subfield, notes, '. ')
+            for subfield in field.get_subfields('x'):
+                subfield = re.sub(r'[^0-9xX]', '', subfield)
+                if len(subfield) == 8:
+                    notes = add_string('(ISSN: {}-{})'.format(subfield[:4], subfield[4:]), notes, ' ')
+            if notes != '':
+                notes = preamble + notes
                 output.values['NN'].add(notes)
-                if field.tag == '515' and 'micro' not in notes.lower():
-                    output.values['FA'].add(notes)
-
-            # 505
-            # CO    # Contents
-            # TV    # Variant titles
-            for field in record.get_fields('505'):
-                contents = ''
-                for subfield in field.get_subfields('a', 'g', 'r', 't'):
-                    contents = add_string(subfield, contents, ' ')
-                output.values['CO'].add(contents)
-                for subfield in field.get_subfields('t'):
-                    output.values['TV'].add(subfield)
-
-            # 510
-            # RF    # References
-            for field in record.get_fields('510'):
-                references = ''
-                for subfield in field.get_subfields('a', 'b', 'c', 'u', 'x'):
-                    subfield = clean_510(subfield)
-                    references = add_string(subfield, references, ' ')
-                output.values['RF'].add(references)
-
-            # 520
-            # AB    # Abstract
-            for field in record.get_fields('520'):
-                abstract = ''
-                for subfield in field.get_subfields('a', 'b', 'c'):
-                    abstract = add_string(subfield, abstract, ' ')
-                output.values['AB'].add(abstract)
-
-            # 546
-            # NG    # Language notes
-            for field in record.get_fields('546'):
-                notes = ''
-                for subfield in field.get_subfields('3', 'a', 'b'):
-                    notes = add_string(subfield, notes, ' ')
-                output.values['NG'].add(notes)
-
-            # 561
-            # PV    # Provenance
-            for field in record.get_fields('561'):
-                if field.indicator1 != '0':  # 1st indicator 0 denotes private notes
-                    for subfield in field.get_subfields('a'):
-                        output.values['PV'].add(subfield)
-
-            # 600 610 611 630 650 651 653
-            # SU    # Topics
-            # GE    # Genre
-            # G1    # First geographical subject heading
-            # G2    # Subsequent geographical subject headings
-            for field in record.get_fields('600', '610', '611', '630', '650', '651', '653'):
-                topic = get_topic_parts(field)
-                for genre in topic[2]:
-                    output.values['GE'].add(genre)
-                topic = topic[0], topic[1]
-                output.values['SU'].add(topic)
 
-            for field in record.get_fields('651'):
-                for subfield in field.get_subfields('a', 'z'):
-                    if len(output.values['G1']) == 0:
-                        output.values['G1'].add(subfield)
-                    elif subfield not in output.values['G1']:
-                        output.values['G2'].add(subfield)
-                    # For newspapers, geographical subject headings
-                    # are also used to detect country and place of publication
-                    if self.profile == 'N' and len(output.values['PC']) == 0:
-                        for country in countries.values():
-                            if country in subfield: output.values['PC'].add(country)
-                        subfield = subfield.title()
-                        if subfield in PLACES_ENGLAND:
-                            output.values['PC'].add('England')
-                        elif subfield in PLACES_IRELAND:
-                            output.values['PC'].add('Ireland')
-                        elif subfield in PLACES_N_IRELAND:
-                            output.values['PC'].add('Northern Ireland')
-                        elif subfield in PLACES_SCOTLAND:
-                            output.values['PC'].add('Scotland')
-                        elif subfield in PLACES_WALES:
-                            output.values['PC'].add('Wales')
-                        elif subfield in PLACES_US:
-                            output.values['PC'].add('United States of America')
-                        elif 'Great Britain' in subfield:
-                            output.values['PC'].add('United Kingdom')
-                        for city in PLACES:
-                            if city in subfield: output.values['PP'].add(city)
-
-            # 648
-            # SU    # Topics
-            for field in record.get_fields('648'):
-                for subfield in field.get_subfields('a'):
-                    topic = subfield, 'chronological term'
-                    output.values['SU'].add(topic)
-
-            # 655
-            # GE    # Genre
-            for field in record.get_fields('655'):
-                for subfield in field.get_subfields('a'):
-                    # Check for information about place of publication at the end of the field
-                    if '.- ' in subfield:
-                        publishers, states, places = clean_publication_places(subfield.split('.- ', 1)[1], output.values['PC'])
-                        for item in states: output.values['PC'].add(item.strip())
-                        for item in places: output.values['PP'].add(item.strip())
-                    subfield = clean_genre(subfield)
-                    output.values['GE'].add(subfield)
-
-            # 700 710 711
-            # AN    # All names
-            for field in record.get_fields('700', '710', '711'):
-                name = get_name_parts(field)
-                output.values['AN'].add(name)
-
-            # 700
-            # TV    # Variant titles
-            for field in record.get_fields('700'):
-                for subfield in field.get_subfields('t'):
-                    output.values['TV'].add(subfield)
-
-            # 752
-            # CC    # Coverage: Country
-            # CF    # Coverage: Region
-            # CY    # Coverage: City
-            # CG    # Covegage: General
-            # PP    # Place of publication
-            # CL    # Formerly held at Colindale?
-            for field in record.get_fields('752'):
-                if 'blnpn' in ' '.join(field.get_subfields()).lower():
-                    place = ''
-                    if '2' in field:
-                        output.values['CL'].discard('Maybe')
-                        output.values['CL'].add('Y')
-                    # $a - Country or larger entity (R)
-                    for subfield in field.get_subfields('a'):
-                        subfield = expand_place_abbreviations(subfield, output.values['PC'])
-                        place = add_string(subfield, place, '--')
-                        output.values['CC'].add(subfield)
-                        if subfield in countries.values(): output.values['PC'].add(subfield)
-                    # $b - First-order political jurisdiction (NR)
-                    for subfield in field.get_subfields('b'):
-                        subfield = expand_place_abbreviations(subfield, output.values['PC'])
-                        place = add_string(subfield, place, '--')
-                        if place in ['England', 'Ireland', 'Northern Ireland', 'Scotland', 'Wales']:
-                            output.values['CC'].add(subfield)
-                        else:
-                            output.values['CF'].add(subfield)
-                    # $c - Intermediate political jurisdiction (R)
-                    for subfield in field.get_subfields('c'):
-                        subfield = expand_place_abbreviations(subfield, output.values['PC'])
-                        place = add_string(subfield, place, '--')
-                    # $d - City (NR)
-                    for subfield in field.get_subfields('d'):
-                        subfield = expand_place_abbreviations(subfield, output.values['PC'])
-                        output.values['CY'].add(subfield)
-                        if subfield in PLACES_ENGLAND:
-                            output.values['PC'].add('England')
-                        elif subfield in PLACES_IRELAND:
-                            output.values['PC'].add('Ireland')
-                        elif subfield in PLACES_N_IRELAND:
-                            output.values['PC'].add('Northern Ireland')
-                        elif subfield in PLACES_SCOTLAND:
-                            output.values['PC'].add('Scotland')
-                        elif subfield in PLACES_WALES:
-                            output.values['PC'].add('Wales')
-                        elif subfield in PLACES_US:
-                            output.values['PC'].add('United States of America')
-                    output.values['CG'].add(place)
-                else:
-                    for subfield in field.get_subfields('a'):
-                        subfield = expand_place_abbreviations(subfield, output.values['PC'])
-                        if subfield in countries.values(): output.values['PC'].add(subfield)
-                    for subfield in field.get_subfields('b', 'c', 'd'):
-                        subfield = expand_place_abbreviations(subfield, output.values['PC'])
-                        output.values['PP'].add(subfield)
-
-            # 760 762 770 772 773 774 775 776
-            # NN    # Additional information for serials
-            for field in record.get_fields('760', '762', '770', '772', '773', '774', '775', '776'):
-                notes = ''
+    def convert_780(self, record, output):
+        # 780
+        # NN    # Additional information for serials
+        # S1    # Preceding titles
+        for field in record.get_fields('780'):
+            notes = ''
+            try:
                 preamble = {
-                    '760': 'Main series: ',
-                    '762': 'Subseries: ',
-                    '770': 'Special issue: ',
-                    '772': 'Supplement parent: ',
-                    '773': 'Host item: ',
-                    '774': 'Constituent unit: ',
-                    '775': 'Other edition: ',
-                    '776': 'Additional physical form: ',
-                    '880': '',
-                }[field.tag]
-                for subfield in field.get_subfields('a'):
-                    notes = add_string(subfield, notes, ' ')
-                for subfield in field.get_subfields('b', 'c', 'd', 'g', 'h', 'i', 'k', 'm', 'n', 'o', 'r', 's', 't', 'z'):
-                    notes = add_string(subfield, notes, '. ')
-                for subfield in field.get_subfields('x'):
-                    subfield = re.sub(r'[^0-9xX]', '', subfield)
-                    if len(subfield) == 8:
-                        notes = add_string('(ISSN: {}-{})'.format(subfield[:4], subfield[4:]), notes, ' ')
-                if notes != '':
-                    notes = preamble + notes
-                    output.values['NN'].add(notes)
-
-            # 780
-            # NN    # Additional information for serials
-            # S1    # Preceding titles
-            for field in record.get_fields('780'):
-                notes = ''
-                try:
-                    preamble = {
-                        '0': 'Continues: ',
-                        '1': 'Continues in part: ',
-                        '2': 'Supersedes: ',
-                        '3': 'Supersedes in part: ',
-                        '4': 'Formed by a union of titles including: ',
-                        '5': 'Absorbed: ',
-                        '6': 'Absorbed in part: ',
-                        '7': 'Separated from: ',
-                    }[field.indicator1]
-                except:
-                    preamble = ''
-                for subfield in field.get_subfields('a'):
-                    notes = add_string(subfield, notes, ' ')
-                for subfield in field.get_subfields('b', 'c', 'd', 'g', 'h', 'i', 'k', 'm', 'n', 'o', 'r', 's', 't', 'z'):
-                    notes = add_string(subfield, notes, '. ')
-                for subfield in field.get_subfields('x'):
-                    subfield = re.sub(r'[^0-9xX]', '', subfield)
-                    if len(subfield) == 8:
-                        notes = add_string('(ISSN: {}-{})'.format(subfield[:4], subfield[4:]), notes, ' ')
-                if notes != '':
-                    notes = preamble + notes
-                    output.values['NN'].add(notes)
-                    output.values['S1'].add(notes)
-
-            # 785
-            # NN    # Additional information for serials
-            # S2    # Succeeding titles
-            for field in record.get_fields('785'):
-                notes = ''
-                try:
-                    preamble = {
-                        '0': 'Continued by: ',
-                        '1': 'Continued in part by: ',
-                        '2': 'Superseded by: ',
-                        '3': 'Superseded in part by: ',
-                        '4': 'Absorbed by: ',
-                        '5': 'Absorbed in part by: ',
-                        '6': 'Split into: ',
-                        '7': 'Merged with/to: ',
-                        '8': 'Changed back to: ',
-                    }[field.indicator1]
-                except:
-                    preamble = ''
-                for subfield in field.get_subfields('a'):
-                    notes = add_string(subfield, notes, ' ')
-                for subfield in field.get_subfields('b', 'c', 'd', 'g', 'h', 'i', 'k', 'm', 'n', 'o', 'r', 's', 't', 'z'):
-                    notes = add_string(subfield, notes, '. ')
-                for subfield in field.get_subfields('x'):
-                    subfield = re.sub(r'[^0-9xX]', '', subfield)
-                    if len(subfield) == 8:
-                        notes = add_string('(ISSN: {}-{})'.format(subfield[:4], subfield[4:]), notes, ' ')
-                if notes != '':
-                    notes = preamble + notes
-                    output.values['NN'].add(notes)
-                    output.values['S2'].add(notes)
-
-            # 852 and 979
-            # SM    # Shelfmark
-            # SD    # DSC Shelfmark
-            # SO    # Other Shelfmark
-            # BU    # Burney?
-            # IO    # India Office?
-            for field in record.get_fields('852', '979'):
-                shelfmark = ''
-                if self.profile == 'N':
-                    for subfield in field.get_subfields('b', 'c', 'h', 'j', 'k'):
-                        subfield = clean_852(subfield)
-                        shelfmark = add_string(subfield, shelfmark, ' ')
-                    if 'burney' in shelfmark.lower():
-                        output.values['BU'].add('Y')
-                    if 'IOL' in shelfmark:
-                        output.values['IO'].add('Y')
-                else:
-                    for subfield in field.get_subfields('h', 'j'):
-                        subfield = clean_852(subfield)
-                        shelfmark = add_string(subfield, shelfmark, ' ')
-                output.values['SM'].add(shelfmark)
-                if 'dsc' in ' '.join(field.get_subfields('b')).lower():
-                    output.values['SD'].add(shelfmark)
-                else:
-                    output.values['SO'].add(shelfmark)
-
-            # 856
-            # NL    # Link to digitised resource
-            for field in record.get_fields('856'):
-                for subfield in field.get_subfields('u'):
-                    if 'http://www.britishnewspaperarchive.co.uk' in subfield:
-                        output.values['NL'].add(subfield)
-
-            # 866
-            # HF    # First date held
-            # HL    # Last date held
-            for field in record.get_fields('866'):
-                for subfield in field.get_subfields('a'):
-                    subfield = subfield.replace('.', ' ')
-                    subfield = re.sub(
-                        r'(^newspaper library\s*:?|^newspapers\s*:|[\s\(:\[]*print\s*(copies|issues)?\s*(is|are)?\s*not\s*(made)?\s*available\s*(for\s*conservations?\s*reas[on]*s)?\s*(whe(n|re)\s*(an\s*alternative\s*(format)?\s*(version)?|a\s*micrf?ofilm\s*alternative)\s*exists?)?\.?\]?)',
-                        '', subfield, flags=re.IGNORECASE)
-                    subfield = re.sub(
-                        r'[\s\(see separate record for microfilm holdings|:\[]*(\-*\s*microfilm (is|will be) available (at a later date)?|(see)?\s*all editions microfilm is available for \'kentish express\')[\.:,\)\]]*',
-                        '', subfield, flags=re.IGNORECASE)
-                    subfield = quick_clean(subfield)
-                    if 'micro' not in subfield.lower():
-                        output.values['HA'].add(expand_abbreviations(subfield, plurals=False, case=False))
-                    subfield = re.sub(
-                        r'[\s\(:\[]*(newspapers|newspaper\s*library|(please)?\s*see\s*(also)?\s*sep[ae]rate\s*record\s*for\s*(microfilm|print)\s*holdings|(please)?\s*see\s*(microfilm|print)\s*record|(microfilm|print)\s*holdings\s*only|some\s*issues\s*are\s*held\s*in\s*(microfilm|print)\s*only|(microfilm|print)\s*is\s*available|microfilms?\s*of\s*varied\s*quality\s*with\s*imperfect\s*holdings|for\s*holdings\s*of\s*this\s*title,?\s*(please)?\s*see\s*record|(print|microfilm)\s*for\s*(this\s*title\s*is\s*available\s*on\s*that)\s*for\s*\'[^\']+\'|see\s*\'[^\']+\'\s*(microfilm)?\s*record\s*for\s*(print|microfilm)\s*holdings|for\s*issues\s*(to)?\s*[0-9]{4}\s*(onwards)?,?\s*see\s*(microfilm|print)|ISSN\s*[0-9]{4}\-[0-9]{4})\s*[\.:,\)\]]*',
-                        '', subfield, flags=re.IGNORECASE)
-                    subfield = re.sub(
-                        r'[\s\(:\[]*(all\s*editions\s*microfilm|microfilm\s*will\s*be\s*available\s*at\s*a\s*later\s*date|this\s*record\s*has\s*holdings\s*for\s*both\s*print\s*and\s*microfilm\s*versions|(for)?\s*(earlier|later)?\s*issues\s*(to)?\s*[0-9,\-\s]*\s*(available\s*[io]n|(please)?\s*see)\s*(microfilm|print)\s*(holdings)?)\s*[\.:,\)\]]*',
-                        '', subfield, flags=re.IGNORECASE)
-                    subfield = re.sub(
-                        r'[\s\(:\[]*(n\s*s\s*|(new|original)\s*series|nuova\s*serie|feest\-?nummer|nouvelle\s*s.rie|extra\s*no|no\s*di\s*propaganda|numero\s*(unico|sp.cimen|extraordinario|de\s*reprise)|(centenary\s*souvenir|centennial)\s*number|cyfres\s*newydd|ekstranummer|(pilot|preview|registration)\s*issues?|print|proefnummer|foglio\s*unico|supplement\s*only|sic|see|etc|weekly\s*eds?|extraordinary\s*numbers?)[\.:,\)\]]*',
-                        '', subfield, flags=re.IGNORECASE)
-                    subfield = re.sub(r'(?<![a-z])(no|yr|year|vol)\s+[0-9\-,\s]+', '', subfield, flags=re.IGNORECASE)
-                    subfield = quick_clean(subfield)
-                    (first, last) = get_holdings_years(subfield, start_year, end_year)
-                    output.values['HF'].add(first)
-                    output.values['HL'].add(last)
-
-            # 903, AQN
-            # Check whether there is 903 $9 AQN $a L7 (for newspapers not retained)
-            # 8F    # 852 holdings flag
-            for field in record.get_fields('903'):
-                if '9' in field.subfields:
+                    '0': 'Continues: ',
+                    '1': 'Continues in part: ',
+                    '2': 'Supersedes: ',
+                    '3': 'Supersedes in part: ',
+                    '4': 'Formed by a union of titles including: ',
+                    '5': 'Absorbed: ',
+                    '6': 'Absorbed in part: ',
+                    '7': 'Separated from: ',
+                }[field.indicator1]
+            except:
+                preamble = ''
+            for subfield in field.get_subfields('a'):
+                notes = add_string(subfield, notes, ' ')
+            for subfield in field.get_subfields('b', 'c', 'd', 'g', 'h', 'i', 'k', 'm', 'n', 'o', 'r', 's', 't', 'z'):
+                notes = add_string(subfield, notes, '. ')
+            for subfield in field.get_subfields('x'):
+                subfield = re.sub(r'[^0-9xX]', '', subfield)
+                if len(subfield) == 8:
+                    notes = add_string('(ISSN: {}-{})'.format(subfield[:4], subfield[4:]), notes, ' ')
+            if notes != '':
+                notes = preamble + notes
+                output.values['NN'].add(notes)
+                output.values['S1'].add(notes)
+
+    def convert_785(self, record, output):
+        # 785
+        # NN    # Additional information for serials
+        # S2    # Succeeding titles
+        for field in record.get_fields('785'):
+            notes = ''
+            try:
+                preamble = {
+                    '0': 'Continued by: ',
+                    '1': 'Continued in part by: ',
+                    '2': 'Superseded by: ',
+                    '3': 'Superseded in part by: ',
+                    '4': 'Absorbed by: ',
+                    '5': 'Absorbed in part by: ',
+                    '6': 'Split into: ',
+                    '7': 'Merged with/to: ',
+                    '8': 'Changed back to: ',
+                }[field.indicator1]
+            except:
+                preamble = ''
+            for subfield in field.get_subfields('a'):
+                notes = add_string(subfield, notes, ' ')
+            for subfield in field.get_subfields('b', 'c', 'd', 'g', 'h', 'i', 'k', 'm', 'n', 'o', 'r', 's', 't', 'z'):
+                notes = add_string(subfield, notes, '. ')
+            for subfield in field.get_subfields('x'):
+                subfield = re.sub(r'[^0-9xX]', '', subfield)
+                if len(subfield) == 8:
+                    notes = add_string('(ISSN: {}-{})'.format(subfield[:4], subfield[4:]), notes, ' ')
+            if notes != '':
+                notes = preamble + notes
+                output.values['NN'].add(notes)
+                output.values['S2'].add(notes)
+
+    def convert_852(self, record, output):
+        # 852 and 979
+        # SM    # Shelfmark
+        # SD    # DSC Shelfmark
+        # SO    # Other Shelfmark
+        # BU    # Burney?
+        # IO    # India Office?
+        for field in record.get_fields('852', '979'):
+            shelfmark = ''
+            if self.profile == 'N':
+                for subfield in field.get_subfields('b', 'c', 'h', 'j', 'k'):
+                    subfield = clean_852(subfield)
+                    shelfmark = add_string(subfield, shelfmark, ' ')
+                if 'burney' in shelfmark.lower():
+                    output.values['BU'].add('Y')
+                if 'IOL' in shelfmark:
+                    output.values['IO'].add('Y')
+            else:
+                for subfield in field.get_subfields('h', 'j'):
+                    subfield = clean_852(subfield)
+                    shelfmark = add_string(subfield, shelfmark, ' ')
+            output.values['SM'].add(shelfmark)
+            if 'dsc' in ' '.join(field.get_subfields('b')).lower():
+                output.values['SD'].add(shelfmark)
+            else:
+                output.values['SO'].add(shelfmark)
+
+    def convert_856(self, record, output):
+        # 856
+        # NL    # Link to digitised resource
+        for field in record.get_fields('856'):
+            for subfield in field.get_subfields('u'):
+                if 'http://www.britishnewspaperarchive.co.uk' in subfield:
+                    output.values['NL'].add(subfield)
+
+    def convert_866(self, record, output):
+        # 866
+        # HF    # First date held
+        # HL    # Last date held
+        for field in record.get_fields('866'):
+            for subfield in field.get_subfields('a'):
+                subfield = subfield.replace('.', ' ')
+                subfield = re.sub(
+                    r'(^newspaper library\s*:?|^newspapers\s*:|[\s\(:\[]*print\s*(copies|issues)?\s*(is|are)?\s*not\s*(made)?\s*available\s*(for\s*conservations?\s*reas[on]*s)?\s*(whe(n|re)\s*(an\s*alternative\s*(format)?\s*(version)?|a\s*micrf?ofilm\s*alternative)\s*exists?)?\.?\]?)',
+                    '', subfield, flags=re.IGNORECASE)
+                subfield = re.sub(
+                    r'[\s\(see separate record for microfilm holdings|:\[]*(\-*\s*microfilm (is|will be) available (at a later date)?|(see)?\s*all editions microfilm is available for \'kentish express\')[\.:,\)\]]*',
+                    '', subfield, flags=re.IGNORECASE)
+                subfield = quick_clean(subfield)
+                if 'micro' not in subfield.lower():
+                    output.values['HA'].add(expand_abbreviations(subfield, plurals=False, case=False))
+                subfield = re.sub(
+                    r'[\s\(:\[]*(newspapers|newspaper\s*library|(please)?\s*see\s*(also)?\s*sep[ae]rate\s*record\s*for\s*(microfilm|print)\s*holdings|(please)?\s*see\s*(microfilm|print)\s*record|(microfilm|print)\s*holdings\s*only|some\s*issues\s*are\s*held\s*in\s*(microfilm|print)\s*only|(microfilm|print)\s*is\s*available|microfilms?\s*of\s*varied\s*quality\s*with\s*imperfect\s*holdings|for\s*holdings\s*of\s*this\s*title,?\s*(please)?\s*see\s*record|(print|microfilm)\s*for\s*(this\s*title\s*is\s*available\s*on\s*that)\s*for\s*\'[^\']+\'|see\s*\'[^\']+\'\s*(microfilm)?\s*record\s*for\s*(print|microfilm)\s*holdings|for\s*issues\s*(to)?\s*[0-9]{4}\s*(onwards)?,?\s*see\s*(microfilm|print)|ISSN\s*[0-9]{4}\-[0-9]{4})\s*[\.:,\)\]]*',
+                    '', subfield, flags=re.IGNORECASE)
+                subfield = re.sub(
+                    r'[\s\(:\[]*(all\s*editions\s*microfilm|microfilm\s*will\s*be\s*available\s*at\s*a\s*later\s*date|this\s*record\s*has\s*holdings\s*for\s*both\s*print\s*and\s*microfilm\s*versions|(for)?\s*(earlier|later)?\s*issues\s*(to)?\s*[0-9,\-\s]*\s*(available\s*[io]n|(please)?\s*see)\s*(microfilm|print)\s*(holdings)?)\s*[\.:,\)\]]*',
+                    '', subfield, flags=re.IGNORECASE)
+                subfield = re.sub(
+                    r'[\s\(:\[]*(n\s*s\s*|(new|original)\s*series|nuova\s*serie|feest\-?nummer|nouvelle\s*s.rie|extra\s*no|no\s*di\s*propaganda|numero\s*(unico|sp.cimen|extraordinario|de\s*reprise)|(centenary\s*souvenir|centennial)\s*number|cyfres\s*newydd|ekstranummer|(pilot|preview|registration)\s*issues?|print|proefnummer|foglio\s*unico|supplement\s*only|sic|see|etc|weekly\s*eds?|extraordinary\s*numbers?)[\.:,\)\]]*',
+                    '', subfield, flags=re.IGNORECASE)
+                subfield = re.sub(r'(?<![a-z])(no|yr|year|vol)\s+[0-9\-,\s]+', '', subfield, flags=re.IGNORECASE)
+                subfield = quick_clean(subfield)
+                (first, last) = get_holdings_years(subfield, output.start_year, output.end_year)
+                output.values['HF'].add(first)
+                output.values['HL'].add(last)
+
+    def convert_903(self, record, output):
+        # 903, AQN
+        # Check whether there is 903 $9 AQN $a L7 (for newspapers not retained)
+        # 8F    # 852 holdings flag
+        for field in record.get_fields('903'):
+            if '9' in field.subfields:
+                output.values['8F'].add('L7')
+
+        for field in record.get_fields('AQN'):
+            for subfield in field.get_subfields('a'):
+                if subfield.upper()[:2] == 'L7':
                     output.values['8F'].add('L7')
 
-            for field in record.get_fields('AQN'):
-                for subfield in field.get_subfields('a'):
-                    if subfield.upper()[:2] == 'L7':
-                        output.values['8F'].add('L7')
-
-            if 'L7' not in output.values['8F'] and len(output.values['SM']) > 0:
-                output.values['8F'].add('Y')
-
-            # 907, CAT, 920, LEO
-            # CL    # Formerly held at Colindale?
-            # See also 752
-            for field in record.get_fields('907', 'CAT', '920', 'LEO'):
-                for subfield in field.get_subfields('a'):
-                    if (subfield.upper()[:8] == 'NPL-LOCK' or subfield.upper()[:5] == 'MP35.') \
-                            and 'Y' not in output.values['CL']:
-                        output.values['CL'].add('Maybe')
-
-            # 932, STA, LDD
-            # SX    # Record status
-            for field in record.get_fields('932'):
-                for subfield in field.get_subfields('a'):
-                    subfield = subfield.lower()
-                    output.values['SX'].add(subfield)
-
-            for field in record.get_fields('STA', 'LDD'):
-                for subfield in field.get_subfields():
-                    subfield = subfield.lower().replace('-', '')
-                    output.values['SX'].add(subfield)
-
-            # 944, NID
-            # ND    # NID (Newspaper ID)
-            # NL    # Link to digitised resource
-            for field in record.get_fields('944', 'NID'):
-                for subfield in field.get_subfields('a'):
-                    subfield = re.sub(r'[^0-9]', '', subfield)
-                    output.values['ND'].add(subfield)
-                    if subfield in self.nid_urls:
-                        for item in self.nid_urls[subfield]:
-                            output.values['NL'].add(item)
-
-            # Remove null values from output
-            for item in output.values:
-                if '' in output.values[item]:
-                    output.values[item].remove('')
-            gc.collect()
-
-            # Material type qualifier
-            if self.profile not in ['F', 'M', 'N']:
-                if len(output.values['MT']) > 0 and len(mtq) > 0 and 'Online resource' in output.values['MT']:
-                    output.values['MT'].remove('Online resource')
-                    output.values['MT'].add('Online resource (' + ' ; '.join(mtq) + ')')
+        if 'L7' not in output.values['8F'] and len(output.values['SM']) > 0:
+            output.values['8F'].add('Y')
+
+    def convert_907(self, record, output):
+        # 907, CAT, 920, LEO
+        # CL    # Formerly held at Colindale?
+        # See also 752
+        for field in record.get_fields('907', 'CAT', '920', 'LEO'):
+            for subfield in field.get_subfields('a'):
+                if (subfield.upper()[:8] == 'NPL-LOCK' or subfield.upper()[:5] == 'MP35.') \
+                        and 'Y' not in output.values['CL']:
+                    output.values['CL'].add('Maybe')
+
+    def convert_932(self, record, output):
+        # 932, STA, LDD
+        # SX    # Record status
+        for field in record.get_fields('932'):
+            for subfield in field.get_subfields('a'):
+                subfield = subfield.lower()
+                output.values['SX'].add(subfield)
+
+        for field in record.get_fields('STA', 'LDD'):
+            for subfield in field.get_subfields():
+                subfield = subfield.lower().replace('-', '')
+                output.values['SX'].add(subfield)
+
+    def convert_944(self, record, output):
+        # 944, NID
+        # ND    # NID (Newspaper ID)
+        # NL    # Link to digitised resource
+        for field in record.get_fields('944', 'NID'):
+            for subfield in field.get_subfields('a'):
+                subfield = re.sub(r'[^0-9]', '', subfield)
+                output.values['ND'].add(subfield)
+
+    def write_output(self, output, records, names, titles, topics, classification):
+        """Write the output from converting a record to the output files."""
+        if self.profile == 'F':
+            records.write('"' + '","'.join((' ; '.join(sort_quotes(str(p)) for p in output.values[tag]).strip())
+                                           for tag in output.values) + '"\n')
+
+        elif self.profile == 'M':
+            # Records are spooled until the MARC fields present in all the records are known;
+            # if any record has a STA field, records which are deleted, suppressed or prepublication,
+            # or have no 001, are not written
+            records.write(RowSpool.format_row(
+                OrderedDict((tag, (' ; '.join(sort_quotes(str(p)) for p in output.values[tag]).strip()))
+                            for tag in output.values if output.values[tag]),
+                not (any(s in ''.join(output.values['STA']).lower() for s in
+                         ['deleted', 'suppressed', 'prepublication'])) and len(output.values['001']) > 0))
+
+        elif self.profile == 'N':
+            # Limit to UK, Ireland and current UK dependencies removed 2019-03-20
+            '''if any(s in ' '.join(output.values['PC']).lower() for s in
+                   ['akrotiri', 'alderney', 'anguilla', 'ascension', 'bermuda', 'cayman',
+                    'channel island', 'dhekelia', 'falkland', 'gibraltar', 'guernsey', 'isle of man',
+                    'montserrat', 'pitcairn', 'saint helena', 'sark', 'south georgia', 'south sandwich',
+                    'tristan da cunha', 'turks and caicos', 'britain', 'british', 'united kingdom',
+                    'england', 'wales', 'scotland', 'ireland']) or len(output.values['PC']) == 0:'''
+            # Records must have shelfmarks and not have 'L7' in field AQN $a or 903 $9 (indicated by 8F)
+            if not (any(s in ''.join(output.values['SX']).lower() for s in
+                        ['deleted', 'suppressed', 'prepublication'])) \
+                    and len(output.values['ID']) > 0 and 'Y' in output.values['8F']:
+                # Delimiter for Newspaper records is | but for all other outputs is ;
+                output_string, before = '"', None
+                for v in self.output_fields.values:
+                    if v in output.values and self.output_fields.values[v]:
+                        if v == 'NL' and self.nid_links and output.values['ND']:
+                            # Column is filled by write_deferred_rows()
+                            before, output_string = output_string, '","'
+                            continue
+                        try: output_string += '|'.join(sort_quotes(str(p)) for p in sorted(output.values[v]) if p != '') + '","'
+                        except: print('\nError in newspaper records: {}\n{}\n'.format(v, str(sys.exc_info())))
+                output_string += '\n'
+                if before is not None:
+                    records.write(DeferredRows.format_row(before, output_string, output.values['NL'], output.values['ND']))
+                elif self.nid_links: records.write(DeferredRows.format_row(output_string.replace(',"\n', '\n')))
+                else: records.write(output_string.replace(',"\n', '\n'))
 
-            # Dewey classification should not be empty for BNB/CIP records
-            if self.profile == 'B' and len(output.values['DW']) == 0:
-                output.values['DW'].add('Not yet available')
+        else:
 
-        return output
+            if not (any(s in ''.join(output.values['SX']).lower() for s in
+                        ['deleted', 'suppressed', 'prepublication'])) \
+                    and len(output.values['ID']) > 0 \
+                    and not (len(''.join(output.values['TT'])) <= 5 and len(output.values['AA']) == 0 and len(output.values['PD']) == 0):
+
+                # Columns are formatted once for all the output files,
+                # so that only the leading columns of rows in names, titles, topics and classification are formatted
+                texts = self.format_columns(output)
+
+                if self.file_records:
+                    records.write(('"' + self.join_columns(texts) + '\n').replace(',"\n', '\n'))
+
+                if self.file_names:
+                    # Other names
+                    suffix = (texts['AN'] if 'AN' in texts else self.format_names(output.values['AN'])) + '","' + \
+                             self.join_columns(texts, ['AN', 'AA', 'AD', 'AT', 'AR', 'II', 'VF'])
+                    for item in output.values['AN']:
+                        if item[0] != '':
+                            output_string = '"'
+                            output_string += sort_quotes(item[0]) + '","'  # Name
+                            if item[1] != '': output_string += sort_quotes(item[1])  # Dates associated with name
+                            output_string += '","'
+                            if item[2] != '': output_string += sort_quotes(item[2])  # Type of name
+                            output_string += '","'
+                            if item[3] != '': output_string += sort_quotes(item[3])  # Name role
+                            output_string += '","'
+                            if (self.bnb or self.iams) and self.output_fields.values['II']:
+                                if item[4] != '': output_string += sort_quotes(item[4])  # ISNI
+                                output_string += '","'
+                            if (self.bnb or self.iams) and self.output_fields.values['VF']:
+                                if item[5] != '': output_string += sort_quotes(item[5])  # VIAF
+                                output_string += '","'
+                            output_string += suffix + '\n'
+                            output_string = output_string.replace(',"\n', '\n')
+                            names.write(output_string)
+
+                if self.file_titles:
+                    suffix = self.join_columns(texts, ['TK', 'TT', 'TU', 'TV'])
+                    variants = [(p, sort_quotes(str(p))) for p in sorted(output.values['TV']) if p != '']
+                    for item in output.values['TV']:
+                        output_string = '"' + sort_quotes(item) + '","'
+                        output_string += ' ; '.join(text for p, text in variants if p != item) + '","'
+                        output_string += suffix + '\n'
+                        output_string = output_string.replace(',"\n', '\n')
+                        titles.write(output_string)
+
+                if self.file_topics:
+                    suffix = self.join_columns(texts, ['SU'])
+                    for item in output.values['SU']:
+                        if item[0] != '':
+                            output_string = '"' + sort_quotes(item[0]) + '","'
+                            if item[1] != '': output_string += sort_quotes(item[1])
+                            output_string += '","'
+                            output_string += suffix + '\n'
+                            output_string = output_string.replace(',"\n', '\n')
+                            topics.write(output_string)
+
+                if self.file_classification:
+                    suffix = self.join_columns(texts, ['DW'])
+                    for item in output.values['DW']:
+                        if item != '':
+                            output_string = '"' + sort_quotes(str(item)) + '","'
+                            output_string += suffix + '\n'
+                            output_string = output_string.replace(',"\n', '\n')
+                            classification.write(output_string)
+
+    def format_columns(self, output):
+        """Function to format the text of each column included in the output from a record,
+        to be shared by all the output files.
+        Columns which cannot be formatted are None, and are left out of the output."""
+        texts = OrderedDict()
+        for v in self.output_fields.values:
+            if v in output.values and self.output_fields.values[v]:
+                if v == 'AN': texts[v] = self.format_names(output.values['AN'])
+                elif v == 'SU':
+                    # Topics without a heading are skipped
+                    s = ''
+                    for item in output.values['SU']:
+                        if item[0] != '': s = add_string(str(item[0]), s, ' ; ')
+                    texts[v] = sort_quotes(s)
+                elif v == 'TV':
+                    try:
+                        texts[v] = ' ; '.join(sort_quotes(str(p)) for p in sorted(output.values['TV'])
+                                              if (p != '' and p not in output.values['TT']))
+                    except:
+                        texts[v] = None
+                        print('\nError [please report code 003 to VM]: {}\n'.format(str(sys.exc_info())))
+                else:
+                    try: texts[v] = ' ; '.join(sort_quotes(str(p)) for p in sorted(output.values[v]) if p != '')
+                    except:
+                        texts[v] = None
+                        print('\nError in records: {}\n{}\n'.format(v, str(sys.exc_info())))
+        return texts
+
+    @staticmethod
+    def format_names(names):
+        """Function to format the names from a record, with their dates, roles and identifiers, as a single column."""
+        s = ''
+        for item in names:
+            if item[0] != '':
+                name = item[0]
+                for i in [1, 3, 4, 5]:
+                    if item[i] != '': name += ', ' + item[i]
+                if item[2] != '': name = name + ' [' + item[2] + ']'
+                s = add_string(name, s, ' ; ')
+        return sort_quotes(s)
+
+    @staticmethod
+    def join_columns(texts, exclude=()):
+        """Function to join the text of columns formatted by format_columns(), except those in exclude,
+        each followed by a separator."""
+        return ''.join(texts[v] + '","' for v in texts if v not in exclude and texts[v] is not None)
+
+    def convert_in_workers(self, reader, files, progress, source=None):
+        """Convert all the records from reader in a pool of worker processes, or threads if self.threads > 1,
+        writing the output to files in the order in which the records were read.
+        Threads share the Converter and records without pickling them, and run in parallel
+        while regex matching of MultiRegex and Publishers patterns releases the GIL.
+        Records are taken from source, if specified, instead of directly from reader."""
+        pending = deque()
+        if self.threads > 1: pool = ThreadPool(self.threads, initializer=_init_worker, initargs=(self,))
+        else: pool = multiprocessing.Pool(self.workers, initializer=_init_worker, initargs=(self, True))
+        with pool:
+            chunk, sources = [], []
+            for record in source or reader:
+                chunk.append(record)
+                # File, byte offset and bytes of each record, in case it has to be rejected
+                if self.recover: sources.append((reader.marc_path, reader.record_offset, reader.record_data))
+                if len(chunk) == WORKER_CHUNK_SIZE:
+                    pending.append((pool.apply_async(_convert_records, (chunk,)), sources))
+                    chunk, sources = [], []
+                # Limit the number of records in memory while waiting for earlier chunks to be converted
+                while len(pending) > 2 * max(self.workers, self.threads):
+                    self.write_results(reader, files, progress, *pending.popleft())
+            if chunk: pending.append((pool.apply_async(_convert_records, (chunk,)), sources))
+            while pending:
+                self.write_results(reader, files, progress, *pending.popleft())
+
+    def write_results(self, reader, files, progress, result, sources):
+        """Write the output from a chunk of records converted by _convert_records to files."""
+        results = result.get()
+        for i, texts in enumerate(results):
+            if isinstance(texts, str): reader.reject(sources[i][2], sources[i][1], texts, sources[i][0])
+            else:
+                for file, text in zip(files, texts):
+                    if text: file.write(text)
+        progress.update(len(results))
+
+    def write_spooled_records(self, spool, records):
+        """Write the records spooled during the transformation to the records file for profile M,
+        with a column for each MARC field present in the records."""
+        self.fields_present = {tag: [] for tag in spool.columns}
+        columns = sorted(tag for tag in spool.columns if tag != 'STA')
+        records.write('"' + '","'.join(columns) + '"\n')
+        records.write('"' + '","'.join(marc_fields[tag] for tag in columns) + '"\n')
+        for keep, texts in spool.read(columns):
+            if keep or 'STA' not in spool.columns: records.write('"' + '","'.join(texts) + '"\n')
+
+    def write_deferred_rows(self, spool, records, nid_index):
+        """Write the rows spooled during the transformation to the records file for profile N,
+        adding links to digitised resources from all records with the same NIDs."""
+        def fill(before, after, links, nids):
+            links = set(links)
+            for nid in nids: links.update(nid_index.get(nid))
+            return (before + '|'.join(sort_quotes(str(p)) for p in sorted(links) if p != '') + after).replace(',"\n', '\n')
+        for row in spool.read(fill): records.write(row)
 
     def marc2rf_researcherFormat(self):
+        """Convert MARC records to Researcher Format,
+        applying the garbage collection policy until the conversion is finished.
+        """
+        set_clean_cache_size(self.clean_cache)
+        self.garbage_collector.start()
+        try: self.convert_marc_files()
+        finally: self.garbage_collector.stop()
+        if self.debug:
+            print('Garbage collection policy {}: {} collections'.format(str(self.garbage_collector),
+                                                                       str(self.garbage_collector.collections)))
+
+    def convert_marc_files(self):
         """Convert MARC records to Researcher Format."""
         self.show_header()
-        records, names, titles, topics, classification, mfile = None, None, None, None, None, None
+        records, names, titles, topics, classification, reader, rejects = None, None, None, None, None, None, None
+        # Summary of the progress of each pass through the MARC records, for the stats file
+        stats = OrderedDict()
 
         # Check file locations
-        marc_folder, marc_file, marc_ext = check_file_location(self.marc_path, 'MARC records', '.lex', True)
+        # MARC records may be in a single file, or in several files specified by a folder, glob pattern or manifest
+        marc_paths = find_marc_files(self.marc_path)
+        if len(marc_paths) == 0:
+            exit_prompt('Error: No files of MARC records found at {}'.format(self.marc_path))
+        for marc_path in marc_paths:
+            marc_folder, marc_file, marc_ext = check_file_location(marc_path, 'MARC records', '.lex', True,
+                                                                   COMPRESSION_FORMATS)
+        # Output files are named after the folder or manifest if there are several files of MARC records
+        if marc_paths != [self.marc_path]:
+            if os.path.isdir(self.marc_path): marc_file = os.path.basename(os.path.normpath(self.marc_path))
+            elif os.path.isfile(self.marc_path): marc_file = os.path.splitext(os.path.basename(self.marc_path))[0]
+            else: marc_file = os.path.basename(os.path.dirname(os.path.abspath(self.marc_path)))
+        # Compressed files are decompressed in a background thread if there is a spare CPU
+        background = (os.cpu_count() or 1) > 1
         if self.request_path != '':
             request_folder, request_file, request_ext = check_file_location(self.request_path, 'request message', '.msg', True)
         if self.output_folder != '':
@@ -1514,7 +2340,8 @@ class Converter(object):
         # --------------------
 
         # Display confirmation information about the transformation
-        print('Input file: {}'.format(marc_file + marc_ext))
+        if len(marc_paths) == 1: print('Input file: {}'.format(os.path.basename(marc_paths[0])))
+        else: print('Input files: {} ({} files)'.format(self.marc_path, str(len(marc_paths))))
         if self.request_path != '':
             print('Request message: {}'.format(request_file + request_ext))
         if self.output_folder != '':
@@ -1629,11 +2456,11 @@ class Converter(object):
 
             # FRBRization
             elif self.profile == 'F':
-                q880 = False
+                self.q880 = False
 
             # Using MARC fields as column headers
             elif self.profile == 'M':
-                q880 = False
+                self.q880 = False
 
                 # User chooses whether to include subfield codes
                 print('\n')
@@ -1742,52 +2569,17 @@ class Converter(object):
             classification.write(classification_header)
 
         if self.profile == 'M':
-            records = open(os.path.join(self.output_folder, marc_file + '.csv'), mode='w', encoding='utf-8', errors='replace')
-            # Check which MARC fields are present
-            record_count = 0
-            print('\nChecking which MARC fields are present ...')
-            print('----------------------------------------')
-            print(str(datetime.datetime.now()))
-
-            mfile = open(os.path.join(marc_folder, marc_file + marc_ext), 'rb')
-            reader = MARCReader(mfile)
-            for record in reader:
-                record_count += 1
-                print('\r{0} MARC records processed'.format(str(record_count)), end='\r')
-                for field in record.fields:
-                    if field.tag not in self.fields_present and field.tag in marc_fields:
-                        self.fields_present[field.tag] = []
-            mfile.close()
-            records.write('"' + '","'.join(tag for tag in sorted(self.fields_present) if tag != 'STA') + '"\n')
-            records.write(
-                '"' + '","'.join(marc_fields[tag] for tag in sorted(self.fields_present) if tag != 'STA') + '"\n')
-            print('\n')
-
-        if self.profile == 'N':
-            # Build index of NID identifiers and URLs linking to digitized resources
-            record_count = 0
-            print('\nBuilding NID index ...')
-            print('----------------------------------------')
-            print(str(datetime.datetime.now()))
-
-            mfile = open(os.path.join(marc_folder, marc_file + marc_ext), 'rb')
-            reader = MARCReader(mfile)
-            for record in reader:
-                record_count += 1
-                print('\r{0} MARC records processed'.format(str(record_count)), end='\r')
-
-                # 944, NID
-                # ND    # NID (Newspaper ID)
-                for f1 in record.get_fields('944', 'NID'):
-                    for sa in f1.get_subfields('a'):
-                        sa = re.sub(r'[^0-9]', '', sa)
-                        for f2 in record.get_fields('856'):
-                            if sa not in self.nid_urls: self.nid_urls[sa] = set()
-                            for su in f2.get_subfields('u'):
-                                if 'http://www.britishnewspaperarchive.co.uk' in su:
-                                    self.nid_urls[sa].add(su)
-            mfile.close()
-            print('\n')
+            # The columns depend on which MARC fields are present,
+            # so records are spooled during the transformation and written once it is finished
+            records = RowSpool(self.output_folder)
+
+        nid_index = None
+        self.nid_links = self.profile == 'N' and self.output_fields.values['NL']
+        if self.nid_links:
+            # Links to digitised resources are added to records from all records with the same NIDs,
+            # so rows with NIDs are spooled during the transformation and completed once it is finished
+            nid_index = NIDIndex(self.output_folder, self.nid_memory)
+            records_file, records = records, DeferredRows(self.output_folder)
 
         # --------------------
         # Main transformation
@@ -1798,252 +2590,72 @@ class Converter(object):
         print('----------------------------------------')
         print(str(datetime.datetime.now()))
 
-        record_count = 0
         if self.debug:
-            print('Opening file: {}'.format(str(os.path.join(marc_folder, marc_file + marc_ext))))
-        mfile = open(os.path.join(marc_folder, marc_file + marc_ext), 'rb')
-        reader = MARCReader(mfile)
-        for record in reader:
-            record_count += 1
-            print('\r{0} MARC records processed'.format(str(record_count)), end='\r')
-            output = self.convert_record(record)
-
-            # Write record to output file
-
-            if self.profile == 'F':
-                records.write('"' + '","'.join((' ; '.join(sort_quotes(str(p)) for p in output.values[tag]).strip())
-                                               for tag in output.values) + '"\n')
-
-            elif self.profile == 'M':
-                if 'STA' not in output.values:
-                    records.write('"' + '","'.join((' ; '.join(sort_quotes(str(p)) for p in output.values[tag]).strip())
-                                                   for tag in sorted(output.values)) + '"\n')
-                elif not (any(s in ''.join(output.values['STA']).lower() for s in
-                            ['deleted', 'suppressed', 'prepublication'])) and len(output.values['001']) > 0:
-                    records.write('"' + '","'.join((' ; '.join(sort_quotes(str(p)) for p in output.values[tag]).strip())
-                                                   for tag in sorted(output.values) if tag != 'STA') + '"\n')
-
-            elif self.profile == 'N':
-                # Limit to UK, Ireland and current UK dependencies removed 2019-03-20
-                '''if any(s in ' '.join(output.values['PC']).lower() for s in
-                       ['akrotiri', 'alderney', 'anguilla', 'ascension', 'bermuda', 'cayman',
-                        'channel island', 'dhekelia', 'falkland', 'gibraltar', 'guernsey', 'isle of man',
-                        'montserrat', 'pitcairn', 'saint helena', 'sark', 'south georgia', 'south sandwich',
-                        'tristan da cunha', 'turks and caicos', 'britain', 'british', 'united kingdom',
-                        'england', 'wales', 'scotland', 'ireland']) or len(output.values['PC']) == 0:'''
-                # Records must have shelfmarks and not have 'L7' in field AQN $a or 903 $9 (indicated by 8F)
-                if not (any(s in ''.join(output.values['SX']).lower() for s in
-                            ['deleted', 'suppressed', 'prepublication'])) \
-                        and len(output.values['ID']) > 0 and 'Y' in output.values['8F']:
-                    # Delimiter for Newspaper records is | but for all other outputs is ;
-                    output_string = '"'
-                    for v in self.output_fields.values:
-                        if v in output.values and self.output_fields.values[v]:
-                            try: output_string += '|'.join(sort_quotes(str(p)) for p in sorted(output.values[v]) if p != '') + '","'
-                            except: print('\nError in newspaper records: {}\n{}\n'.format(v, str(sys.exc_info())))
-                    output_string += '\n'
-                    output_string = output_string.replace(',"\n', '\n')
-                    records.write(output_string)
-                    gc.collect()
-
-            else:
+            for marc_path in marc_paths: print('Opening file: {}'.format(str(marc_path)))
+        # Records which are certain to be dropped after conversion are skipped before they are decoded:
+        # all profiles except F and M require a record ID (001),
+        # and profile N also requires a shelfmark (852 or 979, or 880 linked to either)
+        prefilter = None
+        if self.profile == 'N': prefilter = RecordFilter(has_tag('001'), has_tag('852', '979', '880'))
+        elif self.profile not in ['F', 'M']: prefilter = RecordFilter(has_tag('001'))
+        self.compile_layout()
+        if self.profile not in ['F', 'M']:
+            self.compile_plan()
+            if self.debug:
+                print('Fields converted by: {}'.format(', '.join(self.plan)))
+                print('Fields skipped by: {}'.format(', '.join(handler for handler, columns, uses in FIELD_HANDLERS
+                                                                 if handler not in self.plan)))
+        if self.recover:
+            rejects = open(os.path.join(self.output_folder, marc_file + '_rejects.lex'), mode='wb')
+        # Every record is added to the NID index, including records rejected by the prefilter;
+        # records accepted by the prefilter are indexed as they are read, so that they are only decoded once
+        reader = MultiMARCReader(marc_paths, background, memory_map=True, recover=self.recover, reject_target=rejects,
+                                 prefilter=prefilter if nid_index is None else nid_index.filter(prefilter, self.recover))
+        source = reader if nid_index is None else nid_index.index_records(reader, self.recover)
+        progress = Progress(reader)
+        if self.workers > 1 or self.threads > 1:
+            self.convert_in_workers(reader, [records, names, titles, topics, classification], progress, source)
+        else:
+            for record in source:
+                progress.update()
+                if not self.recover: output = self.convert_record(record)
+                else:
+                    try: output = self.convert_record(record)
+                    except Exception as err:
+                        reader.reject(reader.record_data, reader.record_offset, err)
+                        continue
 
-                if not (any(s in ''.join(output.values['SX']).lower() for s in
-                            ['deleted', 'suppressed', 'prepublication'])) \
-                        and len(output.values['ID']) > 0 \
-                        and not (len(''.join(output.values['TT'])) <= 5 and len(output.values['AA']) == 0 and len(output.values['PD']) == 0):
-
-                    if self.file_records:
-                        output_string = '"'
-                        for v in self.output_fields.values:
-                            if v in output.values and self.output_fields.values[v]:
-                                if v == 'AN':
-                                    s = ''
-                                    for item in output.values['AN']:
-                                        if item[0] != '':
-                                            name = item[0]
-                                            for i in [1, 3, 4, 5]:
-                                                if item[i] != '': name += ', ' + item[i]
-                                            if item[2] != '': name = name + ' [' + item[2] + ']'
-                                            s = add_string(name, s, ' ; ')
-                                    output_string += sort_quotes(s) + '","'
-                                elif v == 'SU':
-                                    s = ''
-                                    for item in output.values['SU']:
-                                        if item[0] != '': topic = str(item[0])
-                                        s = add_string(topic, s, ' ; ')
-                                    output_string += sort_quotes(s) + '","'
-                                elif v == 'TV':
-                                    try:
-                                        output_string += ' ; '.join(sort_quotes(str(p)) for p in sorted(output.values['TV'])
-                                                                    if (p != '' and p not in output.values['TT'])) + '","'
-                                    except:
-                                        print('\nError [please report code 003 to VM]: {}\n'.format(str(sys.exc_info())))
-                                else:
-                                    try:
-                                        output_string += ' ; '.join(sort_quotes(str(p)) for p in sorted(output.values[v]) if p != '') + '","'
-                                    except:
-                                        print('\nError in records: {}\n{}\n'.format(v, str(sys.exc_info())))
-
-                        output_string += '\n'
-                        output_string = output_string.replace(',"\n', '\n')
-                        records.write(output_string)
-                        gc.collect()
-
-                    if self.file_names:
-                        for item in output.values['AN']:
-                            if item[0] != '':
-                                output_string = '"'
-                                output_string += sort_quotes(item[0]) + '","'  # Name
-                                if item[1] != '': output_string += sort_quotes(item[1])  # Dates associated with name
-                                output_string += '","'
-                                if item[2] != '': output_string += sort_quotes(item[2])  # Type of name
-                                output_string += '","'
-                                if item[3] != '': output_string += sort_quotes(item[3])  # Name role
-                                output_string += '","'
-                                if (self.bnb or self.iams) and self.output_fields.values['II']:
-                                    if item[4] != '': output_string += sort_quotes(item[4])  # ISNI
-                                    output_string += '","'
-                                if (self.bnb or self.iams) and self.output_fields.values['VF']:
-                                    if item[5] != '': output_string += sort_quotes(item[5])  # VIAF
-                                    output_string += '","'
-                                s = ''
-                                for item2 in output.values['AN']:
-                                    if item2[0] != '':
-                                        name = item2[0]
-                                        for i in [1, 3, 4, 5]:
-                                            if item2[i] != '': name += ', ' + item2[i]
-                                        if item2[2] != '': name = name + ' [' + item2[2] + ']'
-                                        s = add_string(name, s, ' ; ')
-                                output_string += sort_quotes(s) + '","'
-                                for v in self.output_fields.values:
-                                    if v in output.values and self.output_fields.values[v]:
-                                        if v == 'SU':
-                                            s = ''
-                                            for item3 in output.values['SU']:
-                                                if item3[0] != '': topic = str(item3[0])
-                                                s = add_string(topic, s, ' ; ')
-                                            output_string += sort_quotes(s) + '","'
-                                        elif v == 'TV':
-                                            try:
-                                                output_string += ' ; '.join(sort_quotes(str(p)) for p in sorted(output.values['TV'])
-                                                                            if (p != '' and p not in output.values['TT'])) + '","'
-                                            except:
-                                                print('\nError [please report code 004 to VM]: {}\n'.format(str(sys.exc_info())))
-                                        elif v not in ['AN', 'AA', 'AD', 'AT', 'AR', 'II', 'VF']:
-                                            try:
-                                                output_string += ' ; '.join(sort_quotes(str(p)) for p in sorted(output.values[v]) if p != '') + '","'
-                                            except:
-                                                print('\nError in names: {}\n{}\n'.format(v, str(sys.exc_info())))
-                                output_string += '\n'
-                                output_string = output_string.replace(',"\n', '\n')
-                                names.write(output_string)
-
-                    if self.file_titles:
-                        for item in output.values['TV']:
-                            output_string = '"' + sort_quotes(item) + '","'
-                            output_string += ' ; '.join(sort_quotes(str(p)) for p in sorted(output.values['TV']) if p != '' and p != item) + '","'
-                            for v in self.output_fields.values:
-                                if v in output.values and self.output_fields.values[v]:
-                                    if v == 'AN':
-                                        s = ''
-                                        for item2 in output.values['AN']:
-                                            if item2[0] != '':
-                                                name = item2[0]
-                                                for i in [1, 3, 4, 5]:
-                                                    if item2[i] != '': name += ', ' + item2[i]
-                                                if item2[2] != '': name = name + ' [' + item2[2] + ']'
-                                                s = add_string(name, s, ' ; ')
-                                        output_string += sort_quotes(s) + '","'
-                                    elif v == 'SU':
-                                        s = ''
-                                        for item3 in output.values['SU']:
-                                            if item3[0] != '': topic = str(item3[0])
-                                            s = add_string(topic, s, ' ; ')
-                                        output_string += sort_quotes(s) + '","'
-                                    elif v not in ['TK', 'TT', 'TU', 'TV']:
-                                        try:
-                                            output_string += ' ; '.join(sort_quotes(str(p)) for p in sorted(output.values[v]) if p != '') + '","'
-                                        except:
-                                            print('\nError in titles: {}\n{}\n'.format(v, str(sys.exc_info())))
-                            output_string += '\n'
-                            output_string = output_string.replace(',"\n', '\n')
-                            titles.write(output_string)
+                # Write record to output file
+                self.write_output(output, records, names, titles, topics, classification)
+                self.recycle_output(output)
+                self.garbage_collector.record_done()
+        stats['transformation'] = progress.finish()
 
-                    if self.file_topics:
-                        for item in output.values['SU']:
-                            if item[0] != '':
-                                output_string = '"' + sort_quotes(item[0]) + '","'
-                                if item[1] != '': output_string += sort_quotes(item[1])
-                                output_string += '","'
-                                for v in self.output_fields.values:
-                                    if v in output.values and self.output_fields.values[v]:
-                                        if v == 'AN':
-                                            s = ''
-                                            for item2 in output.values['AN']:
-                                                if item2[0] != '':
-                                                    name = item2[0]
-                                                    for i in [1, 3, 4, 5]:
-                                                        if item2[i] != '': name += ', ' + item2[i]
-                                                    if item2[2] != '': name = name + ' [' + item2[2] + ']'
-                                                    s = add_string(name, s, ' ; ')
-                                            output_string += sort_quotes(s) + '","'
-                                        elif v == 'TV':
-                                            try:
-                                                output_string += ' ; '.join(sort_quotes(str(p)) for p in sorted(output.values['TV'])
-                                                                            if (p != '' and p not in output.values['TT'])) + '","'
-                                            except:
-                                                print('\nError [please report code 005 to VM]: {}\n'.format(str(sys.exc_info())))
-                                        elif v not in ['SU']:
-                                            try:
-                                                output_string += ' ; '.join(sort_quotes(str(p)) for p in sorted(output.values[v]) if p != '') + '","'
-                                            except:
-                                                print('\nError in topics: {}\n{}\n'.format(v, str(sys.exc_info())))
-                                output_string += '\n'
-                                output_string = output_string.replace(',"\n', '\n')
-                                topics.write(output_string)
-
-                    if self.file_classification:
-                        for item in output.values['DW']:
-                            if item != '':
-                                output_string = '"' + sort_quotes(str(item)) + '","'
-                                for v in self.output_fields.values:
-                                    if v in output.values and self.output_fields.values[v]:
-                                        if v == 'AN':
-                                            s = ''
-                                            for item2 in output.values['AN']:
-                                                if item2[0] != '':
-                                                    name = item2[0]
-                                                    for i in [1, 3, 4, 5]:
-                                                        if item2[i] != '': name += ', ' + item2[i]
-                                                    if item2[2] != '': name = name + ' [' + item2[2] + ']'
-                                                    s = add_string(name, s, ' ; ')
-                                            output_string += sort_quotes(s) + '","'
-                                        elif v == 'SU':
-                                            s = ''
-                                            for item3 in output.values['SU']:
-                                                if item3[0] != '': topic = str(item3[0])
-                                                s = add_string(topic, s, ' ; ')
-                                            output_string += sort_quotes(s) + '","'
-                                        elif v == 'TV':
-                                            try:
-                                                output_string += ' ; '.join(sort_quotes(str(p)) for p in sorted(output.values['TV'])
-                                                                            if (p != '' and p not in output.values['TT'])) + '","'
-                                            except:
-                                                print('\nError [please report code 006 to VM]: {}\n'.format(str(sys.exc_info())))
-                                        elif v not in ['DW']:
-                                            try:
-                                                output_string += ' ; '.join(sort_quotes(str(p)) for p in sorted(output.values[v]) if p != '') + '","'
-                                            except:
-                                                print('\nError in classification: {}\n{}\n'.format(v, str(sys.exc_info())))
-                                output_string += '\n'
-                                output_string = output_string.replace(',"\n', '\n')
-                                classification.write(output_string)
-
-                    gc.collect()
+        if self.profile == 'M':
+            spool, records = records, open(os.path.join(self.output_folder, marc_file + '.csv'), mode='w',
+                                           encoding='utf-8', errors='replace')
+            stats['spool'] = OrderedDict([('rows', spool.rows), ('bytes', spool.size())])
+            self.write_spooled_records(spool, records)
+            spool.close()
+
+        if self.nid_links:
+            spool, records = records, records_file
+            self.write_deferred_rows(spool, records, nid_index)
+            stats['nid_index'] = nid_index.summary()
+            stats['spool'] = OrderedDict([('rows', spool.rows), ('deferred', spool.deferred), ('bytes', spool.size())])
+            spool.close()
+            nid_index.close()
+
+        if len(marc_paths) > 1:
+            print('\n')
+            for marc_path in reader.counts:
+                print('{0} MARC records processed from {1}'.format(str(reader.counts[marc_path]), marc_path))
+        if prefilter is not None: print('\n{}'.format(str(prefilter)))
+        if self.recover: self.write_rejects(reader, os.path.join(self.output_folder, marc_file + '_rejects'))
+        self.write_stats(os.path.join(self.output_folder, marc_file + '_stats.json'), stats, reader, prefilter)
 
         # Close files
-        for file in [records, names, titles, topics, classification, mfile]:
+        for file in [records, names, titles, topics, classification, reader, rejects, nid_index]:
             try: file.close()
             except: pass
 
@@ -2339,3 +2951,70 @@ class ConfigWriter(object):
                 if os.stat(file).st_size == 0:
                     os.remove(file)
             except: pass
+
+
+# ====================
+#      Functions
+# ====================
+
+# Converter used by each worker process or thread
+_worker_converter = None
+
+
+def _init_worker(converter, process=False):
+    """Function to set up a worker process or thread for Converter.convert_in_workers()"""
+    global _worker_converter
+    _worker_converter = converter
+    # Worker processes apply the garbage collection policy and cache size for themselves, since they may be spawned
+    if process:
+        set_clean_cache_size(converter.clean_cache)
+        converter.garbage_collector.start()
+
+
+def _convert_records(records):
+    """Function to convert records in a worker process or thread.
+    Returns, for each record, the text to write to each output file,
+    or a description of the error if the record could not be converted and records are being rejected."""
+    results = []
+    for record in records:
+        files = [io.StringIO() for i in range(5)]
+        try:
+            output = _worker_converter.convert_record(record)
+            _worker_converter.write_output(output, *files)
+        except Exception as err:
+            if not _worker_converter.recover: raise
+            results.append('{}: {}'.format(type(err).__name__, str(err)))
+        else:
+            _worker_converter.recycle_output(output)
+            results.append([file.getvalue() for file in files])
+        _worker_converter.garbage_collector.record_done()
+    return results
+
+
+def format_bytes(n):
+    """Function to format a number of bytes for display"""
+    for unit in ['bytes', 'KB', 'MB', 'GB']:
+        if n < 1024 or unit == 'GB': break
+        n /= 1024
+    return '{0:.0f} {1}'.format(n, unit) if unit == 'bytes' else '{0:.1f} {1}'.format(n, unit)
+
+
+def format_duration(seconds):
+    """Function to format a number of seconds for display as h:mm:ss"""
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return '{0}:{1:02d}:{2:02d}'.format(hours, minutes, seconds)
+
+
+def get_memory_usage():
+    """Function to get the memory used by the current process in bytes, or None if it cannot be measured"""
+    # Resident memory on Linux
+    try:
+        with open('/proc/self/statm', mode='r') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError): pass
+    # Peak resident memory on other Unix platforms
+    try: import resource
+    except ImportError: return None
+    memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return memory if sys.platform == 'darwin' else memory * 1024
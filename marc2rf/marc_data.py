@@ -3,6 +3,21 @@
 """Classes for MARC records, fields and subfields used in the Researcher Format transformation.
 Code uses elements of https://github.com/edsu/pymarc but with significant modifications."""
 
+# Import required modules
+from array import array
+from collections import OrderedDict
+import bz2
+import glob
+import gzip
+import io
+import lzma
+import mmap
+import os
+import queue
+import struct
+import sys
+import threading
+
 # Import required functions
 from marc2rf.cleaning_functions import clean
 
@@ -16,14 +31,26 @@ __status__ = '4 - Beta Development'
 #     Constants
 # ====================
 
+# Default for whether Record.get_fields() includes 880 fields linked to the requested tags
 q880 = True
 
 LEADER_LEN = 24
 DIRECTORY_ENTRY_LEN = 12
+# Tag, field length and starting character position of a directory entry
+DIRECTORY_ENTRY = struct.Struct('3s4s5s')
 SUBFIELD_INDICATOR = chr(0x1F)
 END_OF_FIELD = chr(0x1E)
 END_OF_RECORD = chr(0x1D)
 ALEPH_CONTROL_FIELDS = ['DB ', 'FMT', 'SYS']
+INDEX_EXT = '.idx'
+INDEX_MAGIC = b'MARCIDX2'
+# Magic, record count, file size, file modification time (ns) and length of the 001 data
+INDEX_HEADER = struct.Struct('<8sQQQQ')
+# Functions to open compressed files of MARC records, by file extension
+COMPRESSION_FORMATS = OrderedDict([('.gz', gzip.open), ('.bz2', bz2.open), ('.xz', lzma.open)])
+READ_BUFFER_SIZE = 1024 * 1024
+# Extension of manifest files listing files of MARC records
+MANIFEST_EXT = '.txt'
 
 # ====================
 #     Exceptions
@@ -54,39 +81,501 @@ class BaseAddressError(Exception):
     def __str__(self): return 'Error locating base address of record'
 
 
+class RecordIndexError(Exception):
+    def __str__(self): return 'Record index is invalid or does not match the file of MARC records'
+
+
 # ====================
 #       Classes
 # ====================
 
 
 class MARCReader(object):
-
-    def __init__(self, marc_target):
+    """A class for reading a file of MARC records.
+
+    :param marc_target: File handle opened in binary mode.
+    :param memory_map: Memory-map the file and pass Record objects memoryview slices of the map,
+        instead of reading each record with separate calls to read().
+        Falls back to reading from the file handle if the file cannot be memory-mapped.
+    :param prefilter: Callable (e.g. a RecordFilter) applied to the raw bytes of each record.
+        Records for which it returns False are skipped without being decoded.
+    :param recover: Instead of raising an error, skip records which cannot be read or decoded
+        by scanning forward to the next END_OF_RECORD character, and continue from there.
+        Skipped records are listed in self.rejects as (byte offset, length, reason).
+    :param reject_target: File handle opened in binary mode, to which the bytes of skipped records are written.
+    """
+
+    def __init__(self, marc_target, memory_map=False, prefilter=None, recover=False, reject_target=None):
         # print(str(marc_target))
         super(MARCReader, self).__init__()
+        self.file_handle, self.map, self.buffer, self.pos, self.stop = None, None, None, 0, None
+        self.prefilter = prefilter
+        self.recover, self.reject_target, self.rejects = recover, reject_target, []
+        # Byte offset of the record most recently read, and its bytes when recovering from errors
+        self.record_offset, self.record_data = None, None
+        # Bytes read from the file handle but not yet consumed, when recovering from errors
+        self.pending = b''
         if hasattr(marc_target, 'read') and callable(marc_target.read):
             self.file_handle = marc_target
+            try: self.pos = self.file_handle.tell()
+            except (AttributeError, OSError, io.UnsupportedOperation): pass
+        # Only files on disk can be mapped; compressed streams may have the file descriptor of the compressed file
+        if memory_map and isinstance(getattr(self.file_handle, 'raw', self.file_handle), io.FileIO):
+            try: self.map = mmap.mmap(self.file_handle.fileno(), 0, access=mmap.ACCESS_READ)
+            except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+                # Empty files and streams without a file descriptor cannot be mapped
+                self.map = None
+            else:
+                self.buffer = memoryview(self.map)
 
     def __iter__(self):
         return self
 
     def close(self):
+        if self.buffer is not None:
+            self.buffer.release()
+            self.buffer = None
+        if self.map is not None:
+            # If records still hold slices of the map, it is closed when they are released
+            try: self.map.close()
+            except BufferError: pass
+            self.map = None
         if self.file_handle:
             self.file_handle.close()
             self.file_handle = None
 
     def __next__(self):
+        while True:
+            data = self.read_raw()
+            if self.prefilter is None or self.prefilter(data):
+                if not self.recover: return Record(data)
+                try: return Record(data)
+                except Exception as err: self.reject(data, self.record_offset, err)
+
+    def read_raw(self):
+        """Return the bytes of the next record without decoding them.
+        Records are returned as memoryview slices if the file is memory-mapped.
+        """
+        if self.recover:
+            self.record_data = self._read_raw_recovering()
+            return self.record_data
+        if self.stop is not None and self.pos >= self.stop: raise StopIteration
+        self.record_offset = self.pos
+        if self.buffer is not None:
+            if self.pos >= len(self.buffer): raise StopIteration
+            first5 = self.buffer[self.pos:self.pos + 5]
+            if len(first5) < 5: raise RecordLengthError
+            record_end = self.pos + int(bytes(first5))
+            data = self.buffer[self.pos:record_end]
+            self.pos = record_end
+            return data
         first5 = self.file_handle.read(5)
         if not first5: raise StopIteration
         if len(first5) < 5: raise RecordLengthError
-        return Record(first5 + self.file_handle.read(int(first5) - 5))
+        data = first5 + self.file_handle.read(int(first5) - 5)
+        self.pos += len(data)
+        return data
+
+    def _read_raw_recovering(self):
+        """Return the bytes of the next record which has a valid length and ends with END_OF_RECORD,
+        skipping anything else up to the next END_OF_RECORD.
+        """
+        while True:
+            if self.stop is not None and self.pos >= self.stop: raise StopIteration
+            self.record_offset = self.pos
+            first5 = self._read(5)
+            if len(first5) == 0: raise StopIteration
+            data, reason = first5, 'Invalid record length'
+            if len(first5) == 5 and bytes(first5).isdigit() and int(bytes(first5)) > LEADER_LEN:
+                self._unread(first5)
+                data = self._read(int(bytes(first5)))
+                if len(data) < int(bytes(first5)): reason = 'Record is truncated'
+                elif data[-1:] == END_OF_RECORD.encode('ascii'): return data
+                else: reason = 'Record length does not match END_OF_RECORD'
+            self._unread(data)
+            self.reject(self._read_to_end_of_record(), self.record_offset, reason)
+
+    def _read(self, n):
+        """Read up to n bytes, starting with any bytes which have been unread."""
+        if self.buffer is not None: data = self.buffer[self.pos:self.pos + n]
+        elif self.pending:
+            data, self.pending = self.pending[:n], self.pending[n:]
+            if len(data) < n: data += self.file_handle.read(n - len(data))
+        else: data = self.file_handle.read(n)
+        self.pos += len(data)
+        return data
+
+    def _unread(self, data):
+        """Push back bytes returned by _read() so that they are read again."""
+        if self.buffer is None: self.pending = bytes(data) + self.pending
+        self.pos -= len(data)
+
+    def _read_to_end_of_record(self):
+        """Read up to and including the next END_OF_RECORD, or to the end of the file."""
+        if self.buffer is not None:
+            end = self.map.find(END_OF_RECORD.encode('ascii'), self.pos)
+            return self._read((len(self.buffer) if end < 0 else end + 1) - self.pos)
+        chunks = []
+        while True:
+            chunk = self._read(io.DEFAULT_BUFFER_SIZE)
+            if len(chunk) == 0: break
+            end = chunk.find(END_OF_RECORD.encode('ascii'))
+            if end >= 0:
+                self._unread(chunk[end + 1:])
+                chunks.append(chunk[:end + 1])
+                break
+            chunks.append(chunk)
+        return b''.join(chunks)
+
+    def reject(self, data, offset, reason):
+        """Record that the bytes of a record at offset could not be read or decoded,
+        and write them to the reject file if there is one.
+        """
+        if isinstance(reason, Exception): reason = '{}: {}'.format(type(reason).__name__, str(reason))
+        self.rejects.append((offset, len(data), reason))
+        if self.reject_target is not None: self.reject_target.write(bytes(data))
+
+    def seek(self, offset, stop=None):
+        """Move to the record starting at byte offset.
+        If stop is specified, iteration ends at the first record starting at or after byte stop.
+        """
+        if self.buffer is None: self.file_handle.seek(offset)
+        self.pos, self.stop, self.pending = offset, stop, b''
+
+    def seek_record(self, index, n, count=None):
+        """Move to record n (counting from 0) using a RecordIndex.
+        If count is specified, iteration ends after count records.
+        """
+        if n >= len(index): self.seek(index.file_size, index.file_size)
+        else: self.seek(*index.byte_range(n, None if count is None else n + count))
+
+    def seek_id(self, index, record_id):
+        """Move to the record with the given 001 using a RecordIndex.
+        Returns False if there is no such record in the index.
+        """
+        n = index.find(record_id)
+        if n is None: return False
+        self.seek_record(index, n)
+        return True
+
+
+class MultiMARCReader(object):
+    """A class for reading several files of MARC records as a single sequence of records.
+
+    :param marc_paths: Paths to files of MARC records, which are read in order.
+    :param background: Decompress compressed files in a background thread.
+    :param kwargs: Keyword arguments passed to MARCReader for each file.
+    """
+
+    def __init__(self, marc_paths, background=False, **kwargs):
+        self.marc_paths, self.background, self.kwargs = list(marc_paths), background, kwargs
+        self.reader, self.marc_path, self.next_path, self.file_handle = None, None, 0, None
+        # Size of each file on disk, for reporting progress
+        self.sizes = []
+        for marc_path in self.marc_paths:
+            try: self.sizes.append(os.path.getsize(marc_path))
+            except OSError: self.sizes.append(0)
+        self.total_bytes = sum(self.sizes)
+        # Number of records read from each file
+        self.counts = OrderedDict((marc_path, 0) for marc_path in self.marc_paths)
+        # Records rejected by MARCReader, as (path, byte offset, length, reason)
+        self.rejects = []
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        while True:
+            if self.reader is None:
+                if self.next_path >= len(self.marc_paths): raise StopIteration
+                self.marc_path = self.marc_paths[self.next_path]
+                self.next_path += 1
+                self.file_handle = open(self.marc_path, 'rb')
+                self.reader = MARCReader(open_marc(self.marc_path, self.background, self.file_handle), **self.kwargs)
+            try: record = next(self.reader)
+            except StopIteration:
+                self.close()
+                continue
+            self.counts[self.marc_path] += 1
+            return record
+
+    @property
+    def record_offset(self):
+        return self.reader.record_offset
+
+    @property
+    def record_data(self):
+        return self.reader.record_data
+
+    @property
+    def bytes_read(self):
+        """Number of bytes of the files read so far, counting compressed files by their compressed size."""
+        if self.reader is None: return sum(self.sizes[:self.next_path])
+        done = sum(self.sizes[:self.next_path - 1])
+        # Position in the compressed file, including any data decompressed ahead of the records read
+        if self.reader.file_handle is not self.file_handle:
+            try: return done + self.file_handle.tell()
+            except (OSError, ValueError): return done
+        return done + self.reader.pos
+
+    def reject(self, data, offset, reason, marc_path=None):
+        """Reject a record read from marc_path, by default the file currently being read."""
+        if self.reader is not None and (marc_path is None or marc_path == self.marc_path):
+            self.reader.reject(data, offset, reason)
+            return
+        # The file has already been closed
+        if marc_path is None: marc_path = self.marc_path
+        if isinstance(reason, Exception): reason = '{}: {}'.format(type(reason).__name__, str(reason))
+        self.rejects.append((marc_path, offset, len(data), reason))
+        if self.kwargs.get('reject_target') is not None: self.kwargs['reject_target'].write(bytes(data))
+
+    def close(self):
+        """Close the file currently being read."""
+        if self.reader is not None:
+            self.rejects.extend((self.marc_path,) + reject for reject in self.reader.rejects)
+            self.reader.close()
+            self.reader = None
+        # Compressed streams do not close the file they were read from
+        if self.file_handle is not None:
+            self.file_handle.close()
+            self.file_handle = None
+
+
+class BackgroundReader(io.RawIOBase):
+    """A stream which reads from another stream in a background thread,
+    so that reading (e.g. decompression) overlaps with processing of the data already read.
+
+    :param source: Stream opened in binary mode.
+    :param chunk_size: Number of bytes read from source at a time.
+    :param read_ahead: Maximum number of chunks read from source before they are needed.
+    """
+
+    def __init__(self, source, chunk_size=READ_BUFFER_SIZE, read_ahead=8):
+        super(BackgroundReader, self).__init__()
+        self.source, self.chunk_size, self.chunk = source, chunk_size, memoryview(b'')
+        self.queue, self.closing = queue.Queue(read_ahead), threading.Event()
+        self.thread = threading.Thread(target=self._fill, daemon=True)
+        self.thread.start()
+
+    def _fill(self):
+        try:
+            while not self.closing.is_set():
+                chunk = self.source.read(self.chunk_size)
+                self._put(chunk)
+                if not chunk: return
+        except Exception as err: self._put(err)
+
+    def _put(self, item):
+        # Stop waiting for space in the queue if the stream is closed
+        while not self.closing.is_set():
+            try: self.queue.put(item, timeout=0.1)
+            except queue.Full: continue
+            else: return
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if self.chunk is None: return 0
+        if len(self.chunk) == 0:
+            chunk = self.queue.get()
+            if isinstance(chunk, Exception):
+                self.chunk = None
+                raise chunk
+            if not chunk:
+                self.chunk = None
+                return 0
+            self.chunk = memoryview(chunk)
+        n = min(len(b), len(self.chunk))
+        b[:n] = self.chunk[:n]
+        self.chunk = self.chunk[n:]
+        return n
+
+    def close(self):
+        if not self.closed:
+            self.closing.set()
+            self.thread.join()
+            self.source.close()
+        super(BackgroundReader, self).close()
+
+
+class RecordIndex(object):
+    """A class for a sidecar index of the byte offsets of records in a file of MARC records.
+    Records can be located by ordinal (counting from 0) or by field 001.
+    The index is saved as MARC_PATH.idx and only needs to be built once per file.
+
+    :param marc_path: Path to file of MARC records.
+    """
+
+    def __init__(self, marc_path):
+        self.marc_path = marc_path
+        self.index_path = marc_path + INDEX_EXT
+        self.file_size, self.file_mtime = 0, 0
+        # Byte offset of each record
+        self.offsets = array('Q')
+        # Control numbers (001) are stored end to end in id_data;
+        # id_starts holds the position of each in id_data, and id_order the ordinals sorted by 001
+        self.id_data = b''
+        self.id_starts = array('Q', [0])
+        self.id_order = array('Q')
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def build(self):
+        """Build the index by scanning the file of MARC records."""
+        ids = []
+        self.offsets = array('Q')
+        # Taken before the scan, so that the index is stale if the file is modified while it is being scanned
+        self.file_mtime = os.stat(self.marc_path).st_mtime_ns
+        reader = MARCReader(open(self.marc_path, 'rb'), memory_map=True)
+        while True:
+            offset = reader.pos
+            try: data = reader.read_raw()
+            except StopIteration: break
+            self.offsets.append(offset)
+            ids.append(get_control_number(data).encode('utf-8'))
+        self.file_size = reader.pos
+        reader.close()
+        self.id_data = b''.join(ids)
+        self.id_starts = array('Q', [0])
+        for i in ids:
+            self.id_starts.append(self.id_starts[-1] + len(i))
+        self.id_order = array('Q', sorted(range(len(ids)), key=ids.__getitem__))
+
+    def save(self):
+        """Write the index to MARC_PATH.idx."""
+        with open(self.index_path, 'wb') as f:
+            f.write(INDEX_HEADER.pack(INDEX_MAGIC, len(self.offsets), self.file_size, self.file_mtime,
+                                       len(self.id_data)))
+            for a in [self.offsets, self.id_starts, self.id_order]:
+                f.write(self._to_little_endian(a).tobytes())
+            f.write(self.id_data)
+
+    def load(self):
+        """Read the index from MARC_PATH.idx.
+        Raises RecordIndexError if the index is invalid or the file of MARC records
+        has changed size or been modified since the index was built.
+        """
+        try:
+            with open(self.index_path, 'rb') as f:
+                magic, count, self.file_size, self.file_mtime, id_length = INDEX_HEADER.unpack(f.read(INDEX_HEADER.size))
+                if magic != INDEX_MAGIC: raise RecordIndexError
+                self.offsets, self.id_starts, self.id_order = array('Q'), array('Q'), array('Q')
+                for a, n in [(self.offsets, count), (self.id_starts, count + 1), (self.id_order, count)]:
+                    a.frombytes(f.read(n * a.itemsize))
+                    if len(a) != n: raise RecordIndexError
+                    self._to_little_endian(a)
+                self.id_data = f.read(id_length)
+        except (OSError, struct.error): raise RecordIndexError
+        if len(self.id_data) != id_length: raise RecordIndexError
+        try: stat = os.stat(self.marc_path)
+        except OSError: raise RecordIndexError
+        if stat.st_size != self.file_size or stat.st_mtime_ns != self.file_mtime: raise RecordIndexError
+        return self
+
+    @staticmethod
+    def _to_little_endian(a):
+        # The index is always saved in little-endian byte order; byteswap() is its own inverse
+        if sys.byteorder == 'big': a.byteswap()
+        return a
+
+    def record_id(self, n):
+        """Return the 001 of record n."""
+        return self.id_data[self.id_starts[n]:self.id_starts[n + 1]].decode('utf-8')
+
+    def offset(self, n):
+        """Return the byte offset of record n."""
+        return self.offsets[n]
+
+    def byte_range(self, start, stop=None):
+        """Return the byte offsets of the start of record start and the end of record stop - 1."""
+        return self.offsets[start], self.file_size if stop is None or stop >= len(self.offsets) else self.offsets[stop]
+
+    def find(self, record_id):
+        """Return the ordinal of the first record with the given 001, or None if there is no such record.
+        Records without a 001 cannot be found.
+        """
+        if not record_id: return None
+        key = record_id.encode('utf-8')
+        lo, hi = 0, len(self.id_order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            n = self.id_order[mid]
+            if self.id_data[self.id_starts[n]:self.id_starts[n + 1]] < key: lo = mid + 1
+            else: hi = mid
+        if lo < len(self.id_order) and self.record_id(self.id_order[lo]) == record_id:
+            return self.id_order[lo]
+        return None
+
+
+class RecordFilter(object):
+    """A class for filtering MARC records on their raw bytes, before they are decoded.
+
+    Each predicate is called with the leader (as a string) and the set of tags in the directory,
+    and a record is rejected by the first predicate which returns False.
+    Records whose leader or directory cannot be read are accepted, so that errors are raised when they are decoded.
+
+    :param predicates: (name, predicate) pairs, such as those returned by has_tag(), lacks_tag() and leader_byte().
+    """
+
+    def __init__(self, *predicates):
+        self.predicates = []
+        self.accepted = 0
+        self.rejected = OrderedDict()
+        for name, predicate in predicates:
+            self.add(name, predicate)
+
+    def __call__(self, marc):
+        try: leader, tags = str(marc[0:LEADER_LEN], 'ascii'), get_directory_tags(marc)
+        except (ValueError, UnicodeDecodeError):
+            self.accepted += 1
+            return True
+        for name, predicate in self.predicates:
+            if not predicate(leader, tags):
+                self.rejected[name] += 1
+                return False
+        self.accepted += 1
+        return True
+
+    def __str__(self):
+        text_list = ['{} records accepted by prefilter'.format(str(self.accepted))]
+        text_list.extend(['{} records rejected by prefilter: {}'.format(str(count), name)
+                          for name, count in self.rejected.items()])
+        return '\n'.join(text_list)
+
+    def add(self, name, predicate):
+        self.predicates.append((name, predicate))
+        self.rejected.setdefault(name, 0)
 
 
 class Record(object):
-    def __init__(self, data='', leader=' ' * LEADER_LEN):
+    """A class for MARC records.
+
+    When a record is decoded from MARC, only the leader and directory are parsed.
+    Each field is decoded the first time it is requested, so fields which are never used
+    are never decoded.
+    Fields are indexed by tag, and 880 fields are also indexed by the tag linked in $6,
+    so get_fields() does not need to scan every field in the record.
+
+    :param q880: Include 880 fields linked to the requested tags in get_fields().
+    """
+
+    __slots__ = ('leader', '_fields', '_tags', '_spans', '_data', '_index', '_linked', 'pos', 'q880')
+
+    def __init__(self, data='', leader=' ' * LEADER_LEN, q880=q880):
         self.leader = '{}22{}4500'.format(leader[0:10], leader[12:20])
-        self.fields = list()
+        # Decoded fields, with None for fields which have not yet been decoded
+        self._fields = list()
+        # Tag of each field, and start and end offsets within self._data packed in pairs
+        self._tags = list()
+        self._spans = array('L')
+        self._data = None
+        # Positions of fields by tag, and of 880 fields by linked tag
+        self._index = dict()
+        self._linked = dict()
         self.pos = 0
+        self.q880 = q880
         if len(data) > 0: self.decode_marc(data)
 
     def __str__(self):
@@ -104,99 +593,181 @@ class Record(object):
         return len(fields) > 0
 
     def __iter__(self):
-        self.__pos = 0
-        return self
-
-    def __next__(self):
-        if self.__pos >= len(self.fields): raise StopIteration
-        self.__pos += 1
-        return self.fields[self.__pos - 1]
+        return iter(self.fields)
+
+    def __copy__(self):
+        # Copies share decoded fields with the original record
+        record = Record.__new__(Record)
+        for slot in self.__slots__: setattr(record, slot, getattr(self, slot))
+        return record
+
+    def __getstate__(self):
+        # Memoryview slices of a memory-mapped file cannot be pickled
+        data = self._data if self._data is None or isinstance(self._data, bytes) else bytes(self._data)
+        return self.leader, self._fields, self._tags, self._spans, data, self._index, self._linked, self.pos, self.q880
+
+    def __setstate__(self, state):
+        self.leader, self._fields, self._tags, self._spans, self._data, self._index, self._linked, self.pos, \
+            self.q880 = state
+
+    @property
+    def fields(self):
+        """List of all the fields in the record, decoding any which have not yet been decoded."""
+        for i, field in enumerate(self._fields):
+            if field is None: self._decode_field(i)
+        return self._fields
 
     def add_field(self, *fields):
-        self.fields.extend(fields)
+        for field in fields:
+            self._add_entry(field.tag, field=field)
+
+    def _add_entry(self, tag, span=None, field=None):
+        self._index.setdefault(tag, []).append(len(self._fields))
+        if tag == '880':
+            linked_tag = self._linked_tag(span) if field is None else str(field['6'])[:3] if '6' in field else None
+            if linked_tag: self._linked.setdefault(linked_tag, []).append(len(self._fields))
+        self._fields.append(field)
+        self._tags.append(tag)
+        self._spans.extend(span or (0, 0))
+
+    def _linked_tag(self, span):
+        """Get the tag linked in the first $6 of an undecoded 880 field."""
+        for subfield in bytes(self._data[span[0]:span[1]]).split(SUBFIELD_INDICATOR.encode('ascii'))[1:]:
+            if subfield[0:1] == b'6':
+                # Subfields which cannot be decoded are skipped when the field is decoded
+                try: return clean(subfield[1:].decode('utf-8', 'strict'))[:3]
+                except UnicodeDecodeError: continue
+        return None
 
     def get_fields(self, *args):
         """
         Returns a list of all the fields in a record with a given tag.
             subjects = record.get_fields('600', '610', '650')
         If no tag is specified a list of all the fields will be returned.
+        Only fields with a requested tag are decoded.
         """
         if len(args) == 0: return self.fields
-        return [f for f in self.fields if (f.tag in args or (q880 and f.tag == '880' and '6' in f and str(f['6'])[:3] in args))]
+        positions = []
+        for tag in args:
+            positions.extend(self._index.get(tag, ()))
+            if self.q880: positions.extend(self._linked.get(tag, ()))
+        if len(args) > 1 or self.q880: positions = sorted(set(positions))
+        return [self._fields[i] if self._fields[i] is not None else self._decode_field(i) for i in positions]
 
     def decode_marc(self, marc):
+        """Decode the leader and directory of a MARC record from bytes,
+        or from a memoryview of a memory-mapped file.
+        Fields are decoded by _decode_field() when they are first requested.
+        """
         # Extract record leader
-        try: self.leader = marc[0:LEADER_LEN].decode('ascii')
+        try: self.leader = str(marc[0:LEADER_LEN], 'ascii')
         except: print('Record has problem with and cannot be processed')
         if len(self.leader) != LEADER_LEN: raise LeaderError
 
         # Extract the byte offset where the record data starts
-        base_address = int(marc[12:17])
+        base_address = int(str(marc[12:17], 'ascii'))
         if base_address <= 0: raise BaseAddressError
         if base_address >= len(marc): raise BaseAddressLengthError
 
         # Extract directory
         # base_address-1 is used since the directory ends with an END_OF_FIELD byte
-        directory = marc[LEADER_LEN:base_address - 1].decode('ascii')
+        directory = bytes(marc[LEADER_LEN:base_address - 1])
 
         # Determine the number of fields in record
         if len(directory) % DIRECTORY_ENTRY_LEN != 0:
             raise DirectoryError
-        field_total = len(directory) / DIRECTORY_ENTRY_LEN
 
-        # Add fields to record using directory offsets
+        # Unpack all the directory entries at once
+        # Malformed directories are parsed entry by entry, which raises the appropriate error
+        try: entries = [(sys.intern(str(entry_tag, 'ascii')), int(entry_length), int(entry_offset))
+                        for entry_tag, entry_length, entry_offset in DIRECTORY_ENTRY.iter_unpack(directory)]
+        except (ValueError, UnicodeDecodeError): entries = self._decode_directory(directory)
+
+        # Record the location of each field using directory offsets
+        # 880 fields are indexed by the tag in $6 without decoding the rest of the field
+        self._data = marc
+        first = len(self._fields)
+        self._fields.extend([None] * len(entries))
+        self._tags.extend(entry[0] for entry in entries)
+        for entry_tag, entry_length, entry_offset in entries:
+            self._spans.extend((base_address + entry_offset, base_address + entry_offset + entry_length - 1))
+        for i in range(first, len(self._fields)):
+            self._index.setdefault(self._tags[i], []).append(i)
+            if self._tags[i] == '880':
+                linked_tag = self._linked_tag((self._spans[2 * i], self._spans[2 * i + 1]))
+                if linked_tag: self._linked.setdefault(linked_tag, []).append(i)
+
+        if len(entries) == 0: raise FieldsError
+
+    @staticmethod
+    def _decode_directory(directory):
+        """Decode the directory of a MARC record entry by entry."""
+        directory = str(directory, 'ascii')
+        field_total = len(directory) // DIRECTORY_ENTRY_LEN
+        entries = []
         field_count = 0
         while field_count < field_total:
             entry_start = field_count * DIRECTORY_ENTRY_LEN
             entry_end = entry_start + DIRECTORY_ENTRY_LEN
             entry = directory[entry_start:entry_end]
-            entry_tag = entry[0:3]
+            entry_tag = sys.intern(entry[0:3])
             entry_length = int(entry[3:7])
             entry_offset = int(entry[7:12])
-            entry_data = marc[base_address + entry_offset:base_address + entry_offset + entry_length - 1]
+            entries.append((entry_tag, entry_length, entry_offset))
+            field_count += 1
+        return entries
 
-            # Check if tag is a control field
-            if str(entry_tag) < '010' and entry_tag.isdigit():
-                field = Field(tag=entry_tag, data=entry_data.decode('utf-8'))
-            elif str(entry_tag) in ALEPH_CONTROL_FIELDS:
-                field = Field(tag=entry_tag, data=entry_data.decode('utf-8'))
+    def _decode_field(self, i):
+        """Decode field i of the record and cache the result."""
+        entry_tag = self._tags[i]
+        entry_data = self._data[self._spans[2 * i]:self._spans[2 * i + 1]]
 
-            else:
-                subfields = list()
-                subs = entry_data.split(SUBFIELD_INDICATOR.encode('ascii'))
-                # Missing indicators are recorded as blank spaces.
-                # Extra indicators are ignored.
-
-                subs[0] = subs[0].decode('ascii') + '  '
-                first_indicator, second_indicator = subs[0][0], subs[0][1]
-
-                for subfield in subs[1:]:
-                    if len(subfield) == 0: continue
-                    try: code, data = subfield[0:1].decode('ascii'), subfield[1:].decode('utf-8', 'strict')
-                    except: print('Error in subfield code')
-                    else:
-                        subfields.append(code)
-                        subfields.append(data)
-                field = Field(
-                    tag=entry_tag,
-                    indicators=[first_indicator, second_indicator],
-                    subfields=subfields,
-                )
-            self.add_field(field)
-            field_count += 1
+        # Check if tag is a control field
+        if str(entry_tag) < '010' and entry_tag.isdigit():
+            field = Field(tag=entry_tag, data=str(entry_data, 'utf-8'))
+        elif str(entry_tag) in ALEPH_CONTROL_FIELDS:
+            field = Field(tag=entry_tag, data=str(entry_data, 'utf-8'))
 
-        if field_count == 0: raise FieldsError
+        else:
+            subfields = list()
+            # bytes() returns bytes input unchanged, and only copies memoryview slices
+            subs = bytes(entry_data).split(SUBFIELD_INDICATOR.encode('ascii'))
+            # Missing indicators are recorded as blank spaces.
+            # Extra indicators are ignored.
+
+            subs[0] = subs[0].decode('ascii') + '  '
+            first_indicator, second_indicator = subs[0][0], subs[0][1]
+
+            for subfield in subs[1:]:
+                if len(subfield) == 0: continue
+                try: code, data = subfield[0:1].decode('ascii'), subfield[1:].decode('utf-8', 'strict')
+                except: print('Error in subfield code')
+                else:
+                    subfields.append(code)
+                    subfields.append(data)
+            field = Field(
+                tag=entry_tag,
+                indicators=(first_indicator, second_indicator),
+                subfields=subfields,
+            )
+        self._fields[i] = field
+        return field
 
 
 class Field(object):
+    """A class representing a MARC field.
+    Subfields are held as a tuple of alternating subfield codes and values.
+    """
+
+    __slots__ = ('tag', 'data', 'indicator1', 'indicator2', 'indicators', 'subfields')
 
     def __init__(self, tag, indicators=None, subfields=None, data=''):
-        if indicators is None: indicators = []
-        if subfields is None: subfields = []
-        indicators = [str(x) for x in indicators]
+        if indicators is None: indicators = ()
+        if subfields is None: subfields = ()
+        indicators = tuple(str(x) for x in indicators)
 
         # Normalize tag to three digits
-        self.tag = '%03s' % tag
+        self.tag = sys.intern('%03s' % tag)
 
         # Check if tag is a control field
         if self.tag < '010' and self.tag.isdigit():
@@ -205,11 +776,13 @@ class Field(object):
             self.data = str(data)
         else:
             self.indicator1, self.indicator2 = self.indicators = indicators
-            self.subfields = subfields
+            self.subfields = tuple(subfields)
 
     def __iter__(self):
-        self.__pos = 0
-        return self
+        """Iterate over (code, value) pairs; control fields have no subfields."""
+        if not hasattr(self, 'subfields'): return iter(())
+        subfields = iter(self.subfields)
+        return zip(subfields, subfields)
 
     def __str__(self):
         if self.is_control_field() or self.tag in ALEPH_CONTROL_FIELDS:
@@ -235,15 +808,6 @@ class Field(object):
         subfields = self.get_subfields(subfield)
         return len(subfields) > 0
 
-    def __next__(self):
-        if not hasattr(self, 'subfields'):
-            raise StopIteration
-        while self.__pos < len(self.subfields):
-            subfield = (self.subfields[self.__pos], self.subfields[self.__pos + 1])
-            self.__pos += 2
-            return subfield
-        raise StopIteration
-
     def get_subfields(self, *codes, cleaning=True):
         """Accepts one or more subfield codes and returns a list of subfield values
         Subfields are cleaned unless clean=False (may be useful for subfields containing URLs)
@@ -259,3 +823,94 @@ class Field(object):
         if self.tag < '010' and self.tag.isdigit(): return True
         if self.tag in ALEPH_CONTROL_FIELDS: return True
         return False
+
+
+# ====================
+#      Functions
+# ====================
+
+
+def find_marc_files(marc_path):
+    """Function to list the files of MARC records specified by marc_path, which may be:
+        a file of MARC records;
+        a folder, in which case all the .lex files in it (including compressed .lex files) are listed;
+        a glob pattern such as records/*.lex;
+        a manifest (.txt file) listing paths to files of MARC records, one per line,
+        relative to the folder containing the manifest. Blank lines and lines starting with # are ignored.
+    """
+    if os.path.isdir(marc_path):
+        return sorted(os.path.join(marc_path, file) for file in os.listdir(marc_path)
+                      if os.path.isfile(os.path.join(marc_path, file)) and is_marc_file(file))
+    if glob.has_magic(marc_path):
+        return sorted(file for file in glob.glob(marc_path) if os.path.isfile(file))
+    if os.path.splitext(marc_path)[1].lower() == MANIFEST_EXT:
+        marc_paths = []
+        with open(marc_path, mode='r', encoding='utf-8') as manifest:
+            for line in manifest:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    marc_paths.append(os.path.join(os.path.dirname(marc_path), line))
+        return marc_paths
+    return [marc_path]
+
+
+def is_marc_file(file):
+    """Function to check whether a file name has the extension .lex, or .lex followed by a compression format"""
+    file, ext = os.path.splitext(file.lower())
+    if ext in COMPRESSION_FORMATS: file, ext = os.path.splitext(file)
+    return ext == '.lex'
+
+
+def open_marc(marc_path, background=False, file_handle=None):
+    """Function to open a file of MARC records for reading with MARCReader.
+    Files compressed with gzip, bzip2 or xz (identified by file extension) are decompressed as they are read.
+
+    :param marc_path: Path to file of MARC records.
+    :param background: Decompress in a background thread, overlapping with the processing of records.
+    :param file_handle: File handle for marc_path opened in binary mode, to read from instead of opening the file.
+        If the file is compressed, file_handle is not closed when the stream returned is closed.
+    """
+    ext = os.path.splitext(marc_path)[1].lower()
+    if ext not in COMPRESSION_FORMATS: return file_handle or open(marc_path, 'rb')
+    stream = COMPRESSION_FORMATS[ext](file_handle or marc_path, 'rb')
+    if background: stream = BackgroundReader(stream)
+    return io.BufferedReader(stream, READ_BUFFER_SIZE)
+
+
+def has_tag(*tags):
+    """Prefilter predicate accepting records with at least one of the given tags in the directory"""
+    name, tags = 'has {}'.format('/'.join(tags)), frozenset(tags)
+    return name, lambda leader, directory_tags: not tags.isdisjoint(directory_tags)
+
+
+def lacks_tag(*tags):
+    """Prefilter predicate accepting records with none of the given tags in the directory"""
+    name, tags = 'no {}'.format('/'.join(tags)), frozenset(tags)
+    return name, lambda leader, directory_tags: tags.isdisjoint(directory_tags)
+
+
+def leader_byte(position, values):
+    """Prefilter predicate accepting records with one of the given values at a position in the leader"""
+    name = 'LDR/{:02d} {} {}'.format(position, '==' if len(values) == 1 else 'in', values)
+    return name, lambda leader, directory_tags: leader[position] in values
+
+
+def get_directory_tags(marc):
+    """Function to get the set of tags in the directory of a record from its bytes without decoding the record"""
+    base_address = int(str(marc[12:17], 'ascii'))
+    directory = str(marc[LEADER_LEN:base_address - 1], 'ascii')
+    return {directory[i:i + 3] for i in range(0, len(directory) - DIRECTORY_ENTRY_LEN + 1, DIRECTORY_ENTRY_LEN)}
+
+
+def get_control_number(marc):
+    """Function to get the content of field 001 from the bytes of a record without decoding the record"""
+    try:
+        base_address = int(str(marc[12:17], 'ascii'))
+        directory = str(marc[LEADER_LEN:base_address - 1], 'ascii')
+        for i in range(0, len(directory) - DIRECTORY_ENTRY_LEN + 1, DIRECTORY_ENTRY_LEN):
+            if directory[i:i + 3] == '001':
+                entry_length, entry_offset = int(directory[i + 3:i + 7]), int(directory[i + 7:i + 12])
+                return str(marc[base_address + entry_offset:base_address + entry_offset + entry_length - 1],
+                           'utf-8', 'replace')
+    except (ValueError, UnicodeDecodeError): pass
+    return ''
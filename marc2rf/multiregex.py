@@ -3,17 +3,198 @@
 
 """Classes for making multiple regex replacements in the Researcher Format transformation."""
 
+from collections import OrderedDict
 import regex as re
 import sys
+import threading
 
 __author__ = 'Victoria Morris'
 __license__ = 'MIT License'
 __version__ = '1.0.0'
 __status__ = '4 - Beta Development'
 
+# Maximum number of regexes combining a selection of the regexes of a class to be compiled by its prefilter
+PREFILTER_SUBSETS = 1024
+
+# Instances of each class shared by the whole process, created by shared()
+_instances = {}
+
+
+def get_required_literals(regex):
+    """Function to get a set of literal strings, one of which must be in any string matched by a regex,
+    or None if there is no such set"""
+    try: literals, i = _parse_literals(regex, 0)
+    except ValueError: return None
+    if i < len(regex): return None
+    return literals
+
+
+def _best_literals(candidates):
+    """Function to choose the set of literals whose shortest literal is longest"""
+    candidates = [c for c in candidates if c and '' not in c]
+    if not candidates: return None
+    return max(candidates, key=lambda c: (min(len(l) for l in c), -len(c)))
+
+
+def _parse_literals(regex, i):
+    """Function to parse a sequence of alternatives from position i of a regex, up to a closing parenthesis,
+    returning the set of literals required by the sequence and the position of the closing parenthesis"""
+    alternatives, candidates, run = [], [], ''
+    while i < len(regex) and regex[i] != ')':
+        c = regex[i]
+        literal, required = None, None
+        if c == '|':
+            candidates.append({run})
+            alternatives.append(_best_literals(candidates))
+            candidates, run = [], ''
+            i += 1
+            continue
+        elif c == '\\':
+            e = regex[i + 1:i + 2]
+            if not e: raise ValueError
+            if e.isalnum():
+                # Character classes, assertions, code points and backreferences
+                if e in 'xuU': i += {'x': 4, 'u': 6, 'U': 10}[e]
+                elif e == 'N': i = regex.index('}', i) + 1
+                elif e.isdigit():
+                    i += 1
+                    while i < len(regex) and regex[i].isdigit(): i += 1
+                else: i += 2
+            else:
+                literal = e
+                i += 2
+        elif c == '[':
+            i += 1
+            if regex[i:i + 1] == '^': i += 1
+            if regex[i:i + 1] == ']': i += 1
+            while regex[i] != ']':
+                # Nested sets and POSIX character classes
+                if regex[i] == '[': raise ValueError
+                i += 2 if regex[i] == '\\' else 1
+            i += 1
+        elif c == '(':
+            if regex.startswith('(?P<', i): i = regex.index('>', i) + 1
+            elif regex.startswith('(?:', i): i += 3
+            elif regex.startswith(('(?=', '(?!'), i): i, required = i + 3, False
+            elif regex.startswith(('(?<=', '(?<!'), i): i, required = i + 4, False
+            elif regex.startswith('(?', i): raise ValueError
+            else: i += 1
+            group, i = _parse_literals(regex, i)
+            if regex[i:i + 1] != ')': raise ValueError
+            i += 1
+            # Lookarounds do not match any characters
+            if required is None: required = group
+        elif c in '.^$':
+            i += 1
+        elif c in '*+?{':
+            raise ValueError
+        else:
+            literal = c
+            i += 1
+        # Quantifiers
+        optional, repeated = False, False
+        if regex[i:i + 1] in ('?', '*'): optional = True
+        elif regex[i:i + 1] == '+': repeated = True
+        elif regex[i:i + 1] == '{':
+            quantifier = re.match(r'\{(\d*)(,?)(\d*)\}', regex[i:])
+            if not quantifier: raise ValueError
+            optional = not quantifier.group(1) or int(quantifier.group(1)) == 0
+            repeated = True
+            i += quantifier.end() - 1
+        if optional or repeated:
+            i += 1
+            # Lazy and possessive quantifiers
+            if regex[i:i + 1] in ('?', '+'): i += 1
+        if literal is not None and not optional:
+            run += literal
+            if repeated:
+                candidates.append({run})
+                run = ''
+        else:
+            candidates.append({run})
+            run = ''
+            if required and not optional: candidates.append(required)
+    candidates.append({run})
+    alternatives.append(_best_literals(candidates))
+    if any(a is None for a in alternatives): return None, i
+    return set().union(*alternatives), i
+
+
+def fold_case(s):
+    """Function to case fold a string one character at a time, keeping its length,
+    so that characters which match each other when the IGNORECASE flag is used are folded to the same character.
+    str.casefold() folds some characters to two, such as 'İ' to 'i̇' and 'ß' to 'ss',
+    but the regex module only matches them with single characters, such as 'İ' with 'i'."""
+    folded = s.casefold()
+    if len(folded) == len(s) and 'ı' not in folded: return folded
+    return ''.join(_fold_char(c) for c in s)
+
+
+def _fold_char(c):
+    # Dotless 'ı' matches 'I', which is folded to 'i'
+    if c == 'ı': return 'i'
+    folded = c.casefold()
+    return folded if len(folded) == 1 else c.lower()[:1]
+
+
+class LiteralAutomaton(object):
+    """An Aho-Corasick automaton for finding which of a set of literal strings are in a string.
+    Literals and strings are compared after case folding with fold_case(), so that every literal which matches
+    a string when the IGNORECASE flag is used is found.
+
+    :param literals: Dictionary of literals, and the sets of values to be returned if each literal is found.
+    """
+
+    def __init__(self, literals):
+        self._goto, self._fail, self._values = [{}], [0], [set()]
+        for literal, values in literals.items():
+            state = 0
+            for c in fold_case(literal):
+                if c not in self._goto[state]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._values.append(set())
+                    self._goto[state][c] = len(self._goto) - 1
+                state = self._goto[state][c]
+            self._values[state].update(values)
+        # Link each state to the state for its longest proper suffix, in breadth-first order,
+        # so that each state also has the values of the literals ending with its suffixes
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for c, next_state in self._goto[state].items():
+                fail = self._fail[state]
+                while fail and c not in self._goto[fail]: fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(c, 0)
+                self._values[next_state].update(self._values[self._fail[next_state]])
+                queue.append(next_state)
+        self._values = [frozenset(values) for values in self._values]
+
+    def search(self, s):
+        """Function to get the union of the sets of values of the literals in s"""
+        goto, fail, values = self._goto, self._fail, self._values
+        found, state = set(), 0
+        for c in fold_case(s):
+            while state and c not in goto[state]: state = fail[state]
+            state = goto[state].get(c, 0)
+            if values[state]: found.update(values[state])
+        return frozenset(found)
+
+
+def prefilter_summary():
+    """Function to get the number of strings passed to the prefilter of each shared instance,
+    for which a literal was found (hits) or not found (misses).
+    Counts cover this process only: when records are converted by worker processes (--workers),
+    the strings matched in the workers are not counted, and only those matched in the parent process are."""
+    summary = OrderedDict()
+    for cls, instance in sorted(_instances.items(), key=lambda item: item[0].__name__):
+        if instance.prefilter:
+            summary[cls.__name__] = OrderedDict([('hits', instance.hits), ('misses', instance.misses)])
+    return summary
+
 
 class MultiRegex(object):
     simple = False
+    prefilter = False
     regexes = ()
 
     def __init__(self):
@@ -23,12 +204,89 @@ class MultiRegex(object):
                 try: re.compile(r)
                 except:
                     print('Error in regex: {}'.format(str(r)))
+        else:
+            self._build_replacements()
+            if self.prefilter: self._build_prefilter()
+
+    def _build_replacements(self):
+        """Function to build the table of replacements for named groups, by group name,
+        so that most matches can be replaced without scanning every group.
+        Groups are left out if their name is in a regex with more than one named group,
+        since the first of these which matched is used, and the last group in a match may be another."""
+        shared_names = set()
+        for r in self.regexes:
+            names = re.findall(r'\(\?P<(\w+)>', r)
+            if len(names) > 1: shared_names.update(names)
+        self._replacements = {}
+        for k in self._rx.groupindex:
+            if k in shared_names: continue
+            if k == 'AllElse': self._replacements[k] = ''
+            elif 'UUU' in k:
+                try: self._replacements[k] = bytes(k.replace('UUU', '\\' + 'u'), 'ascii').decode('unicode-escape')
+                except: pass
+            else:
+                try: self._replacements[k] = getattr(self, k)
+                except: self._replacements[k] = k
+
+    def _build_prefilter(self):
+        """Function to build the prefilter for sub: an automaton finding the literals required by the regexes,
+        which gives the indexes of the regexes requiring the literals found.
+        A regex which requires literals can only match a string containing one of them,
+        so sub only needs to combine the regexes whose literals are found with those which do not require any."""
+        # Instances are shared by all the threads converting records, so the counts are updated under a lock
+        self.hits, self.misses = 0, 0
+        self._lock = threading.Lock()
+        required, self._others = {}, []
+        for i, r in enumerate(self.regexes):
+            literals = get_required_literals(r)
+            if not literals: self._others.append(i)
+            for l in literals or ():
+                required.setdefault(l, set()).add(i)
+        self._automaton = LiteralAutomaton(required)
+        self._subsets = {}
+
+    def _get_subset(self, selection):
+        """Function to compile a regex combining the regexes in selection with those which do not require any literal,
+        in their original order. Once PREFILTER_SUBSETS regexes have been compiled, the whole regex is used instead."""
+        if len(self._subsets) >= PREFILTER_SUBSETS: return self._rx
+        indexes = sorted(selection.union(self._others))
+        if not indexes: rx = None
+        elif len(indexes) == len(self.regexes): rx = self._rx
+        else: rx = re.compile('|'.join(self.regexes[i] for i in indexes), flags=re.IGNORECASE)
+        return self._subsets.setdefault(selection, rx)
+
+    @classmethod
+    def shared(cls):
+        """Get the instance of the class shared by the whole process.
+        It is created, and its regular expression compiled, the first time it is requested."""
+        try: return _instances[cls]
+        except KeyError: return _instances.setdefault(cls, cls())
 
     def sub(self, s):
         if not s or s is None: return ''
-        return self._rx.sub(self._sub, s)
+        # Release the GIL while matching, so that records can be converted in parallel threads
+        if not self.prefilter: return self._rx.sub(self._sub, s, concurrent=True)
+        selection = self._automaton.search(s)
+        with self._lock:
+            if selection: self.hits += 1
+            else: self.misses += 1
+        try: rx = self._subsets[selection]
+        except KeyError: rx = self._get_subset(selection)
+        if rx is None: return s
+        return rx.sub(self._sub, s, concurrent=True)
 
     def _sub(self, mo):
+        # The last group in a match is usually the named group around the regex which matched,
+        # in which case no other named group can have matched
+        k = mo.lastgroup
+        if k not in self._replacements: return self._sub_groups(mo)
+        if not mo.group(k): return None
+        sub = self._replacements[k]
+        if not callable(sub): return sub
+        try: return sub(mo)
+        except: return k
+
+    def _sub_groups(self, mo):
         try:
             for k, v in mo.groupdict().items():
                 if v:
@@ -62,6 +320,7 @@ class MultiRegex(object):
 
 class Abbreviations(MultiRegex):
     simple = True
+    prefilter = True
     regexes = (
         r'(?P<January>^jan(uary)?\.*$)',
         r'(?P<February>^feb(ruary)?\.*$)',
@@ -217,6 +476,7 @@ class Abbreviations(MultiRegex):
 
 class Genres(MultiRegex):
     simple = True
+    prefilter = True
     regexes = (
         r'(?P<TranslationsInto>.*\btranslations.*?\binto.*?\b([a-z]+).*)',
         r'(?P<TranslationsFrom>.*\btranslations.*?\bfrom.*?\b([a-z]+).*)',
@@ -570,7 +830,8 @@ class Genres(MultiRegex):
         return 'Early works to ' + re.sub(r'.*\bearly.*?\bworks.*?\bto.*?\b([0-9]+).*', r'\1', mo.group(), flags=re.IGNORECASE)
 
 
-class PlaceNamesUK(MultiRegex):    
+class PlaceNamesUK(MultiRegex):
+    prefilter = True
     regexes = (
         r'(?P<County>,* \(?Co\.? (Antrim|Armagh|Carlow|Cavan|Clare|Cork|Donegal|Down|Dublin|Fermanagh|Galway|Kerry|Kildare|Kilkenny|Laois|Laoighis|Leitrim|Limerick|Londonderry|Longford|Louth|Mayo|Meath|Monaghan|Offaly|Roscommon|Sligo|Tipperary|Tyrone|Waterford|Westmeath|Wexford|Wicklow)\)?\b\s*([.,]|$))',
         r'(?P<CountyB>Co\.? (Antrim|Armagh|Carlow|Cavan|Clare|Cork|Donegal|Down|Dublin|Fermanagh|Galway|Kerry|Kildare|Kilkenny|Laois|Laoighis|Leitrim|Limerick|Londonderry|Longford|Louth|Mayo|Meath|Monaghan|Offaly|Roscommon|Sligo|Tipperary|Tyrone|Waterford|Westmeath|Wexford|Wicklow)\b)',
@@ -646,6 +907,7 @@ class PlaceNamesUK(MultiRegex):
 
 
 class PlaceNamesUS(MultiRegex):
+    prefilter = True
     regexes = (
         r'(?P<UUU002CUUU0020Alabama>[,\s]*(?<!-)\b(ala|a[.\s]*l)\b\s*([.,]|$))',
         r'(?P<UUU002CUUU0020Alaska>[,\s]*(?<!-)\ba[.\s]*k\b\s*([.,]|$))',
@@ -3,6 +3,7 @@
 
 """Classes for cleaning publisher names in the Researcher Format transformation."""
 
+import marc2rf.multiregex as mrx
 import regex as re
 import sys
 
@@ -12,21 +13,44 @@ __version__ = '1.0.0'
 __status__ = '4 - Beta Development'
 
 
-class PublisherMultiRegex(object):
-    regexes = ()
+class PublisherMultiRegex(mrx.MultiRegex):
+    """A MultiRegex whose regexes are mostly anchored to the start of the string,
+    so that each string is matched against only the regexes which can match its first character."""
 
     def __init__(self):
-        try: self._rx = re.compile('|'.join(self.regexes), flags=re.IGNORECASE)
-        except:
-            for r in self.regexes:
-                try: re.compile(r)
-                except: print('Error in regex: {}'.format(str(r)))
+        mrx.MultiRegex.__init__(self)
+        self._build_partitions()
+
+    def _build_partitions(self):
+        """Function to find the letter or digit with which matches of each regex must start,
+        so that strings can be matched against only the regexes which can match them."""
+        self._leading = [get_leading_character(r) for r in self.regexes]
+        # Regex for strings starting with each character, and for each leading letter or digit
+        self._partitions, self._compiled = {}, {}
+
+    def _get_partition(self, c):
+        """Function to get the regex for strings starting with character c.
+        Strings starting with an ASCII character are matched against the regexes which can start with it,
+        compiled the first time they are needed; other strings are matched against the whole regex."""
+        rx = self._rx
+        if ord(c) < 128:
+            key = c.lower() if c.lower() in self._leading else None
+            if key not in self._compiled:
+                # Regexes are kept in their original order, since the first which matches is used
+                regexes = [r for r, l in zip(self.regexes, self._leading) if l is None or l == key]
+                self._compiled[key] = re.compile('|'.join(regexes), flags=re.IGNORECASE) if regexes else self._rx
+            rx = self._compiled[key]
+        self._partitions[c] = rx
+        return rx
 
     def sub(self, s):
         if not s or s is None: return ''
-        return self._rx.sub(self._sub, s)
+        # Release the GIL while matching, so that records can be converted in parallel threads
+        try: rx = self._partitions[s[0]]
+        except KeyError: rx = self._get_partition(s[0])
+        return rx.sub(self._sub, s, concurrent=True)
 
-    def _sub(self, mo):
+    def _sub_groups(self, mo):
         try:
             for k, v in mo.groupdict().items():
                 if v:
@@ -44,6 +68,30 @@ class PublisherMultiRegex(object):
             print('\nError PMR: {0}\n'.format(str(sys.exc_info())))
 
 
+def get_leading_character(regex):
+    """Function to get the letter or digit (in lower case) with which every match of a regex must start,
+    if the regex is a single named group anchored with ^ and starting with a letter or digit,
+    or None if matches can start with any character"""
+    leading = re.match(r'\(\?P<\w+>\^([A-Za-z0-9])(?![?*{])', regex)
+    # Inline flags could change the meaning of the regex
+    if leading is None or re.search(r'\(\?(?!P<|:|=|!|<=|<!)', regex): return None
+    depth, escaped, in_class = 0, False, False
+    for i, c in enumerate(regex):
+        if escaped: escaped = False
+        elif c == '\\': escaped = True
+        elif in_class: in_class = c != ']' or regex[i - 1] in '[^'
+        elif c == '[': in_class = True
+        elif c == '(': depth += 1
+        elif c == ')':
+            depth -= 1
+            # The named group must contain the whole regex
+            if depth == 0 and i < len(regex) - 1: return None
+        # Alternatives within the named group could start with other characters
+        elif c == '|' and depth == 1: return None
+    if depth != 0: return None
+    return leading.group(1).lower()
+
+
 class Publishers(PublisherMultiRegex):
     # Need to put \b before initials
     regexes = (
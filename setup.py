@@ -36,6 +36,7 @@ setup(
     console=[
         'bin/write_rf_config.py',
         'bin/researcherFormat.py',
+        'bin/index_marc.py',
     ],
     zipfile=None,
     options={
@@ -54,6 +55,7 @@ setup(
     scripts=[
         'bin/write_rf_config.py',
         'bin/researcherFormat.py',
+        'bin/index_marc.py',
     ],
     classifiers=[
         'Development Status :: 4 - Beta',
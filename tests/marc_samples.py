@@ -0,0 +1,102 @@
+# -*- coding: utf8 -*-
+
+"""Synthetic MARC records, and Converters to convert them, for the marc2rf tests and benchmarks."""
+
+# Import required modules
+import random
+
+# Import required functions
+from marc2rf.main import *
+
+__author__ = 'Victoria Morris'
+__license__ = 'MIT License'
+__version__ = '1.0.0'
+__status__ = '4 - Beta Development'
+
+
+def encode_marc(fields, leader='00000nam a2200000 a 4500'):
+    """Function to encode a MARC record as bytes.
+
+    :param fields: List of (tag, data) for control fields, or (tag, indicators, [(code, value), ...]) for data fields.
+    :param leader: Leader of the record; the record length and base address are filled in.
+    """
+    directory, data = [], []
+    offset = 0
+    for field in fields:
+        if len(field) == 2: content = field[1]
+        else:
+            content = field[1] + ''.join(SUBFIELD_INDICATOR + code + value for code, value in field[2])
+        content = (content + END_OF_FIELD).encode('utf-8')
+        directory.append('{}{:04d}{:05d}'.format(field[0], len(content), offset))
+        data.append(content)
+        offset += len(content)
+    directory = (''.join(directory) + END_OF_FIELD).encode('ascii')
+    base_address = LEADER_LEN + len(directory)
+    length = base_address + offset + 1
+    leader = '{:05d}{}{:05d}{}'.format(length, leader[5:12], base_address, leader[17:]).encode('ascii')
+    return leader + directory + b''.join(data) + END_OF_RECORD.encode('ascii')
+
+
+NAMES = ['Smith, John', 'Brontë, Charlotte', 'Dickens, Charles', 'Müller, Hans', 'Woolf, Virginia']
+TITLES = ['A history of the county of Kent', 'Poems', 'The collected letters', 'Journal of a voyage',
+          'Sermons preached at St. Paul\'s']
+PLACES = ['London', 'Edinburgh', 'Oxford', 'Paris', 'New York']
+PUBLISHERS = ['Printed for J. Smith', 'Oxford University Press', 'Macmillan and Co.', 'Chatto & Windus',
+              'Sold by the booksellers']
+GENRES = ['Poetry', 'Sermons', 'Travel writing', 'Periodicals', 'Translations into French']
+TOPICS = ['Great Britain -- History', 'Poetry', 'Railways', 'Shipping -- England', 'Botany']
+
+
+def sample_fields(n, rng=None):
+    """Function to get the fields of the nth synthetic record, covering the commonly converted fields."""
+    rng = rng or random.Random(n)
+    year = str(1600 + rng.randrange(400))
+    fields = [
+        ('001', '{:09d}'.format(n + 1)),
+        ('008', '850101s{}    enk           000 0 eng d'.format(year)),
+        ('020', '  ', [('a', '978{:010d}'.format(rng.randrange(10 ** 10))), ('q', 'hardback')]),
+        ('041', '0 ', [('a', 'eng'), ('h', 'fre')]),
+        ('082', '04', [('a', '{}.{}'.format(rng.randrange(1000), rng.randrange(100)))]),
+        ('100', '1 ', [('a', rng.choice(NAMES) + ','), ('d', '1800-1870.')]),
+        ('245', '10', [('a', rng.choice(TITLES) + ' /'), ('c', 'by ' + rng.choice(NAMES) + '.')]),
+        ('250', '  ', [('a', '2nd ed.')]),
+        ('260', '  ', [('a', rng.choice(PLACES) + ' :'), ('b', rng.choice(PUBLISHERS) + ','), ('c', year + '.')]),
+        ('300', '  ', [('a', '{} p. ;'.format(rng.randrange(10, 900))), ('c', '24 cm.')]),
+        ('490', '0 ', [('a', 'Collected works ;'), ('v', 'v. {}'.format(rng.randrange(1, 20)))]),
+        ('500', '  ', [('a', 'Translated into English from the French.')]),
+        ('650', ' 0', [('a', rng.choice(TOPICS) + '.')]),
+        ('651', ' 0', [('a', rng.choice(PLACES) + ' (England)'), ('x', 'Description and travel.')]),
+        ('700', '1 ', [('a', rng.choice(NAMES) + ','), ('e', 'translator.')]),
+    ]
+    if n % 2 == 0:
+        fields.insert(-1, ('655', ' 7', [('a', rng.choice(GENRES) + '.'), ('2', 'lcgft')]))
+    if n % 3 == 0:
+        fields.append(('880', '1 ', [('6', '100-01'), ('a', 'Смит, Иван')]))
+    if n % 4 == 0:
+        fields.append(('880', ' 0', [('6', '650-02'), ('a', 'Железные дороги.')]))
+    return fields
+
+
+def sample_records(count, start=0):
+    """Function to get the bytes of count synthetic records."""
+    return [encode_marc(sample_fields(n)) for n in range(start, start + count)]
+
+
+def write_marc_file(path, records):
+    """Function to write the bytes of records to a file of MARC records."""
+    with open(path, 'wb') as f:
+        for record in records: f.write(record)
+    return path
+
+
+def make_converter(profile):
+    """Function to get a Converter set up for a profile, as convert_marc_files() would set it up
+    for the options, with every output file included."""
+    converter = Converter('', '', '', profile.lower())
+    converter.profile = profile
+    converter.output_fields = Output(profile=profile, initiate=True)
+    converter.bnb, converter.iams, converter.estc = True, True, True
+    converter.file_records, converter.file_titles, converter.file_names, converter.file_topics, \
+        converter.file_classification = True, True, True, True, True
+    if profile in ['F', 'M']: converter.q880 = False
+    return converter
@@ -0,0 +1,87 @@
+# -*- coding: utf8 -*-
+
+"""Strings matched by the regexes of the MultiRegex and Publishers classes, for the marc2rf tests.
+
+Examples are generated from the parsed regex: one with the first alternative and the fewest repetitions
+everywhere, and one more for each other alternative and each optional item.
+"""
+
+# Import required modules
+try: import re._parser as sre_parse
+except ImportError: import sre_parse
+
+# Maximum number of examples generated for a single regex
+MAX_EXAMPLES = 40
+
+# Characters generated for character categories
+CATEGORIES = {
+    'CATEGORY_DIGIT': '1', 'CATEGORY_NOT_DIGIT': 'a', 'CATEGORY_SPACE': ' ', 'CATEGORY_NOT_SPACE': 'a',
+    'CATEGORY_WORD': 'a', 'CATEGORY_NOT_WORD': ' ',
+}
+
+# Contexts in which each example is placed, for regexes which are not anchored to the whole string
+CONTEXTS = ['{}', ', {}.', 'Abc {} xyz', '({})']
+
+
+def get_examples(regex, limit=MAX_EXAMPLES):
+    """Function to get a list of up to limit strings matched by a regex, or an empty list if it cannot be parsed"""
+    try: parsed = sre_parse.parse(regex)
+    except Exception: return []
+    return _sequence(list(parsed))[:limit]
+
+
+def _sequence(items):
+    """Examples of a sequence of items: the first example of every item,
+    then the other examples of each item in turn with the first examples of the others."""
+    options = [_item(op, av) for op, av in items]
+    base = [o[0] for o in options]
+    examples = [''.join(base)]
+    for i, o in enumerate(options):
+        for example in o[1:]:
+            examples.append(''.join(base[:i] + [example] + base[i + 1:]))
+            if len(examples) >= MAX_EXAMPLES: return examples
+    return examples
+
+
+def _item(op, av):
+    name = str(op)
+    if name == 'LITERAL': return [chr(av)]
+    if name == 'NOT_LITERAL': return ['a' if chr(av) != 'a' else 'b']
+    if name == 'ANY': return ['a']
+    if name == 'IN': return _in(av)
+    if name in ('AT', 'ASSERT', 'ASSERT_NOT'): return ['']
+    if name == 'SUBPATTERN': return _sequence(list(av[-1]))
+    if name == 'BRANCH':
+        examples = []
+        for branch in av[1]: examples.extend(_sequence(list(branch)))
+        return examples
+    if name in ('MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT'):
+        low, high, pattern = av
+        repeated = _sequence(list(pattern))
+        examples = [repeated[0] * low] if low else ['']
+        if high > low: examples.append(repeated[0] * (low + 1))
+        examples.extend(example * max(low, 1) for example in repeated[1:])
+        return examples
+    if name == 'ATOMIC_GROUP': return _sequence(list(av))
+    if name == 'CATEGORY': return [CATEGORIES.get(str(av), 'a')]
+    raise ValueError(name)
+
+
+def _in(av):
+    """Examples of a character class: each literal character in the class, or a character from its first range."""
+    if str(av[0][0]) == 'NEGATE': return ['a' if all(str(op) != 'LITERAL' or chr(a) != 'a' for op, a in av) else '#']
+    examples = []
+    for op, a in av:
+        if str(op) == 'LITERAL': examples.append(chr(a))
+        elif str(op) == 'RANGE': examples.append(chr(a[0]))
+        elif str(op) == 'CATEGORY': examples.append(CATEGORIES.get(str(a), 'a'))
+    return examples or ['a']
+
+
+def get_strings(regexes, limit=MAX_EXAMPLES, contexts=CONTEXTS):
+    """Function to get strings matched by a list of regexes, in each of contexts"""
+    strings = []
+    for regex in regexes:
+        for example in get_examples(regex, limit):
+            strings.extend(context.format(example) for context in contexts)
+    return strings
@@ -0,0 +1,44 @@
+# -*- coding: utf8 -*-
+
+"""Stress test converting the same records concurrently with several Converters and threads,
+checking that the values converted from each record are the same as converting them serially."""
+
+# Import required modules
+from multiprocessing.pool import ThreadPool
+import pytest
+
+# Import required functions
+from marc2rf.main import *
+from marc_samples import make_converter, sample_records
+
+THREADS = 8
+CONVERTERS = 4
+RECORDS = 150
+
+
+def convert(converter, record):
+    """Function to convert a record, returning a copy of the values in each column,
+    since the output container is recycled."""
+    output = converter.convert_record(record)
+    values = {column: set(output.values[column]) for column in output.values}
+    converter.recycle_output(output)
+    return values
+
+
+@pytest.mark.parametrize('profile', ['A', 'B', 'E', 'M', 'N'])
+def test_concurrent_conversion(profile):
+    records = [Record(marc) for marc in sample_records(RECORDS)]
+    serial = [convert(make_converter(profile), Record(marc)) for marc in sample_records(RECORDS)]
+    assert all(values['ID'] if profile != 'M' else values['001'] for values in serial)
+
+    # Each record is converted several times at once: by separate Converters, and by a Converter shared by all
+    # the threads, from Record objects which are also shared, and whose fields are decoded as they are converted
+    converters = [make_converter(profile) for i in range(CONVERTERS)]
+    shared = make_converter(profile)
+    tasks = [(converter, i) for i in range(RECORDS) for converter in converters + [shared]]
+    with ThreadPool(THREADS) as pool:
+        results = pool.starmap(lambda converter, i: (i, convert(converter, records[i])), tasks, chunksize=1)
+
+    assert len(results) == len(tasks)
+    for i, values in results:
+        assert values == serial[i]
@@ -0,0 +1,109 @@
+# -*- coding: utf8 -*-
+
+"""Tests for the Record and Field classes, and for MultiMARCReader."""
+
+# Import required modules
+import copy
+import pickle
+
+# Import required functions
+from marc2rf.marc_data import *
+from marc_samples import encode_marc, sample_fields, sample_records, write_marc_file
+
+
+def test_field_api():
+    field = Field('245', ['1', '0'], ['a', 'Poems /', 'c', 'by John Smith.'])
+    assert field.tag == '245'
+    assert field.indicators == ('1', '0')
+    assert (field.indicator1, field.indicator2) == ('1', '0')
+    assert field.subfields == ('a', 'Poems /', 'c', 'by John Smith.')
+    assert list(field) == [('a', 'Poems /'), ('c', 'by John Smith.')]
+    assert field.get_subfields('c', cleaning=False) == ['by John Smith.']
+    assert field.get_subfields('c') == [clean('by John Smith.')]
+    assert field['a'] == clean('Poems /') and field['z'] is None
+    assert 'c' in field and 'z' not in field
+    assert str(field) == '=245  10$aPoems /$cby John Smith.'
+    assert not field.is_control_field()
+    # Iteration keeps no state on the field, so iterators are independent
+    assert [(a, b) for a in field for b in field][1] == (('a', 'Poems /'), ('c', 'by John Smith.'))
+
+
+def test_control_field_api():
+    field = Field('001', data='000000001')
+    assert field.data == '000000001'
+    assert field.is_control_field()
+    assert list(field) == []
+    assert str(field) == '=001  000000001'
+
+
+def test_record_api():
+    record = Record(sample_records(1)[0])
+    assert [field.tag for field in record] == [f[0] for f in sample_fields(0)]
+    assert [field.tag for field in record.fields] == [f[0] for f in sample_fields(0)]
+    assert record.get_fields() is record.fields
+    assert record['001'].data == '000000001'
+    assert '245' in record and '246' not in record
+    # 880 fields are returned with the fields to which they are linked, in record order
+    assert [field.tag for field in record.get_fields('100')] == ['100', '880']
+    assert [field.tag for field in record.get_fields('700', '100')] == ['100', '700', '880']
+    record.q880 = False
+    assert [field.tag for field in record.get_fields('100')] == ['100']
+    assert str(record).startswith('=LDR  ' + record.leader + '\n=001  000000001\n')
+
+
+def test_record_add_field():
+    record = Record()
+    record.add_field(Field('001', data='123'), Field('880', [' ', ' '], ['6', '245-01', 'a', 'Title']))
+    assert record['001'].data == '123'
+    assert [field.tag for field in record.get_fields('245')] == ['880']
+
+
+def test_pickle_field():
+    for field in [Field('245', ['1', '0'], ['a', 'Poems']), Field('008', data='850101s1797')]:
+        copied = pickle.loads(pickle.dumps(field))
+        assert type(copied) is Field
+        assert str(copied) == str(field)
+        assert list(copied) == list(field)
+
+
+def test_pickle_record():
+    undecoded, part_decoded, decoded = [Record(sample_records(1)[0]) for i in range(3)]
+    part_decoded.get_fields('245')
+    decoded.fields
+    for record in [undecoded, part_decoded, decoded]:
+        copied = pickle.loads(pickle.dumps(record))
+        assert str(copied) == str(record)
+        assert [field.tag for field in copied.get_fields('100')] == ['100', '880']
+
+
+def test_pickle_memory_mapped_record(tmp_path):
+    marc_path = write_marc_file(str(tmp_path / 'records.lex'), sample_records(3))
+    reader = MARCReader(open(marc_path, 'rb'), memory_map=True)
+    records = list(reader)
+    assert isinstance(records[0]._data, memoryview)
+    copied = pickle.loads(pickle.dumps(records))
+    assert [str(record) for record in copied] == [str(record) for record in records]
+    del records
+    reader.close()
+
+
+def test_copy_record():
+    record = Record(sample_records(1)[0])
+    copied = copy.copy(record)
+    assert str(copied) == str(record)
+    assert copied['245'] is record['245']
+
+
+
+def test_multi_reader_reject(tmp_path):
+    marc_paths = [write_marc_file(str(tmp_path / 'records{}.lex'.format(i)), sample_records(2, start=2 * i))
+                  for i in range(2)]
+    reader = MultiMARCReader(marc_paths)
+    records = [next(reader) for i in range(3)]
+    reader.reject(b'abc', 0, 'Current file')
+    reader.reject(b'defg', 10, 'Closed file', marc_paths[0])
+    list(reader)
+    # Records of the last file rejected after it has been closed
+    reader.reject(b'hi', 20, ValueError('Last file'))
+    assert reader.rejects == [(marc_paths[0], 10, 4, 'Closed file'), (marc_paths[1], 0, 3, 'Current file'),
+                              (marc_paths[1], 20, 2, 'ValueError: Last file')]
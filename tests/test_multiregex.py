@@ -0,0 +1,209 @@
+# -*- coding: utf8 -*-
+
+"""Tests for the MultiRegex classes."""
+
+# Import required modules
+from collections import Counter
+from multiprocessing.pool import ThreadPool
+import pytest
+import regex as re
+
+# Import required functions
+from marc2rf.main import *
+import marc2rf.multiregex as mrx
+import marc2rf.publisher as publisher
+from marc_samples import make_converter, sample_records
+from regex_samples import get_strings
+
+
+@pytest.fixture
+def empty_caches():
+    """Empty the caches of the cleaning functions, so that the MultiRegex classes are used, and again afterwards."""
+    set_clean_cache_size(CLEAN_CACHE_SIZE)
+    yield
+    set_clean_cache_size(CLEAN_CACHE_SIZE)
+
+
+def test_shared_instances_built_once(monkeypatch, empty_caches):
+    monkeypatch.setattr(mrx, '_instances', {})
+    built = []
+    # PublisherMultiRegex is a MultiRegex, and its instances are shared with those of the other classes
+    def counting_init(self, init=mrx.MultiRegex.__init__):
+        built.append(type(self))
+        init(self)
+    monkeypatch.setattr(mrx.MultiRegex, '__init__', counting_init)
+
+    for profile in ['A', 'N']:
+        converter = make_converter(profile)
+        for marc in sample_records(100):
+            converter.recycle_output(converter.convert_record(Record(marc)))
+
+    counts = Counter(built)
+    assert {mrx.Abbreviations, mrx.Genres, mrx.PlaceNamesUK, mrx.Relators, publisher.Publishers} <= set(counts)
+    assert all(count == 1 for count in counts.values()), counts
+
+
+MULTIREGEX_CLASSES = [mrx.Abbreviations, mrx.Genres, mrx.PlaceNamesUK, mrx.PlaceNamesUS, mrx.PlaceNamesAustralia,
+                      mrx.PlaceNamesBrazil, mrx.PlaceNamesCanada, mrx.PlaceNamesNewZealand, mrx.PlaceNamesOther,
+                      mrx.PlaceNamesAccents, mrx.Relators]
+
+
+def check_dispatch(instance, strings):
+    """Function to check that _sub() replaces every match of the regex of instance in strings as _sub_groups() does,
+    returning the names of the groups which matched."""
+    matched = set()
+    for s in strings:
+        for mo in instance._rx.finditer(s):
+            assert instance._sub(mo) == instance._sub_groups(mo), (s, mo.lastgroup)
+            matched.add(mo.lastgroup)
+    return matched
+
+
+@pytest.mark.parametrize('cls', MULTIREGEX_CLASSES, ids=lambda cls: cls.__name__)
+def test_dispatch(cls):
+    instance = cls.shared()
+    matched = check_dispatch(instance, get_strings(cls.regexes))
+    # Earlier regexes such as those for adaptations in Genres match most strings which later regexes could match
+    assert len(matched) >= len(instance._rx.groupindex) // 2
+    assert any('UUU' in k for k in matched)
+
+
+def test_dispatch_callables():
+    # Groups replaced by methods, and the regex in PlaceNamesUK with two named groups,
+    # in which the last group in a match is not the group used for the replacement
+    strings = ['Translations into French', 'Translations from the German', 'Early works to 1800',
+               'Belfast, Co. Antrim', 'Co Down', 'Newry (Co. Down).', 'Darlington, co. durham, e. sussex',
+               'writer of introduction, and notes', 'Writer on history and politics']
+    matched = set()
+    for cls in [mrx.Genres, mrx.PlaceNamesUK, mrx.Relators]:
+        matched.update(check_dispatch(cls.shared(), strings))
+    assert {'TranslationsInto', 'TranslationsFrom', 'EarlyWorks', 'County', 'CountyB', 'writerOf', 'writerOn',
+            'UUU002CUUU0020EastUUU0020Sussex'} <= matched
+    assert mrx.PlaceNamesUK.shared().sub('Darlington, co. durham, e. sussex') == 'Darlington, County Durham'
+    assert mrx.Genres.shared().sub('Translations into French') == 'Translations into French'
+    assert mrx.Relators.shared().sub('writer of introduction, and notes') == 'writer of introduction'
+    assert mrx.PlaceNamesUK.shared().sub('Newry, Co. Down') == 'Newry County Down'
+
+
+PREFILTERED_CLASSES = [cls for cls in MULTIREGEX_CLASSES if cls.prefilter]
+
+
+@pytest.mark.parametrize('regex, literals', [
+    (r'abc', {'abc'}),
+    (r'(?P<January>^jan(uary)?\.*$)', {'jan'}),
+    # Optional items split the literal; the longest required part is used
+    (r'ab?cd', {'cd'}),
+    (r'ab*cd', {'cd'}),
+    (r'ab{0,3}cd', {'cd'}),
+    (r'a{,2}bcd', {'bcd'}),
+    (r'ab??cd', {'cd'}),
+    (r'\bsept?\b', {'sep'}),
+    # Repeated items are required once, but end the literal
+    (r'ab+cd', {'ab'}),
+    (r'ab{2}cd', {'ab'}),
+    (r'ab{1,}cd', {'ab'}),
+    # Lookarounds do not match any characters
+    (r'(?<=foo)bar', {'bar'}),
+    (r'(?<!-)\bala\b', {'ala'}),
+    (r'foo(?=bar)', {'foo'}),
+    (r'(?!x)abc', {'abc'}),
+    # Escaped punctuation is literal; character classes, categories, code points and backreferences are not
+    (r'a\.b', {'a.b'}),
+    (r'\x41bc', {'bc'}),
+    (r'\N{LATIN SMALL LETTER A}bc', {'bc'}),
+    (r'ab\1cd', {'ab'}),
+    (r'\d+abc', {'abc'}),
+    (r'[abc]def', {'def'}),
+    (r'de[cz]ember', {'ember'}),
+    (r'[^\]x]yz', {'yz'}),
+    # Alternatives each require one of their literals
+    (r'(?:abc|xyz)d', {'abc', 'xyz'}),
+    (r'(?P<x>(abc|de(fg|hi)))', {'abc', 'de'}),
+    (r'(a|b)c', {'c'}),
+    (r'.*\bwriter\s*of\s*(.*?)\s*(,|and).*', {'writer'}),
+    # Regexes which can match without any literal
+    (r'abc|', None),
+    (r'(abc)?', None),
+    (r'.*', None),
+    (r'\s+\d+', None),
+    # Inline flags and unsupported syntax
+    (r'(?i)abc', None),
+    (r'abc(?i:def)', None),
+    (r'a[[:alpha:]]b', None),
+    (r'*a', None),
+    (r'abc)', None),
+    (r'(abc', None),
+    (r'ab\\', {'ab\\'}),
+    (r'ab\\\\', {'ab\\\\'}),
+])
+def test_required_literals(regex, literals):
+    assert mrx.get_required_literals(regex) == literals
+
+
+@pytest.mark.parametrize('cls', PREFILTERED_CLASSES, ids=lambda cls: cls.__name__)
+def test_required_literals_in_matches(cls):
+    # Every string matched by a regex contains one of its literals, ignoring case
+    for r in cls.regexes:
+        literals = mrx.get_required_literals(r)
+        if not literals: continue
+        rx = re.compile(r, flags=re.IGNORECASE)
+        for s in get_strings([r]):
+            if rx.search(s): assert any(mrx.fold_case(l) in mrx.fold_case(s) for l in literals), (r, s)
+
+
+def test_literal_automaton():
+    automaton = mrx.LiteralAutomaton({'he': {1}, 'she': {2}, 'hers': {3}, 'his': {4}, 'straße': {5, 6}})
+    assert automaton.search('') == frozenset()
+    assert automaton.search('xyz') == frozenset()
+    # Overlapping literals, and literals which are suffixes of others, are all found
+    assert automaton.search('ushers') == {1, 2, 3}
+    assert automaton.search('hishers') == {1, 2, 3, 4}
+    assert automaton.search('shis') == {4}
+    # Literals and strings are case folded one character at a time, as the IGNORECASE flag matches them
+    assert automaton.search('USHERS') == {1, 2, 3}
+    assert automaton.search('Die STRAẞE') == {5, 6}
+    assert automaton.search('Die STRASSE') == frozenset()
+    assert automaton.search('SHİS') == automaton.search('SHIS') == automaton.search('shıs') == {4}
+    assert mrx.fold_case('websİte STRAẞE') == 'website straße'
+
+
+@pytest.mark.parametrize('cls', PREFILTERED_CLASSES, ids=lambda cls: cls.__name__)
+def test_prefiltered_sub(cls):
+    instance = cls.shared()
+    strings = get_strings(cls.regexes) + sample_strings()
+    strings += [s.upper() for s in strings[::5]]
+    # Characters which str.casefold() folds to two characters, but which match a single character
+    strings += [s.replace(a, b) for s in strings[::3] for a, b in [('i', 'İ'), ('I', 'İ'), ('s', 'ß'), ('ss', 'ß')]
+                if a in s]
+    strings += ['websİte', ' Co Antrİm.', 'Straße', 'ßept.']
+    for s in strings:
+        assert instance.sub(s) == instance._rx.sub(instance._sub_groups, s), s
+    assert instance.hits > 0 and instance.misses > 0
+
+
+def test_prefiltered_sub_without_subsets(monkeypatch):
+    # Once PREFILTER_SUBSETS regexes have been compiled, the whole regex is used
+    monkeypatch.setattr(mrx, 'PREFILTER_SUBSETS', 2)
+    instance = mrx.PlaceNamesUS()
+    strings = get_strings(mrx.PlaceNamesUS.regexes[:20])
+    for s in strings:
+        assert instance.sub(s) == instance._rx.sub(instance._sub_groups, s), s
+    assert len(instance._subsets) <= 2
+
+
+def sample_strings():
+    """Function to get the strings in the subfields of the synthetic records."""
+    strings = []
+    for marc in sample_records(20):
+        for field in Record(marc).fields:
+            strings.extend([field.data] if field.is_control_field() else [value for code, value in field])
+    return strings
+
+
+def test_prefilter_counts_threads():
+    instance = mrx.PlaceNamesUS()
+    strings = (get_strings(mrx.PlaceNamesUS.regexes[:10]) + ['xyz']) * 20
+    with ThreadPool(8) as pool:
+        pool.map(instance.sub, strings, chunksize=1)
+    assert instance.hits + instance.misses == len(strings)
+    assert instance.hits > 0 and instance.misses >= 20
@@ -0,0 +1,74 @@
+# -*- coding: utf8 -*-
+
+"""Tests for NIDIndex, which links Newspaper records to digitised resources for profile N."""
+
+# Import required modules
+import pytest
+
+# Import required functions
+from marc2rf.main import *
+from marc_samples import encode_marc, write_marc_file
+
+BNA = 'http://www.britishnewspaperarchive.co.uk/titles/'
+
+
+def newspaper_fields(n, nid, shelfmark=True, url=True):
+    fields = [('001', '{:09d}'.format(n + 1)), ('245', '00', [('a', 'The Daily News {}'.format(n))]),
+              ('944', '  ', [('a', 'NID {}'.format(nid))])]
+    if shelfmark: fields.append(('852', '  ', [('j', 'MFM.MLD{}'.format(n))]))
+    if url: fields.append(('856', '40', [('u', BNA + str(n))]))
+    return fields
+
+
+@pytest.fixture
+def marc_path(tmp_path):
+    # Records with and without shelfmarks (which the profile N prefilter rejects), with and without URLs
+    fields = [newspaper_fields(0, 1), newspaper_fields(1, 1, shelfmark=False), newspaper_fields(2, 2),
+              newspaper_fields(3, 2, url=False), newspaper_fields(4, 3, shelfmark=False),
+              [('001', '000000006'), ('245', '00', [('a', 'Other')])]]
+    return write_marc_file(str(tmp_path / 'records.lex'), [encode_marc(f) for f in fields])
+
+
+def read_indexed(marc_path, nid_index, prefilter):
+    reader = MARCReader(open(marc_path, 'rb'), prefilter=nid_index.filter(prefilter))
+    ids = [record['001'].data for record in nid_index.index_records(reader)]
+    reader.close()
+    return ids
+
+
+def test_index(marc_path):
+    nid_index = NIDIndex()
+    prefilter = RecordFilter(has_tag('001'), has_tag('852', '979', '880'))
+    assert read_indexed(marc_path, nid_index, prefilter) == ['000000001', '000000003', '000000004']
+    assert nid_index.get('1') == {BNA + '0', BNA + '1'}
+    assert nid_index.get('2') == {BNA + '2'}
+    assert nid_index.get('3') == {BNA + '4'}
+    assert nid_index.get('4') == set()
+    assert nid_index.summary()['records'] == 4
+    nid_index.close()
+
+
+def test_records_decoded_once(marc_path, monkeypatch):
+    decoded = []
+    decode_marc = Record.decode_marc
+
+    def counting_decode_marc(record, marc):
+        decoded.append(get_control_number(marc))
+        return decode_marc(record, marc)
+
+    monkeypatch.setattr(Record, 'decode_marc', counting_decode_marc)
+    nid_index = NIDIndex()
+    read_indexed(marc_path, nid_index, RecordFilter(has_tag('001'), has_tag('852', '979', '880')))
+    # Records accepted by the prefilter are decoded by the reader only,
+    # and records rejected by it are decoded only if they need to be indexed
+    assert sorted(decoded) == ['000000001', '000000002', '000000003', '000000004', '000000005']
+    nid_index.close()
+
+
+def test_spill(marc_path):
+    nid_index = NIDIndex(memory_limit=0)
+    read_indexed(marc_path, nid_index, None)
+    assert nid_index.spills > 0
+    assert nid_index.get('1') == {BNA + '0', BNA + '1'}
+    assert nid_index.summary()['nids'] == 3
+    nid_index.close()
@@ -0,0 +1,48 @@
+# -*- coding: utf8 -*-
+
+"""Tests for the Publishers class."""
+
+# Import required modules
+import pytest
+
+# Import required functions
+import marc2rf.publisher as publisher
+from regex_samples import get_strings
+
+# Regexes in Publishers are anchored to the start of the string, so fewer contexts are needed
+CONTEXTS = ['{}', 'the {}']
+
+
+@pytest.fixture(scope='module')
+def strings():
+    return get_strings(publisher.Publishers.regexes, 6, CONTEXTS)
+
+
+def test_dispatch(strings):
+    instance = publisher.Publishers.shared()
+    matched = set()
+    for s in strings:
+        for mo in instance._rx.finditer(s):
+            assert instance._sub(mo) == instance._sub_groups(mo), (s, mo.lastgroup)
+            matched.add(mo.lastgroup)
+    assert len(matched) >= len(instance._rx.groupindex) * 3 // 4
+    assert any('UUU' in k for k in matched)
+
+
+def test_partitions_equivalent(strings):
+    instance = publisher.Publishers.shared()
+    keys = set(instance._leading) - {None}
+    strings = strings[::4] + [s.upper() for s in strings[1::8]] + [s.title() for s in strings[2::8]]
+    # Strings starting with each key which match no anchored regex, and strings starting with other characters:
+    # punctuation and spaces, and non-ASCII letters, including some which match ASCII letters when case is ignored
+    strings += ['{}zzz xyz'.format(key) for key in sorted(keys)] + ['{}Zzz'.format(key.upper()) for key in sorted(keys)]
+    strings += [c + s for c in ['"', '[', '(', '-', ' ', '.', '&', '*'] for s in strings[:400:13]]
+    strings += ['Éditions Gallimard', 'Ölander & Co.', 'Ñandú', 'ſtationers company', 'Kegan Paul',
+                'İstanbul University Press', 'Ārchive', 'Σύλλογος', 'ßchulbuch']
+    assert keys <= set(s[0].lower() for s in strings)
+    for s in strings:
+        assert instance.sub(s) == instance._rx.sub(instance._sub_groups, s), s
+    # The partition for every key has been used, as have the catch-all and the whole regex
+    assert keys <= set(c.lower() for c in instance._partitions)
+    assert None in instance._compiled
+    assert any(ord(c) >= 128 for c in instance._partitions)
@@ -0,0 +1,106 @@
+# -*- coding: utf8 -*-
+
+"""Tests for RecordIndex and seeking in MARCReader."""
+
+# Import required modules
+import os
+import pytest
+
+# Import required functions
+from marc2rf.marc_data import *
+from marc_samples import encode_marc, sample_fields, sample_records, write_marc_file
+
+
+@pytest.fixture
+def marc_path(tmp_path):
+    return write_marc_file(str(tmp_path / 'records.lex'), sample_records(20))
+
+
+def read_ids(reader):
+    ids = [record['001'].data for record in reader]
+    reader.close()
+    return ids
+
+
+def test_round_trip(marc_path):
+    index = RecordIndex(marc_path)
+    index.build()
+    index.save()
+    loaded = RecordIndex(marc_path).load()
+    assert len(loaded) == len(index) == 20
+    assert list(loaded.offsets) == list(index.offsets)
+    assert loaded.file_size == os.path.getsize(marc_path)
+    assert [loaded.record_id(n) for n in range(20)] == ['{:09d}'.format(n + 1) for n in range(20)]
+
+
+@pytest.mark.parametrize('memory_map', [False, True])
+def test_seek_record(marc_path, memory_map):
+    index = RecordIndex(marc_path)
+    index.build()
+    reader = MARCReader(open(marc_path, 'rb'), memory_map=memory_map)
+    reader.seek_record(index, 5, 3)
+    assert read_ids(reader) == ['000000006', '000000007', '000000008']
+    reader = MARCReader(open(marc_path, 'rb'), memory_map=memory_map)
+    reader.seek_record(index, 18)
+    assert read_ids(reader) == ['000000019', '000000020']
+    reader = MARCReader(open(marc_path, 'rb'), memory_map=memory_map)
+    reader.seek_record(index, 20)
+    assert read_ids(reader) == []
+
+
+def test_seek_id(marc_path):
+    index = RecordIndex(marc_path)
+    index.build()
+    reader = MARCReader(open(marc_path, 'rb'))
+    assert reader.seek_id(index, '000000012')
+    assert next(reader)['001'].data == '000000012'
+    assert not reader.seek_id(index, '999999999')
+    reader.close()
+
+
+def test_seek_byte_range(marc_path):
+    index = RecordIndex(marc_path)
+    index.build()
+    reader = MARCReader(open(marc_path, 'rb'))
+    reader.seek(*index.byte_range(2, 4))
+    assert read_ids(reader) == ['000000003', '000000004']
+    # A range ending part of the way through a record includes that record
+    reader = MARCReader(open(marc_path, 'rb'))
+    reader.seek(index.offset(10), index.offset(12) - 1)
+    assert read_ids(reader) == ['000000011', '000000012']
+
+
+def test_find_without_001(tmp_path):
+    fields = [sample_fields(0), [f for f in sample_fields(1) if f[0] != '001'], sample_fields(2)]
+    marc_path = write_marc_file(str(tmp_path / 'records.lex'), [encode_marc(f) for f in fields])
+    index = RecordIndex(marc_path)
+    index.build()
+    assert index.record_id(1) == ''
+    assert index.find('') is None
+    assert index.find('000000003') == 2
+
+
+def test_stale_index_size(marc_path):
+    index = RecordIndex(marc_path)
+    index.build()
+    index.save()
+    with open(marc_path, 'ab') as f: f.write(sample_records(1, 20)[0])
+    with pytest.raises(RecordIndexError): RecordIndex(marc_path).load()
+
+
+def test_stale_index_same_size(marc_path):
+    index = RecordIndex(marc_path)
+    index.build()
+    index.save()
+    # Rewrite the file with the same records in reverse order, which moves them but keeps the size
+    size, mtime = os.path.getsize(marc_path), os.stat(marc_path).st_mtime_ns
+    write_marc_file(marc_path, sample_records(20)[::-1])
+    assert os.path.getsize(marc_path) == size
+    os.utime(marc_path, ns=(mtime + 10 ** 9, mtime + 10 ** 9))
+    with pytest.raises(RecordIndexError): RecordIndex(marc_path).load()
+
+
+def test_invalid_index(marc_path):
+    with pytest.raises(RecordIndexError): RecordIndex(marc_path).load()
+    with open(marc_path + INDEX_EXT, 'wb') as f: f.write(b'not an index')
+    with pytest.raises(RecordIndexError): RecordIndex(marc_path).load()